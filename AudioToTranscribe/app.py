@@ -1,10 +1,15 @@
+import argparse
 import boto3
 import logging
 import time
 import os
 import requests
 import json
+from datetime import datetime, timezone
 from botocore.exceptions import BotoCoreError, ClientError
+from chunked_transcribe import ChunkedTranscriber, TranscribeEngine
+from transcript_format import (format_transcript, iter_cues, iter_items, write_webvtt, write_webvtt_segments,
+                               vtt_segment_metadata)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(levelname)s: %(message)s')
@@ -55,35 +60,67 @@ def check_transcription(job_name):
         return None
 
 def download_and_parse_transcript(transcript_url):
-    response = requests.get(transcript_url)
-    transcript = response.json()
-    speaker_labels = {'spk_0': 'X', 'spk_1': 'Y'}
-    formatted_transcript = ""
-    current_speaker = None
-    transcript_part = ""
+    # streamed, the transcript JSON of a long recording is never held in memory as a whole
+    with requests.get(transcript_url, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return format_transcript(iter_items(response.raw))
 
-    for item in transcript['results']['items']:
-        if 'speaker_label' in item:
-            speaker = speaker_labels[item['speaker_label']]
-            if current_speaker and speaker != current_speaker:
-                formatted_transcript += f"{current_speaker}: {transcript_part.strip()}\n"
-                transcript_part = item['alternatives'][0]['content'] + " "
-            else:
-                transcript_part += item['alternatives'][0]['content'] + " "
-            current_speaker = speaker
-
-    # Add last part if there's any remaining
-    if transcript_part:
-        formatted_transcript += f"{current_speaker}: {transcript_part.strip()}"
+def parse_transcript(transcript):
+    return format_transcript(transcript['results']['items'])
 
-    return formatted_transcript
+def publish_hls_subtitles(items, segments_dir, language, recording_start, api_base_url=None):
+    '''Writes the transcript as the subtitle segments of `language` and registers them with hls-server'''
+    out_dir = os.path.join(segments_dir, language)
+    segments = write_webvtt_segments(iter_cues(items), out_dir, timestamp=recording_start.strftime('%H%M%S'))
+    logging.info(f"Wrote {len(segments)} subtitle segments to {out_dir}")
+    if not api_base_url:
+        return segments
+    try:
+        response = requests.post(f"{api_base_url}/add_vttmetadata_batch",
+                                 json={"language": language,
+                                       "segments": vtt_segment_metadata(segments, recording_start)},
+                                 timeout=30)
+        response.raise_for_status()
+        logging.info(f"Registered {len(segments)} subtitle segments of {language}")
+    except requests.RequestException as e:
+        logging.error(f"Failed to register the subtitle segments of {language}: {str(e)}")
+    return segments
 
 def main():
+    parser = argparse.ArgumentParser(description="Transcribe a recording with Amazon Transcribe")
+    parser.add_argument("--single-job", action="store_true",
+                        help="one Transcribe job for the whole file instead of parallel chunks")
+    parser.add_argument("--hls-segments-dir",
+                        help="also write HLS subtitle segments under <dir>/<language>, e.g. hls_data")
+    parser.add_argument("--language", default="hin", help="subtitle track of the HLS segments")
+    parser.add_argument("--recording-start", type=datetime.fromisoformat,
+                        help="UTC start of the recording (ISO 8601), the time of subtitle segment 0")
+    parser.add_argument("--api-base-url", help="hls-server to register the HLS subtitle segments with")
+    args = parser.parse_args()
+
     print("Current Working Directory:", os.getcwd())
     # Building the file path in a portable way:
     file_name = os.path.join(os.getcwd(), 'example.m4a')
     bucket_name = 'poc.audiotranscribe'  # Update with your bucket name
-    job_name = 'exampleTranscribeJob_03'  # Choose a unique name for the transcription job
+    # Transcribe job names must be unique, a fixed name fails with ConflictException on the next run
+    job_name = f"exampleTranscribeJob_{time.strftime('%Y%m%d-%H%M%S')}"
+
+    if not args.single_job:
+        engine = TranscribeEngine(s3_client, transcribe_client, bucket_name, job_name)
+        transcriber = ChunkedTranscriber(engine, chunk_seconds=300, overlap_seconds=5, max_workers=8)
+        try:
+            result = transcriber.transcribe(file_name)
+            print("Formatted Transcript:\n", parse_transcript(result))
+            with open('transcript.vtt', 'w') as vtt_file:
+                write_webvtt(iter_cues(result['results']['items']), vtt_file)
+            if args.hls_segments_dir:
+                recording_start = (args.recording_start or datetime.now(timezone.utc)).replace(tzinfo=None)
+                publish_hls_subtitles(result['results']['items'], args.hls_segments_dir, args.language,
+                                      recording_start, args.api_base_url)
+        except Exception as e:
+            logging.error(f"Chunked transcription failed: {str(e)}")
+        return
 
     #if upload_file_to_s3(file_name, bucket_name):
     if True:
@@ -0,0 +1,242 @@
+import concurrent.futures
+import logging
+import os
+import subprocess
+import time
+from collections import Counter
+
+import requests
+
+'''
+    Chunked, parallel transcription
+
+    A long recording is cut into overlapping chunks which are transcribed
+    concurrently (bounded by max_workers) and stitched back together:
+      - item timestamps are shifted by the chunk start,
+      - in the overlap of two chunks the words before the middle of the
+        overlap are taken from the first chunk and the rest from the second,
+      - speaker labels are local to a chunk, they are mapped onto the labels
+        of the previous chunk by voting over the words both chunks recognised
+        in their overlap; a speaker not heard before gets a new label (so a
+        speaker silent during an overlap is counted twice, a longer overlap
+        reduces that).
+    The result has the shape of an Amazon Transcribe result
+    ({"results": {"items": [...]}}) so the same formatter works on both.
+
+    The speech-to-text engine is pluggable, anything with a
+    transcribe(chunk_path, chunk) method returning a Transcribe shaped
+    result can be used. An engine which leaves something behind per chunk
+    (uploads, jobs) also has a cleanup(chunk_path, chunk) method, it is
+    called once the chunk is transcribed or has failed, and the cut chunk
+    file is deleted then as well.
+'''
+
+# a word of two chunks is the same word if it starts within this many seconds
+ALIGN_TOLERANCE = 0.3
+
+
+class Chunk:
+    __slots__ = ('index', 'start', 'end')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Chunk({self.index}, {self.start}, {self.end})"
+
+
+def plan_chunks(duration, chunk_seconds=300, overlap_seconds=5):
+    if chunk_seconds <= overlap_seconds:
+        raise ValueError("chunk_seconds must be longer than overlap_seconds")
+    chunks = []
+    start = 0.0
+    while True:
+        end = min(start + chunk_seconds, duration)
+        chunks.append(Chunk(len(chunks), start, end))
+        if end >= duration:
+            return chunks
+        start = end - overlap_seconds
+
+
+def probe_duration(audio_file):
+    result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                             '-of', 'default=noprint_wrappers=1:nokey=1', audio_file],
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+
+def cut_chunk(audio_file, chunk, work_dir):
+    '''Cuts the chunk without re-encoding, the AAC frames are copied as they are'''
+    base, extension = os.path.splitext(os.path.basename(audio_file))
+    chunk_path = os.path.join(work_dir, f"{base}_chunk{chunk.index:04d}{extension}")
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-ss', str(chunk.start), '-i', audio_file,
+                    '-t', str(chunk.end - chunk.start), '-c', 'copy', chunk_path], check=True)
+    return chunk_path
+
+
+class TranscribeEngine:
+    '''Amazon Transcribe, one job per chunk'''
+    def __init__(self, s3_client, transcribe_client, bucket_name, job_prefix,
+                 language_code='hi-IN', media_format='m4a', max_speakers=10, poll_interval=5):
+        self.s3 = s3_client
+        self.transcribe_client = transcribe_client
+        self.bucket_name = bucket_name
+        self.job_prefix = job_prefix
+        self.language_code = language_code
+        self.media_format = media_format
+        self.max_speakers = max_speakers
+        self.poll_interval = poll_interval
+
+    def job_name(self, chunk):
+        return f"{self.job_prefix}_{chunk.index:04d}"
+
+    def transcribe(self, chunk_path, chunk):
+        key = os.path.basename(chunk_path)
+        job_name = self.job_name(chunk)
+        self.s3.upload_file(chunk_path, self.bucket_name, key)
+        self.transcribe_client.start_transcription_job(
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': f"s3://{self.bucket_name}/{key}"},
+            MediaFormat=self.media_format,
+            LanguageCode=self.language_code,
+            Settings={'ShowSpeakerLabels': True, 'MaxSpeakerLabels': self.max_speakers}
+        )
+        while True:
+            job = self.transcribe_client.get_transcription_job(TranscriptionJobName=job_name)['TranscriptionJob']
+            if job['TranscriptionJobStatus'] == 'COMPLETED':
+                break
+            if job['TranscriptionJobStatus'] == 'FAILED':
+                raise RuntimeError(f"Transcription job {job_name} failed: {job.get('FailureReason')}")
+            time.sleep(self.poll_interval)
+        response = requests.get(job['Transcript']['TranscriptFileUri'])
+        response.raise_for_status()
+        return response.json()
+
+    def cleanup(self, chunk_path, chunk):
+        '''Deletes the uploaded chunk and its job, either may not exist if the chunk failed early'''
+        key = os.path.basename(chunk_path)
+        try:
+            self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            logging.warning(f"Could not delete s3://{self.bucket_name}/{key}: {e}")
+        try:
+            self.transcribe_client.delete_transcription_job(TranscriptionJobName=self.job_name(chunk))
+        except Exception as e:
+            logging.warning(f"Could not delete transcription job {self.job_name(chunk)}: {e}")
+
+
+def shifted_items(result, chunk):
+    '''Items of a chunk result with absolute times, punctuation takes the time of the word before it'''
+    items = []
+    last_time = chunk.start
+    for item in result['results']['items']:
+        item = dict(item)
+        if 'start_time' in item:
+            last_time = float(item['start_time']) + chunk.start
+            item['start_time'] = f"{last_time:.3f}"
+            item['end_time'] = f"{float(item['end_time']) + chunk.start:.3f}"
+        items.append((last_time, item))
+    return items
+
+
+def speaker_mapping(previous, current, overlap_start, overlap_end, next_label):
+    '''Maps the local speaker labels of `current` onto the labels already used in `previous`'''
+    votes = Counter()
+    words = [(t, i) for t, i in previous if overlap_start <= t <= overlap_end and 'speaker_label' in i]
+    for time_, item in current:
+        if time_ > overlap_end or 'speaker_label' not in item or item.get('type') == 'punctuation':
+            continue
+        content = item['alternatives'][0]['content']
+        for previous_time, previous_item in words:
+            if abs(previous_time - time_) <= ALIGN_TOLERANCE and \
+                    previous_item['alternatives'][0]['content'] == content:
+                votes[(item['speaker_label'], previous_item['speaker_label'])] += 1
+                break
+
+    mapping = {}
+    used = set()
+    for (local, known), _ in votes.most_common():
+        if local not in mapping and known not in used:
+            mapping[local] = known
+            used.add(known)
+    for _, item in current:
+        local = item.get('speaker_label')
+        if local is not None and local not in mapping:
+            mapping[local] = f"spk_{next_label}"
+            next_label += 1
+    return mapping, next_label
+
+
+def stitch(chunks, results):
+    merged = []
+    previous = None
+    next_label = 0
+    for chunk, result in zip(chunks, results):
+        items = shifted_items(result, chunk)
+        if previous is None:
+            overlap_start = overlap_end = chunk.start
+        else:
+            overlap_start, overlap_end = chunk.start, previous_chunk.end
+        mapping, next_label = speaker_mapping(previous or [], items, overlap_start, overlap_end, next_label)
+
+        # the middle of the overlap is the cut, words are most reliable away from a chunk edge
+        cut = (overlap_start + overlap_end) / 2
+        if previous is not None:
+            while merged and merged[-1][0] >= cut:
+                merged.pop()
+        kept = []
+        for time_, item in items:
+            if previous is not None and time_ < cut:
+                continue
+            if 'speaker_label' in item:
+                item['speaker_label'] = mapping[item['speaker_label']]
+            kept.append((time_, item))
+        merged.extend(kept)
+        previous, previous_chunk = kept, chunk
+    return {'results': {'items': [item for _, item in merged]}}
+
+
+class ChunkedTranscriber:
+    def __init__(self, engine, chunk_seconds=300, overlap_seconds=5, max_workers=8,
+                 work_dir='chunks', cutter=cut_chunk):
+        self.engine = engine
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.max_workers = max_workers
+        self.work_dir = work_dir
+        self.cutter = cutter
+
+    def transcribe_chunk(self, audio_file, chunk):
+        chunk_path = self.cutter(audio_file, chunk, self.work_dir)
+        started = time.monotonic()
+        try:
+            result = self.engine.transcribe(chunk_path, chunk)
+        finally:
+            self.cleanup_chunk(audio_file, chunk_path, chunk)
+        logging.info(f"Chunk {chunk.index} ({chunk.start:.0f}s-{chunk.end:.0f}s) transcribed in "
+                     f"{time.monotonic() - started:.1f}s")
+        return result
+
+    def cleanup_chunk(self, audio_file, chunk_path, chunk):
+        cleanup = getattr(self.engine, 'cleanup', None)
+        if cleanup is not None:
+            cleanup(chunk_path, chunk)
+        # a cutter may hand back the recording itself when there is nothing to cut
+        if os.path.abspath(chunk_path) != os.path.abspath(audio_file):
+            try:
+                os.remove(chunk_path)
+            except FileNotFoundError:
+                pass
+
+    def transcribe(self, audio_file, duration=None):
+        if duration is None:
+            duration = probe_duration(audio_file)
+        os.makedirs(self.work_dir, exist_ok=True)
+        chunks = plan_chunks(duration, self.chunk_seconds, self.overlap_seconds)
+        logging.info(f"Transcribing {audio_file} ({duration:.0f}s) as {len(chunks)} chunks, "
+                     f"{self.max_workers} at a time")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda chunk: self.transcribe_chunk(audio_file, chunk), chunks))
+        return stitch(chunks, results)
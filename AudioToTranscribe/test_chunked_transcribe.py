@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from chunked_transcribe import ChunkedTranscriber, plan_chunks
+
+
+def recording(duration, speakers=3):
+    '''Ground truth of a conversation: one word every 0.7s, the speaker changes every 2 words'''
+    words = []
+    t = 0.2
+    while t < duration:
+        words.append((round(t, 3), f"w{len(words)}", f"S{(len(words) // 2) % speakers}"))
+        t += 0.7
+    return words
+
+
+class LocalEngine:
+    '''Stand-in for Transcribe: returns the words of the chunk, with chunk local times and speaker labels'''
+    def __init__(self, words, delay=0.05):
+        self.words = words
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.cleaned = []
+
+    def cleanup(self, chunk_path, chunk):
+        with self.lock:
+            self.cleaned.append((chunk.index, os.path.exists(chunk_path)))
+
+    def transcribe(self, chunk_path, chunk):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+
+        local_labels = {}
+        items = []
+        # every chunk numbers its speakers by first appearance, in reverse on odd chunks
+        for t, word, speaker in self.words:
+            if chunk.start <= t < chunk.end:
+                local_labels.setdefault(speaker, len(local_labels))
+                label = local_labels[speaker] if chunk.index % 2 == 0 else 10 - local_labels[speaker]
+                start = t - chunk.start
+                items.append({'start_time': f"{start:.3f}", 'end_time': f"{start + 0.5:.3f}",
+                              'alternatives': [{'content': word}], 'type': 'pronunciation',
+                              'speaker_label': f"spk_{label}"})
+                items.append({'alternatives': [{'content': ','}], 'type': 'punctuation',
+                              'speaker_label': f"spk_{label}"})
+        return {'results': {'items': items}}
+
+
+def test_plan_chunks_overlap():
+    chunks = plan_chunks(25, chunk_seconds=10, overlap_seconds=2)
+    assert [(c.start, c.end) for c in chunks] == [(0, 10), (8, 18), (16, 25)]
+
+
+def cut_empty_chunk(audio_file, chunk, work_dir):
+    chunk_path = os.path.join(work_dir, f"chunk{chunk.index:04d}.m4a")
+    open(chunk_path, 'wb').close()
+    return chunk_path
+
+
+def test_chunks_are_stitched_in_order_with_consistent_speakers(tmp_path):
+    words = recording(600)
+    engine = LocalEngine(words)
+    transcriber = ChunkedTranscriber(engine, chunk_seconds=60, overlap_seconds=5, max_workers=4,
+                                     work_dir=str(tmp_path), cutter=cut_empty_chunk)
+    started = time.monotonic()
+    result = transcriber.transcribe('recording.m4a', duration=600)
+    elapsed = time.monotonic() - started
+
+    pronounced = [i for i in result['results']['items'] if i['type'] == 'pronunciation']
+    assert [i['alternatives'][0]['content'] for i in pronounced] == [word for _, word, _ in words]
+    assert [round(float(i['start_time']), 3) for i in pronounced] == [t for t, _, _ in words]
+
+    # the global labels are a renaming of the true speakers, the same across every chunk
+    renaming = {}
+    for item, (_, _, speaker) in zip(pronounced, words):
+        assert renaming.setdefault(speaker, item['speaker_label']) == item['speaker_label']
+    assert len(set(renaming.values())) == 3
+
+    # 11 chunks, 4 at a time
+    assert engine.max_running == 4
+    assert elapsed < 11 * engine.delay
+
+    # every chunk was cleaned up after its result, nothing is left in the work dir
+    assert sorted(engine.cleaned) == [(index, True) for index in range(11)]
+    assert os.listdir(tmp_path) == []
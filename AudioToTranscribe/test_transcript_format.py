@@ -0,0 +1,60 @@
+import io
+import json
+from datetime import datetime
+
+from transcript_format import (format_transcript, iter_cues, iter_items, write_webvtt, write_webvtt_segments,
+                               vtt_segment_metadata)
+
+
+def word(content, start, end, speaker):
+    return {'start_time': str(start), 'end_time': str(end), 'type': 'pronunciation',
+            'alternatives': [{'content': content}], 'speaker_label': speaker}
+
+
+def punctuation(content, speaker):
+    return {'type': 'punctuation', 'alternatives': [{'content': content}], 'speaker_label': speaker}
+
+
+ITEMS = [
+    word('Hello', 0.0, 0.4, 'spk_0'), word('there', 0.5, 0.9, 'spk_0'), punctuation('.', 'spk_0'),
+    word('Hi', 1.0, 1.2, 'spk_1'), punctuation(',', 'spk_1'), word('all', 1.3, 1.6, 'spk_1'),
+    word('Morning', 2.0, 2.5, 'spk_2'),
+    word('Welcome', 7.0, 7.5, 'spk_0'),
+]
+
+
+def test_any_number_of_speakers():
+    source = io.BytesIO(json.dumps({'results': {'items': ITEMS}}).encode())
+    assert format_transcript(iter_items(source)) == "X: Hello there.\nY: Hi, all\nZ: Morning\nX: Welcome"
+    assert format_transcript(ITEMS, speaker_names={'spk_2': 'Host'}).splitlines()[2] == "Host: Morning"
+
+
+def test_webvtt_cues():
+    out = io.StringIO()
+    write_webvtt(iter_cues(ITEMS, max_cue_seconds=0.7), out)
+    assert out.getvalue().startswith(
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:00.400\n<v X>Hello\n\n"
+        "00:00:00.500 --> 00:00:00.900\n<v X>there.\n\n"
+        "00:00:01.000 --> 00:00:01.600\n<v Y>Hi, all\n\n")
+
+
+def test_webvtt_segments(tmp_path):
+    cues = [(0.0, 1.0, 'X', 'one'), (5.5, 6.5, 'Y', 'two'), (13.0, 14.0, 'X', 'three')]
+    segments = write_webvtt_segments(cues, tmp_path, segment_duration=6, timestamp='080950')
+    assert [name for _, name, _ in segments] == [f"playlist_webvtt_080950__{seq}.vtt" for seq in range(3)]
+
+    # a cue crossing the boundary is in both segments, the empty gap is still a segment
+    second = (tmp_path / 'playlist_webvtt_080950__1.vtt').read_text()
+    assert '<v Y>two' in second and 'three' not in second
+    assert '<v Y>two' in (tmp_path / 'playlist_webvtt_080950__0.vtt').read_text()
+    assert (tmp_path / 'playlist_webvtt.m3u8').read_text().endswith(
+        "#EXTINF:6,\nplaylist_webvtt_080950__2.vtt\n#EXT-X-ENDLIST\n")
+
+
+def test_webvtt_segments_are_registered_with_their_wall_clock(tmp_path):
+    segments = write_webvtt_segments(iter_cues(ITEMS), tmp_path / 'hin', timestamp='235954')
+    rows = vtt_segment_metadata(segments, datetime(2024, 7, 16, 23, 59, 54))
+    assert [(row['date'], row['start_timestamp'], row['sequence_number']) for row in rows] == [
+        ('2024-07-16', '23:59:54.000', 0), ('2024-07-17', '00:00:00.000', 1)]
+    assert (tmp_path / 'hin' / rows[1]['vtt_file']).read_text().count('<v X>Welcome') == 1
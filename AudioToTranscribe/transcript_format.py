@@ -0,0 +1,169 @@
+import json
+import os
+import string
+from datetime import timedelta
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+'''
+    Streaming transcript formatter
+
+    Works on the items of an Amazon Transcribe result one at a time, so a
+    multi hour transcript is never held as a whole: with ijson installed the
+    JSON is parsed incrementally from the stream, every text is accumulated
+    as a list of words and joined once.
+    The same items can be written as WebVTT, as one file or as the HLS
+    subtitle segments (playlist_webvtt_{timestamp}__{seq}.vtt) hls-server
+    serves from hls_data/<language> once they are registered with
+    /add_vttmetadata_batch (app.py --hls-segments-dir).
+'''
+
+# spk_0 -> X, spk_1 -> Y as the transcripts always had it, then Z, A, B, ...
+SPEAKER_ALPHABET = string.ascii_uppercase[23:] + string.ascii_uppercase[:23]
+
+
+def speaker_name(label):
+    if label is None:
+        return None
+    number = label.rsplit('_', 1)[-1]
+    if number.isdigit() and int(number) < len(SPEAKER_ALPHABET):
+        return SPEAKER_ALPHABET[int(number)]
+    return label
+
+
+def iter_items(source):
+    '''Items of a Transcribe result read from a binary file object'''
+    if ijson is not None:
+        yield from ijson.items(source, 'results.items.item')
+    else:
+        yield from json.load(source)['results']['items']
+
+
+def iter_words(items, speaker_names=None):
+    '''Yields (speaker, word, start, end), punctuation is glued to the word before it'''
+    speaker_names = speaker_names or {}
+    speaker = None
+    word = None
+    for item in items:
+        content = item['alternatives'][0]['content']
+        if item.get('type') == 'punctuation':
+            if word:
+                word[1] += content
+            continue
+        if word:
+            yield tuple(word)
+        label = item.get('speaker_label')
+        if label:
+            speaker = speaker_names.get(label) or speaker_name(label)
+        word = [speaker, content, float(item['start_time']), float(item['end_time'])]
+    if word:
+        yield tuple(word)
+
+
+def iter_turns(items, speaker_names=None):
+    '''Yields (speaker, start, end, words), one per change of speaker'''
+    current = None
+    start = end = None
+    words = []
+    for speaker, word, word_start, word_end in iter_words(items, speaker_names):
+        if words and speaker != current:
+            yield current, start, end, words
+            words = []
+        if not words:
+            current, start = speaker, word_start
+        end = word_end
+        words.append(word)
+    if words:
+        yield current, start, end, words
+
+
+def format_transcript(items, speaker_names=None):
+    return '\n'.join(f"{speaker}: {' '.join(words)}"
+                     for speaker, _, _, words in iter_turns(items, speaker_names))
+
+
+def iter_cues(items, speaker_names=None, max_cue_seconds=6.0, max_cue_chars=84):
+    '''Yields (start, end, speaker, text) cues, split at a change of speaker or at the cue limits'''
+    cue = []
+    length = 0
+    for speaker, word, start, end in iter_words(items, speaker_names):
+        if cue and (speaker != cue[0][0] or end - cue[0][2] > max_cue_seconds
+                    or length + len(word) > max_cue_chars):
+            yield cue[0][2], cue[-1][3], cue[0][0], ' '.join(w[1] for w in cue)
+            cue = []
+            length = 0
+        cue.append((speaker, word, start, end))
+        length += len(word) + 1
+    if cue:
+        yield cue[0][2], cue[-1][3], cue[0][0], ' '.join(w[1] for w in cue)
+
+
+def vtt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+
+def format_cue(start, end, speaker, text):
+    voice = f"<v {speaker}>" if speaker else ""
+    return f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}\n{voice}{text}\n\n"
+
+
+def write_webvtt(cues, out):
+    out.write("WEBVTT\n\n")
+    for cue in cues:
+        out.write(format_cue(*cue))
+
+
+def write_webvtt_segments(cues, out_dir, segment_duration=6, timestamp='000000', mpegts=0):
+    '''Writes the cues as HLS subtitle segments and their playlist_webvtt.m3u8.
+
+    A cue crossing a segment boundary is repeated in both segments, as the
+    HLS spec asks. Returns the (sequence_number, file_name, duration) of the
+    segments, an empty segment is still written so the track has no holes.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    header = f"WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:{mpegts},LOCAL:00:00:00.000\n\n"
+    segments = []
+    pending = []
+    sequence = 0
+
+    def flush():
+        nonlocal sequence, pending
+        start = sequence * segment_duration
+        end = start + segment_duration
+        name = f"playlist_webvtt_{timestamp}__{sequence}.vtt"
+        with open(os.path.join(out_dir, name), 'w') as segment:
+            segment.write(header)
+            segment.write(''.join(format_cue(*cue) for cue in pending if cue[0] < end))
+        segments.append((sequence, name, segment_duration))
+        pending = [cue for cue in pending if cue[1] > end]
+        sequence += 1
+
+    for cue in cues:
+        while cue[0] >= (sequence + 1) * segment_duration:
+            flush()
+        pending.append(cue)
+    while pending:
+        flush()
+
+    with open(os.path.join(out_dir, 'playlist_webvtt.m3u8'), 'w') as playlist:
+        playlist.write(f"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:{segment_duration}\n"
+                       f"#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
+        playlist.write(''.join(f"#EXTINF:{duration},\n{name}\n" for _, name, duration in segments))
+        playlist.write("#EXT-X-ENDLIST\n")
+    return segments
+
+
+def vtt_segment_metadata(segments, recording_start):
+    '''The /add_vttmetadata_batch rows of the segments of a recording started at recording_start (UTC)'''
+    rows = []
+    for sequence_number, name, duration in segments:
+        start = recording_start + timedelta(seconds=sequence_number * duration)
+        rows.append({'date': start.date().isoformat(), 'start_timestamp': start.strftime('%H:%M:%S.%f')[:-3],
+                     'sequence_number': sequence_number, 'duration': duration, 'vtt_file': name})
+    return rows
@@ -1,59 +1,169 @@
 import concurrent.futures
+import heapq
 import time
 from pathlib import Path
 import logging
 import requests
+import threading
 from urllib.parse import urljoin
-from collections import deque
+from collections import OrderedDict
 from utility import load_config, setup_logging, download_file, \
-    parse_master_manifest, store_manifestfile
+    download_file_to_pack, parse_master_manifest, store_manifestfile
+from segment_pack import SegmentPackWriter
 
 from datetime import datetime, timedelta
 
+# LL-HLS state shared by the playlist downloads:
+# playlist url -> (_HLS_msn, _HLS_part) of the next part, set when the origin can block reloads
+next_part_request = {}
+# part urls already ingested, parts are listed again on every reload of the playlist
+ingested_parts = OrderedDict()
+ingested_parts_lock = threading.Lock()
+INGESTED_PARTS_KEPT = 4096
+# parts download here, a reload returns without waiting for them and each part
+# is registered as soon as its own download finished
+part_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
 def download_and_update_manifest(playlists, subtitles, end_time, download_dir, thread_count,
     segment_timeout, sleep_interval, subtitle_manifest_name, storage_type, s3_config,
-    api_base_url):
-    task_queue = deque(playlists + subtitles)
+    api_base_url, pack_writer=None, captioning=None, low_latency=False):
+    '''
+        Every playlist is reloaded on its own cadence, as soon as its previous reload
+        finished and its delay passed, so a slow rendition does not hold back the others.
+        The delay is what download_playlist returns (the part target for LL-HLS,
+        none when the origin blocks the reload), sleep_interval otherwise.
+    '''
     executor = concurrent.futures.ThreadPoolExecutor(max_workers=thread_count)
+    tasks = playlists + subtitles
+    # (due time, task index), the next reload of every task
+    schedule = [(time.time(), index) for index in range(len(tasks))]
+    heapq.heapify(schedule)
+    schedule_changed = threading.Condition()
+
+    def reschedule(future, index):
+        try:
+            delay = future.result()
+        except Exception as e:
+            logging.error(f"Error reloading {tasks[index]}: {e}")
+            delay = None
+        with schedule_changed:
+            heapq.heappush(schedule, (time.time() + (sleep_interval if delay is None else delay), index))
+            schedule_changed.notify()
 
     while time.time() < end_time or end_time == -1:
-        futures = []
-        for _ in range(len(task_queue)):
-            task = task_queue.popleft()
-            if isinstance(task, tuple) and len(task) == 2:
-                if task in playlists:
-                    resolution, playlist_url = task
-                    futures.append(executor.submit(download_playlist, resolution,
-                        playlist_url, download_dir, segment_timeout, storage_type, s3_config, api_base_url))
-                elif task in subtitles:
-                    language, subtitle_url = task
-                    futures.append(executor.submit(download_subtitle_playlist,
-                        subtitle_url, download_dir, language, subtitle_manifest_name, segment_timeout, 
-                        storage_type, s3_config, api_base_url))
-            task_queue.append(task)
-
-        # Wait for all tasks to complete
-        concurrent.futures.wait(futures, timeout=segment_timeout)
-       
-        # Sleep only after completing one round of task submissions
-        time.sleep(sleep_interval)
-
-def call_add_tsmetadata(metadata, api_base_url):
-    fastapi_url = f"{api_base_url}/add_tsmetadata"
+        with schedule_changed:
+            wait = schedule[0][0] - time.time() if schedule else sleep_interval
+            if wait > 0:
+                schedule_changed.wait(wait)
+                continue
+            _, index = heapq.heappop(schedule)
+
+        task = tasks[index]
+        if task in playlists:
+            resolution, playlist_url = task
+            future = executor.submit(download_playlist, resolution,
+                playlist_url, download_dir, segment_timeout, storage_type, s3_config, api_base_url,
+                pack_writer, captioning, low_latency)
+        else:
+            language, subtitle_url = task
+            future = executor.submit(download_subtitle_playlist,
+                subtitle_url, download_dir, language, subtitle_manifest_name, segment_timeout,
+                storage_type, s3_config, api_base_url, pack_writer)
+        future.add_done_callback(lambda future, index=index: reschedule(future, index))
+
+def call_add_tsmetadata_batch(resolution, segments, api_base_url):
+    fastapi_url = f"{api_base_url}/add_tsmetadata_batch"
     try:
-        response = requests.post(fastapi_url, json=metadata)
+        response = requests.post(fastapi_url, json={"resolution": resolution, "segments": segments})
         response.raise_for_status()
-        logging.info(f"Successfully added metadata: {metadata}")
+        logging.info(f"Successfully added metadata of {len(segments)} segments of {resolution}")
     except requests.RequestException as e:
         logging.error(f"Failed to add TS metadata: {e}")
 
+def stored_segments(registrations):
+    ''' The metadata of the (download future, metadata) pairs whose segment was stored, with its size '''
+    segments = []
+    for download_future, metadata in registrations:
+        try:
+            size = download_future.result()
+        except Exception:
+            size = None
+        if size is None:
+            # not stored, the segment is not listed until a later reload downloads it
+            continue
+        # hls-server derives the measured bitrate of the rendition from it
+        segments.append(dict(metadata, size=size))
+    return segments
+
+def call_add_tspart(metadata, api_base_url):
+    try:
+        response = requests.post(f"{api_base_url}/add_tspart", json=metadata)
+        response.raise_for_status()
+        logging.debug(f"Successfully added TS part: {metadata}")
+    except requests.RequestException as e:
+        logging.error(f"Failed to add TS part: {e}")
+
+def parse_part(line):
+    # #EXT-X-PART:DURATION=1.001,URI="part_837223.2.ts",INDEPENDENT=YES
+    attributes = dict(attr.split('=', 1) for attr in line.split(':', 1)[1].split(','))
+    return (float(attributes['DURATION']), attributes['URI'].strip('"'),
+        attributes.get('INDEPENDENT') == 'YES')
+
+def is_new_part(part_url):
+    with ingested_parts_lock:
+        if part_url in ingested_parts:
+            return False
+        ingested_parts[part_url] = True
+        if len(ingested_parts) > INGESTED_PARTS_KEPT:
+            ingested_parts.popitem(last=False)
+        return True
+
+def forget_part(part_url):
+    with ingested_parts_lock:
+        ingested_parts.pop(part_url, None)
+
+def ingest_parts(executor, parts, sequence_number, resolution, playlist_url, download_dir,
+    segment_timeout, storage_type, s3_config, api_base_url):
+    ''' Downloads the new parts of a segment, each is registered once it is stored '''
+    for part_index, (duration, uri, independent) in enumerate(parts):
+        part_url = urljoin(playlist_url, uri)
+        if not is_new_part(part_url):
+            continue
+        part_file = uri.rsplit('/', 1)[-1].split('?')[0]
+        metadata = {
+            "resolution": resolution,
+            "sequence_number": sequence_number,
+            "part_index": part_index,
+            "duration": duration,
+            "part_file": part_file,
+            "independent": independent
+        }
+        future = executor.submit(download_file, part_url, Path(download_dir) / resolution / part_file,
+            segment_timeout, storage_type, s3_config)
+        # a part is only announced once it is stored, a failed one is retried on the next reload
+        future.add_done_callback(lambda future, metadata=metadata, part_url=part_url:
+            call_add_tspart(metadata, api_base_url) if future.result() is not None else forget_part(part_url))
+
+def call_caption_segment(metadata, caption_url):
+    try:
+        response = requests.post(f"{caption_url}/caption_segment", json=metadata, timeout=5)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logging.error(f"Failed to queue segment for captioning: {e}")
+
 def adjust_datetime(start_time, duration):
     adjusted_time = start_time + timedelta(seconds=duration)
     return adjusted_time
 
-def download_playlist(resolution, playlist_url, download_dir, segment_timeout, storage_type, s3_config, api_base_url):
+def download_playlist(resolution, playlist_url, download_dir, segment_timeout, storage_type, s3_config, api_base_url,
+    pack_writer=None, captioning=None, low_latency=False):
     try:
-        response = requests.get(playlist_url, timeout=segment_timeout)
+        # a blocking reload returns as soon as the origin has the next part, no polling delay
+        params = None
+        if low_latency and playlist_url in next_part_request:
+            msn, part = next_part_request[playlist_url]
+            params = {"_HLS_msn": msn, "_HLS_part": part}
+        response = requests.get(playlist_url, params=params, timeout=segment_timeout)
         response.raise_for_status()
         playlist_content = response.text
 
@@ -62,26 +172,58 @@ def download_playlist(resolution, playlist_url, download_dir, segment_timeout, s
 
         lines = playlist_content.splitlines()
         download_tasks = []
+        registrations = []
 
         start_time = None
+        # LL-HLS parts precede the segment they belong to, the ones after the last segment
+        # belong to the segment being produced. Parts are not packed, only plain files.
+        ingest_ll_parts = low_latency and pack_writer is None
+        parts = []
+        media_sequence = 0
+        last_sequence_number = None
+        can_block_reload = False
+        part_target = None
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
             for i, line in enumerate(lines):
-                if line.startswith('#EXTINF'):
+                if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                    media_sequence = int(line.split(':', 1)[1])
+                elif line.startswith('#EXT-X-SERVER-CONTROL:'):
+                    can_block_reload = 'CAN-BLOCK-RELOAD=YES' in line
+                elif line.startswith('#EXT-X-PART-INF:'):
+                    part_target = float(line.split('PART-TARGET=', 1)[1].split(',')[0])
+                elif line.startswith('#EXT-X-PART:'):
+                    parts.append(parse_part(line))
+                elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+                    # an explicit program date time re-anchors the segment which follows it
+                    start_time = datetime.fromisoformat(line.split(':', 1)[1].rstrip('Z'))
+                elif line.startswith('#EXTINF'):
                     duration = float(line.split(':')[1].strip(','))
                     segment_line = lines[i + 1] if (i + 1) < len(lines) else ""
 
                     segment_url = urljoin(playlist_url, segment_line)
-                    save_path = Path(download_dir) / resolution / segment_line
-                    download_tasks.append(executor.submit(download_file, segment_url, save_path, segment_timeout, storage_type, s3_config))
 
                     # Extract sequence number from segment file name
                     sequence_number = int(segment_line.split('__')[-1].split('.')[0])
+                    last_sequence_number = sequence_number
+
+                    if ingest_ll_parts and parts:
+                        ingest_parts(part_executor, parts, sequence_number, resolution, playlist_url,
+                            download_dir, segment_timeout, storage_type, s3_config, api_base_url)
+                    parts = []
+
+                    if pack_writer:
+                        download_future = executor.submit(download_file_to_pack, segment_url,
+                            pack_writer, resolution, sequence_number, segment_timeout)
+                    else:
+                        save_path = Path(download_dir) / resolution / segment_line
+                        download_future = executor.submit(download_file, segment_url, save_path, segment_timeout, storage_type, s3_config)
+                    download_tasks.append(download_future)
 
                     # Extract or calculate the start time
                     if start_time is None:
                         if any('#EXT-X-PROGRAM-DATE-TIME' in l for l in lines):
-                            start_time_str = next(l.split(':')[1] for l in lines if '#EXT-X-PROGRAM-DATE-TIME' in l)
+                            start_time_str = next(l.split(':', 1)[1] for l in lines if '#EXT-X-PROGRAM-DATE-TIME' in l)
                             start_time = datetime.fromisoformat(start_time_str.rstrip('Z'))
                         else:
                             # Fallback to current time if no program date time is provided
@@ -97,34 +239,63 @@ def download_playlist(resolution, playlist_url, download_dir, segment_timeout, s
                         "ts_file": segment_line
                     }
                    
-                    # Call the FastAPI endpoint to add TS metadata
-                    executor.submit(call_add_tsmetadata, metadata, api_base_url)
+                    # Registered with the rest of the reload once the download is done, so
+                    # a listed segment is on disk and its byte size is known
+                    registrations.append((download_future, metadata))
+
+                    # The live captioning stage reads the segment from disk, so it is told once the download succeeded
+                    if captioning and resolution == captioning['source_resolution']:
+                        download_future.add_done_callback(lambda future, metadata=metadata:
+                            call_caption_segment(metadata, captioning['api_url'])
+                            if not future.exception() and future.result() is not None else None)
                    
                     # Increment start time by the duration of the segment
                     start_time = adjust_datetime(start_time, duration)
 
+            if ingest_ll_parts:
+                pending_sequence_number = last_sequence_number + 1 if last_sequence_number is not None else media_sequence
+                if parts:
+                    ingest_parts(part_executor, parts, pending_sequence_number, resolution, playlist_url,
+                        download_dir, segment_timeout, storage_type, s3_config, api_base_url)
+                if can_block_reload:
+                    next_part_request[playlist_url] = (pending_sequence_number, len(parts))
+                else:
+                    next_part_request.pop(playlist_url, None)
+
             for future in concurrent.futures.as_completed(download_tasks):
                 try:
                     future.result()
                 except Exception as e:
                     logging.error(f"Error in downloading segment: {e}")
 
+            # One request registers every segment of this reload under one lock of the index
+            segments = stored_segments(registrations)
+            if segments:
+                call_add_tsmetadata_batch(resolution, segments, api_base_url)
+
+        # Seconds until the next reload: a blocking reload is issued right away, the
+        # origin holds it until the next part, otherwise parts are polled at their cadence
+        if ingest_ll_parts and can_block_reload:
+            return 0
+        if ingest_ll_parts and part_target:
+            return part_target
     except requests.RequestException as e:
         logging.error(f"Failed to download playlist: {playlist_url}, error: {e}")
     except Exception as e:
         logging.error(f"Unexpected error processing playlist {playlist_url}: {e}")
+    return None
         
-def call_add_vttmetadata(metadata, api_base_url):
-    fastapi_url = f"{api_base_url}/add_vttmetadata"
+def call_add_vttmetadata_batch(language, segments, api_base_url):
+    fastapi_url = f"{api_base_url}/add_vttmetadata_batch"
     try:
-        response = requests.post(fastapi_url, json=metadata)
+        response = requests.post(fastapi_url, json={"language": language, "segments": segments})
         response.raise_for_status()
-        logging.info(f"Successfully added VTT metadata: {metadata}")
+        logging.info(f"Successfully added VTT metadata of {len(segments)} segments of {language}")
     except requests.RequestException as e:
         logging.error(f"Failed to add VTT metadata: {e}")
 
 def download_subtitle_playlist(subtitle_url, download_dir, language, 
-    subtitle_manifest_name, timeout, storage_type, s3_config, api_base_url):
+    subtitle_manifest_name, timeout, storage_type, s3_config, api_base_url, pack_writer=None):
     try:
         subtitle_playlist_path = Path(download_dir) / language / subtitle_manifest_name
         response = requests.get(subtitle_url, timeout=timeout)
@@ -136,26 +307,36 @@ def download_subtitle_playlist(subtitle_url, download_dir, language,
 
         lines = subtitle_content.splitlines()
         download_tasks = []
+        registrations = []
         start_time = None
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
             for i, line in enumerate(lines):
-                if line.startswith('#EXTINF'):
+                if line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+                    # an explicit program date time re-anchors the segment which follows it
+                    start_time = datetime.fromisoformat(line.split(':', 1)[1].rstrip('Z'))
+                elif line.startswith('#EXTINF'):
                     duration = float(line.split(':')[1].strip(','))
                    
                     segment_line = lines[i + 1] if (i + 1) < len(lines) else ""
                     subtitle_segment_url = urljoin(subtitle_url, segment_line)
-                    save_path = Path(download_dir) / language / segment_line
-                    download_tasks.append(executor.submit(download_file, 
-                        subtitle_segment_url, save_path, timeout, storage_type, s3_config))
 
                     # Extract sequence number from segment file name
                     sequence_number = int(segment_line.split('__')[-1].split('.')[0])
 
+                    if pack_writer:
+                        download_future = executor.submit(download_file_to_pack,
+                            subtitle_segment_url, pack_writer, language, sequence_number, timeout)
+                    else:
+                        save_path = Path(download_dir) / language / segment_line
+                        download_future = executor.submit(download_file, 
+                            subtitle_segment_url, save_path, timeout, storage_type, s3_config)
+                    download_tasks.append(download_future)
+
                     # Extract or calculate the start time
                     if start_time is None:
                         if any('#EXT-X-PROGRAM-DATE-TIME' in l for l in lines):
-                            start_time_str = next(l.split(':')[1] for l in lines if '#EXT-X-PROGRAM-DATE-TIME' in l)
+                            start_time_str = next(l.split(':', 1)[1] for l in lines if '#EXT-X-PROGRAM-DATE-TIME' in l)
                             start_time = datetime.fromisoformat(start_time_str.rstrip('Z'))
                         else:
                             # Fallback to current time if no program date time is provided                            
@@ -171,8 +352,8 @@ def download_subtitle_playlist(subtitle_url, download_dir, language,
                         "vtt_file": segment_line
                     }
                    
-                    # Call the FastAPI endpoint to add VTT metadata
-                    executor.submit(call_add_vttmetadata, metadata, api_base_url)
+                    # Registered with the rest of the reload once the download is done
+                    registrations.append((download_future, metadata))
                    
                     # Increment start time by the duration of the segment
                     start_time = adjust_datetime(start_time, duration)
@@ -183,6 +364,10 @@ def download_subtitle_playlist(subtitle_url, download_dir, language,
                 except Exception as e:
                     logging.error(f"Error in downloading subtitle segment: {e}")
 
+            segments = stored_segments(registrations)
+            if segments:
+                call_add_vttmetadata_batch(language, segments, api_base_url)
+
     except requests.RequestException as e:
         logging.error(f"Failed to download subtitle playlist: {e}")
     except Exception as e:
@@ -202,10 +387,25 @@ def main():
     STORAGE_TYPE = config['storage_type']  # 'local' or 's3'
     S3_CONFIG = config.get('s3_config', {}) if STORAGE_TYPE == 's3' else None
     API_BASE_URL = config['api_base_url']
+    PACK_CONFIG = config.get('segment_pack', {})
+    CAPTIONING_CONFIG = config.get('live_captioning', {})
+    LOW_LATENCY = config.get('low_latency', {}).get('enabled', False)
 
     setup_logging(LOG_FILE) # setup logging is done here
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+    # Packed storage is only for the local disk, on s3 every segment stays its own object
+    pack_writer = None
+    if PACK_CONFIG.get('enabled', False) and STORAGE_TYPE == 'local':
+        pack_writer = SegmentPackWriter(DOWNLOAD_DIR, PACK_CONFIG.get('segments_per_pack', 100))
+        logging.info("Segments will be appended into pack files")
+
+    # Live captions are generated from the TS files, so not with packed or s3 storage
+    captioning = None
+    if CAPTIONING_CONFIG.get('enabled', False) and STORAGE_TYPE == 'local' and pack_writer is None:
+        captioning = CAPTIONING_CONFIG
+        logging.info(f"Segments of {captioning['source_resolution']} will be captioned live")
+
     logging.info("HLS downloader process started!!!\n\n\n")
     start_time = time.time()
     end_time = start_time + DOWNLOAD_DURATION if config['download_duration_minutes'] > 0 else -1
@@ -216,7 +416,8 @@ def main():
         futures = [
             executor.submit(download_and_update_manifest, playlists, subtitles,
                 end_time, DOWNLOAD_DIR, THREAD_COUNT, SEGMENT_TIMEOUT,
-                SLEEP_INTERVAL, SUBTITLE_MANIFEST_NAME, STORAGE_TYPE, S3_CONFIG, API_BASE_URL)
+                SLEEP_INTERVAL, SUBTITLE_MANIFEST_NAME, STORAGE_TYPE, S3_CONFIG, API_BASE_URL,
+                pack_writer, captioning, LOW_LATENCY)
         ]
 
         for future in concurrent.futures.as_completed(futures):
@@ -227,6 +428,9 @@ def main():
             except Exception as e:
                 logging.error(f"Error in download task: {e}")
 
+    if pack_writer:
+        pack_writer.close()
+
     if end_time == -1:
         logging.info("The download process is set to run indefinitely.")
     else:
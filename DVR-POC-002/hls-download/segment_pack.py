@@ -0,0 +1,123 @@
+# segment_pack.py
+
+import os
+import struct
+import logging
+from pathlib import Path
+from threading import Lock
+
+'''
+    Packed segment container
+    ------------------------
+    Instead of writing every *.ts / *.vtt segment into its own file, the
+    segments of one track (a resolution or a subtitle language) are appended
+    into a pack file. One pack holds `segments_per_pack` consecutive media
+    sequence numbers (100 x 6s segments = 10 minutes of stream).
+
+        {track}/pack_{track}_{pack_id:010d}.dat  -> raw segment bytes, append only
+        {track}/pack_{track}_{pack_id:010d}.idx  -> one fixed width slot per sequence
+
+    pack_id = sequence_number // segments_per_pack and the slot inside the
+    index is sequence_number % segments_per_pack, so locating a segment is
+    a single lookup, no directory scan and no per segment open()/stat().
+
+    Index slot layout (little endian) : offset uint64, length uint32
+    A slot with length == 0 means the segment is not in the pack (yet).
+    The data is always written before its slot, so a reader never sees a
+    slot pointing to bytes which are not there.
+
+    NOTE: hls-server/segment_pack.py reads this format, keep both in sync.
+'''
+INDEX_RECORD = struct.Struct('<QI')
+
+
+def pack_file_names(track, pack_id):
+    base = f"pack_{track}_{pack_id:010d}"
+    return f"{base}.dat", f"{base}.idx"
+
+
+class SegmentPackWriter:
+    def __init__(self, root_dir, segments_per_pack=100):
+        self.root_dir = Path(root_dir)
+        self.segments_per_pack = segments_per_pack
+        # track -> (pack_id, data_fd, index_fd), only the pack being filled is kept open
+        self.open_packs = {}
+        self.lock = Lock()
+
+    def _get_pack(self, track, pack_id):
+        current = self.open_packs.get(track)
+        if current and current[0] == pack_id:
+            return current[1], current[2]
+
+        track_dir = self.root_dir / track
+        track_dir.mkdir(parents=True, exist_ok=True)
+        data_name, index_name = pack_file_names(track, pack_id)
+        data_fd = os.open(track_dir / data_name, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        index_fd = os.open(track_dir / index_name, os.O_RDWR | os.O_CREAT, 0o644)
+        # Pre-size the index so readers can mmap it once for the life of the pack
+        if os.fstat(index_fd).st_size < self.segments_per_pack * INDEX_RECORD.size:
+            os.ftruncate(index_fd, self.segments_per_pack * INDEX_RECORD.size)
+
+        # Late segments of an older pack are rare, so only the newest pack stays open
+        if current is None or pack_id > current[0]:
+            if current:
+                os.close(current[1])
+                os.close(current[2])
+            self.open_packs[track] = (pack_id, data_fd, index_fd)
+        return data_fd, index_fd
+
+    def _read_slot(self, index_fd, slot):
+        record = os.pread(index_fd, INDEX_RECORD.size, slot * INDEX_RECORD.size)
+        if len(record) < INDEX_RECORD.size:
+            return 0, 0
+        return INDEX_RECORD.unpack(record)
+
+    def segment_size(self, track, sequence_number):
+        '''Byte length of a packed segment, 0 when it is not in its pack'''
+        pack_id, slot = divmod(sequence_number, self.segments_per_pack)
+        with self.lock:
+            current = self.open_packs.get(track)
+            if current and current[0] == pack_id:
+                return self._read_slot(current[2], slot)[1]
+
+        _, index_name = pack_file_names(track, pack_id)
+        try:
+            with open(self.root_dir / track / index_name, 'rb') as index_file:
+                index_file.seek(slot * INDEX_RECORD.size)
+                record = index_file.read(INDEX_RECORD.size)
+        except FileNotFoundError:
+            return 0
+        return INDEX_RECORD.unpack(record)[1] if len(record) == INDEX_RECORD.size else 0
+
+    def has_segment(self, track, sequence_number):
+        return self.segment_size(track, sequence_number) > 0
+
+    def append(self, track, sequence_number, content):
+        '''Appends one segment into its pack, returns False if it was already there'''
+        pack_id, slot = divmod(sequence_number, self.segments_per_pack)
+        with self.lock:
+            data_fd, index_fd = self._get_pack(track, pack_id)
+            try:
+                if self._read_slot(index_fd, slot)[1] > 0:
+                    return False
+
+                offset = os.fstat(data_fd).st_size
+                view = memoryview(content)
+                while view:
+                    written = os.write(data_fd, view)
+                    view = view[written:]
+                os.pwrite(index_fd, INDEX_RECORD.pack(offset, len(content)), slot * INDEX_RECORD.size)
+            finally:
+                if self.open_packs.get(track, (None,))[0] != pack_id:
+                    os.close(data_fd)
+                    os.close(index_fd)
+
+        logging.info(f"Packed segment {sequence_number} of track {track} into pack {pack_id} at offset {offset}")
+        return True
+
+    def close(self):
+        with self.lock:
+            for _, data_fd, index_fd in self.open_packs.values():
+                os.close(data_fd)
+                os.close(index_fd)
+            self.open_packs.clear()
@@ -75,21 +75,42 @@ def store_binaryfile(content, save_path, storage_type, s3_config=None):
         raise
 
 def download_file(url, save_path, timeout, storage_type, s3_config=None):
+    '''Returns the size in bytes of the stored file, None when the download failed'''
     try:
         response = requests.get(url, timeout=timeout)
         response.raise_for_status()
         content = response.content
 
         store_binaryfile(content, save_path, storage_type, s3_config)
-        # Add the Fast API Call for adding metadata
-        # 
-       
+        return len(content)
     except requests.Timeout:
         logging.error(f"Timeout occurred while downloading {url}")
     except requests.RequestException as e:
         logging.error(f"Failed to download {url}: {e}")
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+    return None
+
+def download_file_to_pack(url, pack_writer, track, sequence_number, timeout):
+    '''Returns the size in bytes of the packed segment, None when the download failed'''
+    # The live playlist is polled every few hundred ms, so most segments in it
+    # are already packed, skip those before paying for the download. They are
+    # still reported with their size, so they are registered again like stored
+    # files, e.g. after an hls-server restart or a failed registration.
+    packed_size = pack_writer.segment_size(track, sequence_number)
+    if packed_size:
+        return packed_size
+    try:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        pack_writer.append(track, sequence_number, response.content)
+        return len(response.content)
+    except requests.Timeout:
+        logging.error(f"Timeout occurred while downloading {url}")
+    except requests.RequestException as e:
+        logging.error(f"Failed to download {url}: {e}")
+    except Exception as e:
+        logging.error(f"An error occurred while packing {url}: {e}")
 
 def store_manifestfile(content, save_path, storage_type, s3_config=None, master=False):
     try:
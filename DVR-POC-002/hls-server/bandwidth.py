@@ -0,0 +1,86 @@
+# bandwidth.py
+
+from collections import deque
+
+'''
+    Rolling bitrate statistics per rendition, for the master playlist
+
+    hls-download reports the byte size of every segment it stores. The last
+    window_segments of a rendition give
+        BANDWIDTH          peak segment bitrate in the window
+        AVERAGE-BANDWIDTH  total bits / total duration of the window
+    which is what the HLS spec asks for, measured instead of declared by the
+    encoder. Both are O(1) per segment: the average from running sums, the
+    peak from a monotonic deque (amortized, every segment enters and leaves
+    it once).
+'''
+
+
+class RollingBitrate:
+    def __init__(self, window_segments=30):
+        self.window_segments = window_segments
+        # (arrival index, sequence number, bits, duration)
+        self.segments = deque()
+        self.sequence_numbers = set()
+        # (arrival index, bitrate) with decreasing bitrates, the peak is the first
+        self.peaks = deque()
+        self.arrivals = 0
+        self.total_bits = 0
+        self.total_duration = 0.0
+
+    def record(self, sequence_number, size, duration):
+        '''Adds a segment, a sequence number already in the window is not counted twice'''
+        if duration <= 0 or sequence_number in self.sequence_numbers:
+            return False
+        bits = size * 8
+        bitrate = bits / duration
+        self.arrivals += 1
+        self.segments.append((self.arrivals, sequence_number, bits, duration))
+        self.sequence_numbers.add(sequence_number)
+        self.total_bits += bits
+        self.total_duration += duration
+        while self.peaks and self.peaks[-1][1] <= bitrate:
+            self.peaks.pop()
+        self.peaks.append((self.arrivals, bitrate))
+
+        if len(self.segments) > self.window_segments:
+            arrival, oldest, bits, duration = self.segments.popleft()
+            self.sequence_numbers.discard(oldest)
+            self.total_bits -= bits
+            self.total_duration -= duration
+            if self.peaks[0][0] == arrival:
+                self.peaks.popleft()
+        return True
+
+    def __len__(self):
+        return len(self.segments)
+
+    def peak(self):
+        return int(self.peaks[0][1]) if self.peaks else 0
+
+    def average(self):
+        return int(self.total_bits / self.total_duration) if self.total_duration > 0 else 0
+
+
+class BandwidthStats:
+    def __init__(self, window_segments=30, min_segments=3):
+        self.window_segments = window_segments
+        # fewer segments than this say little about a rendition, the declared values are kept
+        self.min_segments = min_segments
+        self.tracks = {}
+
+    def record(self, track, sequence_number, size, duration):
+        rolling = self.tracks.get(track)
+        if rolling is None:
+            rolling = self.tracks[track] = RollingBitrate(self.window_segments)
+        return rolling.record(sequence_number, size, duration)
+
+    def get(self, track):
+        '''(peak, average) bits per second of the track, None until min_segments were measured'''
+        rolling = self.tracks.get(track)
+        if rolling is None or len(rolling) < self.min_segments:
+            return None
+        return rolling.peak(), rolling.average()
+
+    def measured(self):
+        return {track: stats for track, stats in ((track, self.get(track)) for track in list(self.tracks)) if stats}
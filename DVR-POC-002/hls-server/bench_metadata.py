@@ -0,0 +1,260 @@
+# bench_metadata.py
+
+import argparse
+import gc
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from metrics import LatencyHistogram, TimedLock
+from timeshift import key_to_epoch
+from track_index import TrackIndex, VIDEO, SUBTITLES
+
+'''
+    Microbenchmarks for the track index
+
+    Sweeps the window size, the rendition count and the number of concurrent
+    reader/writer threads and records ops/sec per operation and the memory
+    per segment of the index:
+
+        python bench_metadata.py --save baseline.json
+        python bench_metadata.py --check baseline.json --threshold 0.2
+
+    --check exits with 1 when an operation got slower, or a segment bigger,
+    than the baseline by more than the threshold, so it can gate CI. Compare
+    runs of the same machine only, the numbers are absolute.
+
+    Measured: add/remove, get_live_window, get_timeshift_playlist, the
+    get_live_playlist/get_dvr_playlist lookups behind the metadata API and
+    segments_at over all tracks.
+'''
+
+RENDITIONS = ['1920x1080', '1280x720', '1024x576', '640x360', '384x216']
+SEGMENT_DURATION = 6.0
+LOGGER = logging.getLogger("bench_metadata")
+LOGGER.setLevel(logging.WARNING)
+
+
+def segment(sequence_number, first_start):
+    moment = first_start + timedelta(seconds=sequence_number * SEGMENT_DURATION)
+    return moment.date().isoformat(), moment.strftime("%H:%M:%S.%f")[:-3], moment.strftime('%H%M%S')
+
+
+def fill(manager, tracks, window, first_start, kind='ts'):
+    for track in tracks:
+        for sequence_number in range(window):
+            date, start, stamp = segment(sequence_number, first_start)
+            if kind == 'ts':
+                manager.add_segment(VIDEO, track, date, start, sequence_number, SEGMENT_DURATION,
+                                    f"playlist_{track}_{stamp}__{sequence_number}.ts")
+            else:
+                manager.add_segment(SUBTITLES, track, date, start, sequence_number, SEGMENT_DURATION,
+                                    f"playlist_webvtt_{stamp}__{sequence_number}.vtt")
+
+
+def ops_per_second(operation, min_seconds=0.2, repeats=5):
+    '''Median ops/sec of `repeats` timed batches, the batch grows until it runs min_seconds'''
+    batch = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(batch):
+            operation()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds / 10:
+            break
+        batch *= 4
+    batch = max(1, int(batch * (min_seconds / 10) / max(elapsed, 1e-9) * 10 / repeats))
+    rates = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(batch):
+            operation()
+        rates.append(batch / (time.perf_counter() - started))
+    rates.sort()
+    return rates[len(rates) // 2]
+
+
+def memory_per_segment(window, renditions):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    manager = TrackIndex(LOGGER)
+    fill(manager, RENDITIONS[:renditions], window, datetime(2024, 7, 16))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del manager
+    return used / (window * renditions)
+
+
+def single_thread_cases(window, renditions, min_seconds):
+    first_start = datetime(2024, 7, 16)
+    tracks = RENDITIONS[:renditions]
+    manager = TrackIndex(LOGGER)
+    fill(manager, tracks, window, first_start)
+    results = {}
+
+    # add and remove slide the window by one segment, its size stays constant
+    state = {"next": window, "oldest": 0, "track": 0}
+
+    def add_then_remove():
+        track = tracks[state["track"] % renditions]
+        state["track"] += 1
+        sequence_number = state["next"]
+        date, start, stamp = segment(sequence_number, first_start)
+        manager.add_segment(VIDEO, track, date, start, sequence_number, SEGMENT_DURATION,
+                            f"playlist_{track}_{stamp}__{sequence_number}.ts")
+        manager.remove_segment(track, state["oldest"])
+        if track == tracks[-1]:
+            state["next"] += 1
+            state["oldest"] += 1
+
+    results["ts.add_remove"] = ops_per_second(add_then_remove, min_seconds)
+    results["ts.get_live_window"] = ops_per_second(
+        lambda: manager.get_live_window(random.choice(tracks), 10), min_seconds)
+    span = window * SEGMENT_DURATION
+    results["ts.get_timeshift_playlist"] = ops_per_second(
+        lambda: manager.get_timeshift_playlist(random.choice(tracks), random.random() * span, 10), min_seconds)
+
+    results["ts.get_live_playlist"] = ops_per_second(
+        lambda: manager.get_live_playlist(random.choice(tracks), 10), min_seconds)
+
+    def ts_dvr():
+        date, start, _ = segment(state["oldest"] + random.randrange(window), first_start)
+        manager.get_dvr_playlist(random.choice(tracks), date, start, 10)
+    results["ts.get_dvr_playlist"] = ops_per_second(ts_dvr, min_seconds)
+
+    def all_tracks_at():
+        date, start, _ = segment(state["oldest"] + random.randrange(window), first_start)
+        manager.segments_at(key_to_epoch(date, start))
+    results["index.segments_at"] = ops_per_second(all_tracks_at, min_seconds)
+
+    vtt = TrackIndex(LOGGER)
+    fill(vtt, ['eng'], window, first_start, kind='vtt')
+    results["vtt.get_live_playlist"] = ops_per_second(lambda: vtt.get_live_playlist('eng', 10), min_seconds)
+
+    def dvr():
+        date, start, _ = segment(random.randrange(window), first_start)
+        vtt.get_dvr_playlist('eng', date, start, 10)
+    results["vtt.get_dvr_playlist"] = ops_per_second(dvr, min_seconds)
+    return results
+
+
+def contention_case(window, renditions, readers, writers, seconds):
+    '''Readers poll live windows while writers slide them, returns ops/sec and lock wait p99'''
+    first_start = datetime(2024, 7, 16)
+    tracks = RENDITIONS[:renditions]
+    lock_wait = LatencyHistogram()
+    manager = TrackIndex(LOGGER, TimedLock(lock_wait))
+    fill(manager, tracks, window, first_start)
+    counts = [0] * (readers + writers)
+    stop = threading.Event()
+
+    def reader(slot):
+        while not stop.is_set():
+            manager.get_live_window(tracks[slot % renditions], 10)
+            counts[slot] += 1
+
+    def writer(slot, index):
+        # every writer owns its own tracks, so the windows keep a constant size
+        owned = tracks[index::writers] or tracks[:1]
+        sequence_number = window + index * 10_000_000
+        oldest = 0
+        while not stop.is_set():
+            for track in owned:
+                date, start, stamp = segment(sequence_number, first_start)
+                manager.add_segment(VIDEO, track, date, start, sequence_number, SEGMENT_DURATION,
+                                    f"playlist_{track}_{stamp}__{sequence_number}.ts")
+                manager.remove_segment(track, oldest)
+            sequence_number += 1
+            oldest += 1
+            counts[slot] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(readers + i, i)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "read_ops_per_sec": sum(counts[:readers]) / seconds,
+        "write_ops_per_sec": sum(counts[readers:]) / seconds,
+        "lock_wait_p99_us": lock_wait.percentile(99) * 1_000_000,
+    }
+
+
+def run_suite(windows, rendition_counts, thread_mixes, min_seconds=0.2, contention_seconds=1.0):
+    results = {}
+    for window in windows:
+        for renditions in rendition_counts:
+            prefix = f"window={window},renditions={renditions}"
+            for name, rate in single_thread_cases(window, renditions, min_seconds).items():
+                results[f"{name}[{prefix}]"] = {"ops_per_sec": rate}
+            results[f"memory[{prefix}]"] = {"bytes_per_segment": memory_per_segment(window, renditions)}
+            for readers, writers in thread_mixes:
+                case = contention_case(window, renditions, readers, writers, contention_seconds)
+                results[f"contention[{prefix},readers={readers},writers={writers}]"] = case
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    '''Lists the cases which got slower (ops) or bigger (bytes, wait) than the baseline by more than threshold'''
+    regressions = []
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get(case, {}).get(metric)
+            if not before:
+                continue
+            higher_is_better = metric.endswith("ops_per_sec")
+            change = (value - before) / before
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append((case, metric, before, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata manager microbenchmarks")
+    parser.add_argument("--windows", default="1000,10000,100000", help="segments per track, comma separated")
+    parser.add_argument("--renditions", default="1,5")
+    parser.add_argument("--threads", default="1:1,4:1,8:2", help="readers:writers mixes")
+    parser.add_argument("--min-seconds", type=float, default=0.2)
+    parser.add_argument("--contention-seconds", type=float, default=1.0)
+    parser.add_argument("--quick", action="store_true", help="small sweep for a smoke run")
+    parser.add_argument("--save", help="write the results JSON here")
+    parser.add_argument("--check", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    random.seed(1)
+
+    if args.quick:
+        args.windows, args.renditions, args.threads = "1000", "1", "2:1"
+        args.min_seconds, args.contention_seconds = 0.05, 0.3
+    results = run_suite([int(w) for w in args.windows.split(",")],
+                        [int(r) for r in args.renditions.split(",")],
+                        [tuple(int(n) for n in mix.split(":")) for mix in args.threads.split(",")],
+                        args.min_seconds, args.contention_seconds)
+    for case, metrics in results.items():
+        print(case, " ".join(f"{metric}={value:,.1f}" for metric, value in metrics.items()))
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.check:
+        with open(args.check) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.threshold)
+        for case, metric, before, value, change in regressions:
+            print(f"REGRESSION {case} {metric}: {before:,.1f} -> {value:,.1f} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# benchmark.py
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from metrics import LatencyHistogram
+from track_index import VIDEO
+
+'''
+    Benchmark harness for the hls-server playlist and segment endpoints
+
+    Builds a synthetic hls_data tree and a metadata window of the requested
+    size, then runs thousands of simulated players against the server while a
+    live ingest keeps adding one segment per rendition every segment
+    duration. Each player polls the live playlist of a rendition and fetches
+    the segments it has not seen yet, like hls.js does.
+
+        python benchmark.py --segments 100000 --players 2000 --duration 60 --mode inprocess
+        python benchmark.py --segments 1000 --players 500 --mode loopback --output run.json
+        python benchmark.py ... --compare baseline.json
+
+    --mode inprocess drives the ASGI app directly (no sockets, measures the
+    handlers), --mode loopback serves it with uvicorn on 127.0.0.1 (measures
+    the whole HTTP stack). The result is one JSON document with throughput,
+    p50/p99/p999 latency per request kind, errors and RSS, so two runs can
+    be compared.
+
+    Only the newest --files-per-rendition segments exist on disk, the players
+    never fetch anything older, so a window of 1M segments does not need 5M
+    files. The metadata of 1M segments x 5 renditions takes several GB.
+'''
+
+RENDITIONS = ['1920x1080', '1280x720', '1024x576', '640x360', '384x216']
+SEGMENT_DURATION = 6.0
+SEGMENT_PATTERN = re.compile(r'^(playlist_[^\s#]+\.ts)$', re.M)
+
+
+def segment_name(resolution, moment, sequence_number):
+    return f"playlist_{resolution}_{moment.strftime('%H%M%S')}__{sequence_number}.ts"
+
+
+def segment_metadata(resolution, sequence_number, first_start):
+    moment = first_start + timedelta(seconds=sequence_number * SEGMENT_DURATION)
+    return {
+        "resolution": resolution,
+        "date": moment.date().isoformat(),
+        "start_timestamp": moment.strftime("%H:%M:%S.%f")[:-3],
+        "sequence_number": sequence_number,
+        "duration": SEGMENT_DURATION,
+        "ts_file": segment_name(resolution, moment, sequence_number),
+    }
+
+
+def segment_row(metadata):
+    return (metadata["date"], metadata["start_timestamp"], metadata["sequence_number"],
+            metadata["duration"], metadata["ts_file"])
+
+
+def write_segment(data_dir, metadata, payload):
+    path = Path(data_dir) / metadata["resolution"] / metadata["ts_file"]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(payload)
+
+
+def build_dataset(data_dir, manager, renditions, segments, files_per_rendition, segment_bytes):
+    '''Fills the manager with `segments` per rendition ending now, returns (first start, next sequence number)'''
+    first_start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=segments * SEGMENT_DURATION)
+    payload = os.urandom(segment_bytes)
+    for resolution in renditions:
+        rows = []
+        for sequence_number in range(segments):
+            metadata = segment_metadata(resolution, sequence_number, first_start)
+            rows.append(segment_row(metadata))
+            if sequence_number >= segments - files_per_rendition:
+                write_segment(data_dir, metadata, payload)
+        manager.add_segments(VIDEO, resolution, rows)
+    master = ["#EXTM3U"] + [f"#EXT-X-STREAM-INF:BANDWIDTH={1000000 * (i + 1)},RESOLUTION={r}\nplaylist_{r}.m3u8"
+                            for i, r in enumerate(reversed(renditions))]
+    (Path(data_dir) / "playlist.m3u8").write_text("\n".join(master) + "\n")
+    return first_start, segments
+
+
+def write_config(work_dir, data_dir):
+    config = {
+        "segments_dir": str(data_dir),
+        "subtitle_dir_eng": str(Path(data_dir) / "eng"),
+        "enable_time_logging": False,
+        "logging_dir": str(Path(work_dir) / "logs"),
+        "log_level": "WARNING",
+        "access_log": {"sample_rate": 0.0, "slow_ms": 1000},
+        "master_playlist_name": "playlist.m3u8",
+        "subtitle_playlist_name": "playlist_webvtt.m3u8",
+        "timeshift_window_segments": 10,
+    }
+    (Path(work_dir) / "config.json").write_text(json.dumps(config))
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+class Results:
+    def __init__(self):
+        self.latency = {"playlist": LatencyHistogram(), "segment": LatencyHistogram()}
+        self.errors = {"playlist": 0, "segment": 0}
+        self.bytes = 0
+
+    def summary(self, elapsed):
+        kinds = {}
+        for kind, histogram in self.latency.items():
+            kinds[kind] = {
+                "requests": histogram.count,
+                "errors": self.errors[kind],
+                "throughput_rps": round(histogram.count / elapsed, 1),
+                "p50_ms": round(histogram.percentile(50) * 1000, 3),
+                "p99_ms": round(histogram.percentile(99) * 1000, 3),
+                "p999_ms": round(histogram.percentile(99.9) * 1000, 3),
+                "max_ms": round(histogram.max / 1000, 3),
+            }
+        return kinds
+
+
+async def timed_get(client, url, kind, results):
+    started = time.perf_counter()
+    try:
+        response = await client.get(url)
+        ok = response.status_code == 200
+        body = response.content
+    except Exception:
+        ok, body = False, b""
+    results.latency[kind].record(time.perf_counter() - started)
+    if not ok:
+        results.errors[kind] += 1
+        return None
+    results.bytes += len(body)
+    return body
+
+
+async def player(client, renditions, poll_interval, deadline, results):
+    resolution = random.choice(renditions)
+    seen = set()
+    # players do not start in lockstep
+    await asyncio.sleep(random.random() * poll_interval)
+    while time.monotonic() < deadline:
+        playlist = await timed_get(client, f"/playlist_{resolution}.m3u8", "playlist", results)
+        if playlist is not None:
+            for name in SEGMENT_PATTERN.findall(playlist.decode())[-3:]:
+                if name not in seen:
+                    seen.add(name)
+                    await timed_get(client, f"/{name}", "segment", results)
+        await asyncio.sleep(poll_interval)
+
+
+async def live_ingest(manager, data_dir, renditions, first_start, next_sequence, deadline, payload, speedup):
+    while time.monotonic() < deadline:
+        await asyncio.sleep(SEGMENT_DURATION / speedup)
+        for resolution in renditions:
+            metadata = segment_metadata(resolution, next_sequence, first_start)
+            write_segment(data_dir, metadata, payload)
+            manager.add_segment(VIDEO, resolution, *segment_row(metadata))
+        next_sequence += 1
+
+
+async def drive(app, base_url, args, manager, data_dir, first_start, next_sequence):
+    import httpx
+    if base_url is None:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://hls-server")
+    else:
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30)
+
+    results = Results()
+    renditions = RENDITIONS[:args.renditions]
+    started = time.monotonic()
+    deadline = started + args.duration
+    payload = os.urandom(args.segment_bytes)
+    async with client:
+        await asyncio.gather(
+            live_ingest(manager, data_dir, renditions, first_start, next_sequence, deadline, payload, args.speedup),
+            *(player(client, renditions, args.poll_interval, deadline, results) for _ in range(args.players)))
+    return results, time.monotonic() - started
+
+
+def start_uvicorn(app, port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(result, baseline):
+    print(f"{'kind':<10}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for kind, current in result["kinds"].items():
+        previous = baseline["kinds"].get(kind, {})
+        for metric in ("throughput_rps", "p50_ms", "p99_ms", "p999_ms"):
+            before, after = previous.get(metric), current[metric]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{kind:<10}{metric:<16}{before if before is not None else '-':>12}{after:>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hls-server playlist and segment benchmark")
+    parser.add_argument("--segments", type=int, default=1000, help="metadata window per rendition")
+    parser.add_argument("--renditions", type=int, default=5, choices=range(1, 6))
+    parser.add_argument("--files-per-rendition", type=int, default=100)
+    parser.add_argument("--segment-bytes", type=int, default=188 * 1000)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between playlist polls")
+    parser.add_argument("--speedup", type=float, default=1.0, help="live ingest runs this much faster than real time")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mode", choices=("inprocess", "loopback"), default="inprocess")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the result JSON here")
+    parser.add_argument("--compare", help="result JSON of an earlier run")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    for option in ("output", "compare"):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    work_dir = Path(tempfile.mkdtemp(prefix="hls-bench-"))
+    data_dir = work_dir / "hls_data"
+    write_config(work_dir, data_dir)
+    # main.py reads config.json from the working directory at import
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.chdir(work_dir)
+    import main as server
+
+    build_started = time.perf_counter()
+    first_start, next_sequence = build_dataset(data_dir, server.track_index, RENDITIONS[:args.renditions],
+                                               args.segments, min(args.files_per_rendition, args.segments),
+                                               args.segment_bytes)
+    build_seconds = time.perf_counter() - build_started
+    rss_loaded = rss_bytes()
+
+    base_url = None
+    if args.mode == "loopback":
+        uvicorn_server, thread = start_uvicorn(server.app, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    results, elapsed = asyncio.run(drive(server.app, base_url, args, server.track_index, data_dir,
+                                         first_start, next_sequence))
+    if args.mode == "loopback":
+        uvicorn_server.should_exit = True
+        thread.join()
+
+    result = {
+        "benchmark": "hls-server",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_seconds": round(elapsed, 3),
+        "dataset_build_seconds": round(build_seconds, 3),
+        "bytes_served": results.bytes,
+        "rss_bytes_after_load": rss_loaded,
+        "rss_bytes_end": rss_bytes(),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "kinds": results.summary(elapsed),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+    if args.compare:
+        compare(result, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
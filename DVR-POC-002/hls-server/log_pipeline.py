@@ -0,0 +1,120 @@
+# log_pipeline.py
+
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+'''
+    Non-blocking logging for hls-server
+
+    The request handlers only put the LogRecord on an in-memory queue, a
+    QueueListener thread formats it and writes it to the rotating files. So
+    a disk flush never runs on the event loop, and neither does formatting
+    unless an arg is mutable and has to be rendered before it changes.
+    When the writer falls behind and the queue is full, records are dropped
+    and counted instead of blocking the request.
+
+    The access log has one compact logfmt line per request. Successful fast
+    requests are sampled, errors and slow requests are always written.
+'''
+
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(filename)s:%(lineno)d:%(message)s'
+ACCESS_LOGGER = 'hls.access'
+# args safe to render later on the writer thread
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The default prepare() formats the message in the calling thread. Here
+        # immutable args stay on the record and are rendered by the writer thread,
+        # any other arg (a dict, a list, a segment entry) could change before the
+        # writer reads it, so that message is rendered now.
+        args = record.args
+        if args and (not isinstance(args, tuple) or not all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # tracebacks hold frames, render them now so the record can be queued
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLogSampler(logging.Filter):
+    '''Keeps `rate` of the successful, fast requests, every error and slow request'''
+    def __init__(self, rate=1.0, slow_ms=500.0):
+        super().__init__()
+        self.rate = rate
+        self.slow_ms = slow_ms
+
+    def filter(self, record):
+        status = getattr(record, 'status', 200)
+        duration_ms = getattr(record, 'duration_ms', 0.0)
+        if status >= 400 or duration_ms >= self.slow_ms:
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+def setup_logging(logs_dir, level='INFO', access_sample_rate=1.0, access_slow_ms=500.0, queue_size=50000):
+    '''Installs the queue handler on the root logger, returns the started listener'''
+    def rotating_handler(file_name, log_format):
+        handler = TimedRotatingFileHandler(logs_dir / file_name, when='midnight', interval=1,
+            # Keep last 30 days logs as backup
+            backupCount=30)
+        handler.suffix = "%Y-%m-%d"
+        handler.setFormatter(logging.Formatter(log_format))
+        return handler
+
+    server_handler = rotating_handler('hls_server.log', LOG_FORMAT)
+    server_handler.addFilter(lambda record: record.name != ACCESS_LOGGER)
+    access_handler = rotating_handler('hls_access.log', '%(asctime)s %(message)s')
+    access_handler.addFilter(lambda record: record.name == ACCESS_LOGGER)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, server_handler, access_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+
+    access_logger = logging.getLogger(ACCESS_LOGGER)
+    access_logger.setLevel(logging.INFO)
+    access_logger.addFilter(AccessLogSampler(access_sample_rate, access_slow_ms))
+
+    listener.start()
+    return listener
+
+
+def access_log_middleware(app):
+    '''Registers the http middleware which writes the access log line of every request'''
+    access_logger = logging.getLogger(ACCESS_LOGGER)
+
+    @app.middleware("http")
+    async def access_log(request, call_next):
+        started = time.perf_counter()
+        status = 500
+        length = '-'
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            length = response.headers.get('content-length', '-')
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info('method=%s path=%s status=%d ms=%.2f bytes=%s',
+                    request.method, request.url.path, status, duration_ms, length,
+                    extra={'status': status, 'duration_ms': duration_ms})
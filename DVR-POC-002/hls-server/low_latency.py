@@ -0,0 +1,58 @@
+# low_latency.py
+
+import asyncio
+
+'''
+    LL-HLS blocking playlist reload and preload hints
+
+    A player asks for the playlist which contains part _HLS_part of segment
+    _HLS_msn (or a part it saw in a preload hint) before it exists, and the
+    request is held until the downloader registered it. So a viewer makes one
+    request per part instead of polling, and hears of a part as soon as it is
+    on disk.
+
+    The metadata endpoints run on the event loop and call notify(track), every
+    waiter of the track wakes up and checks its own condition again.
+'''
+
+
+class BlockedRequestError(Exception):
+    '''The awaited part is too far ahead to block for (400) or did not arrive in time (503)'''
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class PartWaiters:
+    def __init__(self):
+        self.events = {}
+
+    def notify(self, track):
+        event = self.events.pop(track, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, track, timeout):
+        event = self.events.get(track)
+        if event is None:
+            event = self.events[track] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait_for_part(self, manager, track, sequence_number, part_index, timeout):
+        if manager.has_part(track, sequence_number, part_index):
+            return
+        newest = manager.get_newest_sequence(track)
+        # as the spec says, more than two segments ahead of the playlist is a client error
+        if newest is not None and sequence_number > newest + 2:
+            raise BlockedRequestError(400, "_HLS_msn is too far ahead of the live edge")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not manager.has_part(track, sequence_number, part_index):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise BlockedRequestError(503, "The requested part did not arrive in time")
+            await self.wait(track, remaining)
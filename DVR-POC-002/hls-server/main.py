@@ -1,21 +1,32 @@
 # main.py
 
 import json
+import math
 import os
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Response, Request, Depends
+from fastapi import FastAPI, HTTPException, Response, Request, Depends, Query
+from fastapi.responses import RedirectResponse
 from sortedcontainers import SortedDict
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import aiofiles  # Import aiofiles for asynchronous file operations
-from logging.handlers import TimedRotatingFileHandler
 from pydantic import BaseModel
+from typing import List, Optional
+from collections import OrderedDict
 from datetime import datetime
 
-from ts_metadata_manager import TSMetadataManager
-from vtt_metadata_manager import VTTMetadataManager
+from track_index import TrackIndex, VIDEO, SUBTITLES
+from segment_pack import SegmentPackReader
+from timeshift import encode_token, decode_token
+from playlist_renderer import render_media_playlist, render_master_playlist, parse_variants, variant_attributes
+from bandwidth import BandwidthStats
+from low_latency import PartWaiters, BlockedRequestError
+from seek import SeekCache, seek_windows, render_seek_response
+from log_pipeline import setup_logging, access_log_middleware
+from metrics import Metrics, TimedLock, metrics_middleware
+from profiler import StackSampler, SlowRequestRecorder, profile, slow_request_middleware
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -41,6 +52,46 @@ ENABLE_TIME_LOGGING = config.get("enable_time_logging", False)
 
 # read the master playlist name
 MASTER_PLAYLIST_NAME = config.get("master_playlist_name", "")
+# the origin master playlist only gives the declared attributes of the renditions, it is
+# read again when a rendition it did not declare appears, at most this often
+DECLARED_VARIANTS_RELOAD_SECONDS = config.get("declared_variants_reload_seconds", 30)
+
+# Live window: segments listed, the newest ones held back (in segments or seconds)
+# and how many must be listable before a live playlist is served at all
+LIVE_WINDOW_CONFIG = config.get("live_window", {})
+LIVE_WINDOW_SEGMENTS = LIVE_WINDOW_CONFIG.get("window_segments", 10)
+LIVE_HOLD_BACK_SEGMENTS = LIVE_WINDOW_CONFIG.get("hold_back_segments", 0)
+LIVE_HOLD_BACK_SECONDS = LIVE_WINDOW_CONFIG.get("hold_back_seconds", 0.0)
+LIVE_STARTUP_MIN_SEGMENTS = LIVE_WINDOW_CONFIG.get("startup_min_segments", 3)
+
+# Number of segments in a time-shifted (DVR) playlist window
+TIMESHIFT_WINDOW_SEGMENTS = config.get("timeshift_window_segments", 10)
+# Offsets are rounded down to this step when a token is issued, viewers in one bucket share a rendered window
+TIMESHIFT_TOKEN_BUCKET_SECONDS = config.get("timeshift_token_bucket_seconds", 1.0)
+TIMESHIFT_CACHE_ENTRIES = config.get("timeshift_cache_entries", 10000)
+
+# /seek responses are computed per time bucket and reused by every viewer seeking into it
+SEEK_CONFIG = config.get("seek", {})
+SEEK_MAX_SEGMENTS = SEEK_CONFIG.get("max_segments", 50)
+
+# Packed segment storage, must match the "segment_pack" config of hls-download
+SEGMENT_PACK_CONFIG = config.get("segment_pack", {})
+SEGMENT_PACK_ENABLED = SEGMENT_PACK_CONFIG.get("enabled", False)
+
+# LL-HLS parts, blocking playlist reload and preload hints
+LOW_LATENCY_CONFIG = config.get("low_latency", {})
+LOW_LATENCY_ENABLED = LOW_LATENCY_CONFIG.get("enabled", False)
+# a blocked request is answered with 503 after this many target durations, 3 as the spec suggests
+BLOCKING_RELOAD_TARGET_DURATIONS = LOW_LATENCY_CONFIG.get("blocking_reload_target_durations", 3)
+
+# Measured per rendition bitrates replace the declared ones in the master playlist
+ABR_HINTS_CONFIG = config.get("abr_hints", {})
+ABR_HINTS_ENABLED = ABR_HINTS_CONFIG.get("enabled", False)
+
+# Sampling profiler behind /debug, off unless enabled
+PROFILING_CONFIG = config.get("profiling", {})
+PROFILING_ENABLED = PROFILING_CONFIG.get("enabled", False)
+MAX_PROFILE_SECONDS = PROFILING_CONFIG.get("max_profile_seconds", 60)
 
 
 ####################Loading of configuration ends here##########
@@ -52,22 +103,12 @@ MASTER_PLAYLIST_NAME = config.get("master_playlist_name", "")
 LOGS_DIR = Path(config["logging_dir"])
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Configure logger
-log_filename = LOGS_DIR / 'hls_server.log'
-handler = TimedRotatingFileHandler(
-    log_filename,
-    when='midnight',
-    interval=1,
-    # Keep last 30 days logs as backup
-    backupCount=30  # Number of backup files to keep, adjust as needed
-)
-handler.suffix = "%Y-%m-%d"
-formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(filename)s:%(lineno)d:%(message)s')
-handler.setFormatter(formatter)
-
+# Records are queued by the request handlers and written by a listener thread
+LOG_LEVEL = config.get("log_level", "INFO")
+ACCESS_LOG_CONFIG = config.get("access_log", {})
+log_listener = setup_logging(LOGS_DIR, LOG_LEVEL,
+    ACCESS_LOG_CONFIG.get("sample_rate", 1.0), ACCESS_LOG_CONFIG.get("slow_ms", 500))
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-logger.addHandler(handler)
 
 ###################Logging Configeration Ends here############
 
@@ -84,29 +125,75 @@ app.add_middleware(
 )
 ######################Handling Ends here#####################
 
+# One compact line per request in hls_access.log
+access_log_middleware(app)
+
+# Latency histograms per route and the other counters served at /metrics
+metrics = Metrics()
+metrics_middleware(app, metrics)
+
+# Requests slower than slow_request_ms keep the stack samples taken while they ran
+stack_sampler = None
+slow_requests = None
+if PROFILING_ENABLED and PROFILING_CONFIG.get("slow_request_ms"):
+    interval = PROFILING_CONFIG.get("interval_ms", 10) / 1000
+    # the ring buffer covers the slowest request worth keeping, at a few threads per sample
+    stack_sampler = StackSampler(interval, capacity=int(30 / interval) * 16).start()
+    slow_requests = SlowRequestRecorder(stack_sampler, PROFILING_CONFIG["slow_request_ms"],
+        PROFILING_CONFIG.get("max_slow_requests", 50))
+    slow_request_middleware(app, slow_requests)
+
+@app.on_event("shutdown")
+def flush_logs():
+    if stack_sampler:
+        stack_sampler.stop()
+    log_listener.stop()
+
 # Thread pool for blocking IO operations, go with default number of workers
 executor = ThreadPoolExecutor(max_workers=10)
 
-import logging
-from datetime import datetime, timezone
-
-ENABLE_TIME_LOGGING = True
+import time
+from datetime import timezone
 
+# The per route latency is in /metrics, this only adds a debug line per handler call
 def log_time(func):
+    if not ENABLE_TIME_LOGGING:
+        return func
     async def wrapper(*args, **kwargs):
-        if ENABLE_TIME_LOGGING:
-            start_time = datetime.now(timezone.utc)
-        result = await func(*args, **kwargs)
-        if ENABLE_TIME_LOGGING:
-            end_time = datetime.now(timezone.utc)
-            duration = (end_time - start_time).total_seconds()
-            logging.info(f"Execution time for {func.__name__}: {duration} seconds\n\n")
-        return result
+        start_time = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            logger.debug("Execution time for %s: %.6f seconds", func.__name__, time.perf_counter() - start_time)
     return wrapper
     
-# Initialize the Metadata Managers
-ts_manager = TSMetadataManager(logger)
-vtt_manager = VTTMetadataManager(logger)
+# Initialize the metadata index of all tracks, its lock records the time spent waiting
+track_index = TrackIndex(logger, TimedLock(metrics.lock_wait["track_index"]))
+
+def subtitle_dir(language):
+    # hls-download stores every language in a directory of its own next to the renditions
+    return SUBTITLE_DIR_ENG if language == SUBTITLE_DIR_ENG.name else SEGMENTS_DIR / language
+
+metrics.register_gauge("hls_metadata_index_segments", "track", track_index.index_sizes)
+
+# Rolling peak/average bitrate of every rendition from the segment sizes hls-download reports
+bandwidth_stats = BandwidthStats(ABR_HINTS_CONFIG.get("window_segments", 30), ABR_HINTS_CONFIG.get("min_segments", 3))
+metrics.register_gauge("hls_rendition_peak_bandwidth_bps", "track",
+    lambda: {track: peak for track, (peak, _) in bandwidth_stats.measured().items()})
+metrics.register_gauge("hls_rendition_average_bandwidth_bps", "track",
+    lambda: {track: average for track, (_, average) in bandwidth_stats.measured().items()})
+
+# Seek windows shared by the viewers scrubbing to the same second
+seek_cache = SeekCache(SEEK_CONFIG.get("bucket_seconds", 1.0), SEEK_CONFIG.get("cache_ttl_seconds", 2.0),
+    SEEK_CONFIG.get("max_cache_entries", 10000))
+metrics.register_gauge("hls_seek_cache_total", "result", lambda: dict(seek_cache.lookups))
+
+# Reader for the packed segment container, None when segments are plain files
+pack_reader = None
+if SEGMENT_PACK_ENABLED:
+    pack_reader = SegmentPackReader(SEGMENTS_DIR,
+        SEGMENT_PACK_CONFIG.get("segments_per_pack", 100),
+        SEGMENT_PACK_CONFIG.get("max_open_packs", 64), logger)
 
 # Models for the API requests
 class TSMetadataRequest(BaseModel):
@@ -116,6 +203,16 @@ class TSMetadataRequest(BaseModel):
     sequence_number: int
     duration: float
     ts_file: str
+    # bytes of the downloaded segment, missing when the downloader did not fetch it again
+    size: Optional[int] = None
+
+class TSPartRequest(BaseModel):
+    resolution: str
+    sequence_number: int
+    part_index: int
+    duration: float
+    part_file: str
+    independent: bool = False
 
 class VTTMetadataRequest(BaseModel):
     language: str
@@ -125,18 +222,115 @@ class VTTMetadataRequest(BaseModel):
     duration: float
     vtt_file: str
 
-# Dependency for TSMetadataManager
-def get_ts_manager():
-    return ts_manager
+# One reload of a playlist in one request, ingested under one lock of the index
+class TSSegment(BaseModel):
+    date: str
+    start_timestamp: str
+    sequence_number: int
+    duration: float
+    ts_file: str
+    size: Optional[int] = None
+
+class TSMetadataBatchRequest(BaseModel):
+    resolution: str
+    segments: List[TSSegment]
+
+class VTTSegment(BaseModel):
+    date: str
+    start_timestamp: str
+    sequence_number: int
+    duration: float
+    vtt_file: str
+
+class VTTMetadataBatchRequest(BaseModel):
+    language: str
+    segments: List[VTTSegment]
+
+class RemoveSegmentsRequest(BaseModel):
+    sequence_numbers: List[int]
 
-# Dependency for VTTMetadataManager
-def get_vtt_manager():
-    return vtt_manager
+# Dependency for the TrackIndex
+def get_track_index():
+    return track_index
     
 
 class StreamHandler:
     def __init__(self):
         logger.info("StreamHandler -> init method is called!!!")
+        # (kind, track, uri prefix) -> (metadata version, rendered live playlist), every player polls the same text
+        self.playlist_cache = {}
+        # (track, token, uri prefix) -> (metadata version, rendered timeshift playlist), least recently used first
+        self.timeshift_cache = OrderedDict()
+        # resolution -> attributes declared by the origin master playlist, and when it was read
+        self.declared_variants = {}
+        self.declared_variants_read_at = None
+        # (registry versions, bandwidths) -> rendered master playlist
+        self.master_cache = (None, None)
+        # LL-HLS requests held until the part they ask for is registered
+        self.part_waiters = PartWaiters()
+
+    def cached_live_playlist(self, kind, track, uri_prefix=""):
+        ''' Returns the rendered live playlist of the track, None while it has too few segments.
+            It is only rendered again after the metadata of the track changed.
+        '''
+        version = track_index.get_version(track)
+        cached = self.playlist_cache.get((kind, track, uri_prefix))
+        if cached is not None and cached[0] == version:
+            metrics.cache(True)
+            return cached[1]
+        metrics.cache(False)
+        if track_index.get_kind(track) != kind:
+            return None
+        file_key = kind.file_key
+        part_target = track_index.get_part_target(track) if LOW_LATENCY_ENABLED and kind == VIDEO else 0
+        # LL-HLS players keep their distance with PART-HOLD-BACK, the parts follow the newest segment
+        hold_back_segments, hold_back_seconds = (0, 0.0) if part_target else (LIVE_HOLD_BACK_SEGMENTS, LIVE_HOLD_BACK_SECONDS)
+        segments = track_index.get_live_window(track, LIVE_WINDOW_SEGMENTS, LIVE_STARTUP_MIN_SEGMENTS,
+            hold_back_segments, hold_back_seconds)
+        if segments is None:
+            return None
+        if part_target:
+            next_sequence, pending_parts = track_index.get_pending_parts(track)
+            content = render_media_playlist(segments, file_key, track_index.get_target_duration(track),
+                part_target, pending_parts, (next_sequence, len(pending_parts)),
+                lambda sequence_number, part_index: f"part_{track}_{sequence_number}_{part_index}.ts")
+        else:
+            content = render_media_playlist(segments, file_key, track_index.get_target_duration(track),
+                uri_prefix=uri_prefix)
+        self.playlist_cache[(kind, track, uri_prefix)] = (version, content)
+        return content
+
+    def cached_timeshift_playlist(self, track, token, offset, uri_prefix=""):
+        ''' Returns the rendered window trailing the live edge by offset, None without segments.
+            The window only moves when the metadata of the track changes, so every reload
+            of a token in between is served the text rendered for its first request.
+        '''
+        key = (track, token, uri_prefix)
+        version = track_index.get_version(track)
+        cached = self.timeshift_cache.get(key)
+        if cached is not None and cached[0] == version:
+            self.timeshift_cache.move_to_end(key)
+            metrics.cache(True)
+            return cached[1]
+        metrics.cache(False)
+        segments = track_index.get_timeshift_playlist(track, offset, TIMESHIFT_WINDOW_SEGMENTS)
+        if not segments:
+            return None
+        content = render_media_playlist(segments, track_index.get_kind(track).file_key,
+            track_index.get_target_duration(track), uri_prefix=uri_prefix)
+        self.timeshift_cache[key] = (version, content)
+        self.timeshift_cache.move_to_end(key)
+        while len(self.timeshift_cache) > TIMESHIFT_CACHE_ENTRIES:
+            self.timeshift_cache.popitem(last=False)
+        return content
+
+    async def wait_for_part(self, track, sequence_number, part_index):
+        ''' Holds a blocking reload or preload hint request until the part is registered '''
+        timeout = BLOCKING_RELOAD_TARGET_DURATIONS * max(track_index.get_target_duration(track), 1.0)
+        try:
+            await self.part_waiters.wait_for_part(track_index, track, sequence_number, part_index, timeout)
+        except BlockedRequestError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
     async def start_streaming(self, url: str):
         ''' Comment block:
             I 'm not sure the purpose of the start streaming as 
@@ -158,90 +352,139 @@ class StreamHandler:
             logging.error(f"Error starting streaming: {e}")
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
+    async def load_declared_variants(self, resolutions):
+        ''' Reads the origin master playlist once, and again only when a registered
+            rendition is missing from it, at most every DECLARED_VARIANTS_RELOAD_SECONDS
+        '''
+        if all(resolution in self.declared_variants for resolution in resolutions):
+            return
+        now = time.monotonic()
+        if self.declared_variants_read_at is not None and \
+                now - self.declared_variants_read_at < DECLARED_VARIANTS_RELOAD_SECONDS:
+            return
+        self.declared_variants_read_at = now
+        master_playlist_path = SEGMENTS_DIR / MASTER_PLAYLIST_NAME
+        try:
+            async with aiofiles.open(master_playlist_path, 'r') as file:
+                self.declared_variants = parse_variants(await file.read())
+        except FileNotFoundError:
+            logger.warning("Origin master playlist %s not found, only measured bandwidths are listed", master_playlist_path)
+
     @log_time
     async def get_master_playlist(self):
+        ''' The master playlist is rendered from the renditions and languages the
+            ingest registered, not served from disk. It is cached until a track
+            appears or the measured bandwidths change.
+        '''
         try:
-            logger.info("'/playlist.m3u8' api is Entered!!!")
-            master_playlist_path = SEGMENTS_DIR / MASTER_PLAYLIST_NAME #"playlist.m3u8"
-            if not master_playlist_path.exists():
-                logger.info("'/playlist.m3u8' api is Exited!!!\n")
+            resolutions = track_index.get_tracks(VIDEO)
+            if not resolutions:
                 raise HTTPException(status_code=404, detail="Master playlist not found")
+            await self.load_declared_variants(resolutions)
+            measured = bandwidth_stats.measured() if ABR_HINTS_ENABLED else {}
+
+            key = (track_index.registry_version, self.declared_variants_read_at,
+                tuple(sorted(measured.items())))
+            if self.master_cache[0] == key:
+                return Response(content=self.master_cache[1], media_type="application/vnd.apple.mpegurl")
+
+            variants = []
+            for resolution in resolutions:
+                attributes = variant_attributes(resolution, self.declared_variants.get(resolution), measured.get(resolution))
+                if attributes is None:
+                    # neither declared nor measured yet, a variant without BANDWIDTH is invalid
+                    logger.debug("No bandwidth known for %s yet, left out of the master playlist", resolution)
+                    continue
+                variants.append((attributes, f"playlist_{resolution}.m3u8"))
+            if not variants:
+                raise HTTPException(status_code=404, detail="Master playlist not found")
+            subtitles = [(language, f"playlist_webvtt_{language}.m3u8") for language in track_index.get_tracks(SUBTITLES)]
 
-            logger.info(" master playlist content preperation started")                
-
-            async with aiofiles.open(master_playlist_path, 'r') as file:
-                master_playlist_content = await file.read()
-
-            logger.info(" master playlist content preperation successfully completed!!!")                
-            
-            logger.info("'/playlist.m3u8' api now Exited!!!\n")
+            master_playlist_content = render_master_playlist(variants, subtitles)
+            self.master_cache = (key, master_playlist_content)
             return Response(content=master_playlist_content, media_type="application/vnd.apple.mpegurl")
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error fetching master playlist: {e}")
-            logger.info("'/playlist.m3u8' api is Exited!!!\n")
+            logger.error("Error fetching master playlist: %s", e)
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    async def get_timeshift_playlist(self, track: str,
+        playlist_url: str, start: float = None, token: str = None, uri_prefix: str = "",
+        redirect_status: int = 307):
+        ''' Time-shifted playlist
+            A viewer is only an offset behind the live edge. With `start` (epoch
+            seconds) the offset is computed once from the current live edge and
+            the request is redirected to the url carrying it as `token`. Players
+            reload that url, the rendered window trails the live edge by the
+            offset, so it slides forward exactly like a live playlist, with no
+            state on the server.
+        '''
+        try:
+            if token is None:
+                live_edge = track_index.get_live_edge(track)
+                if live_edge is None:
+                    raise HTTPException(status_code=404, detail="No segments to time-shift")
+                offset = max(0.0, live_edge - start)
+                if TIMESHIFT_TOKEN_BUCKET_SECONDS > 0:
+                    offset = math.floor(round(offset, 3) / TIMESHIFT_TOKEN_BUCKET_SECONDS) * TIMESHIFT_TOKEN_BUCKET_SECONDS
+                token = encode_token(offset)
+                # a ?start= url would be resolved against a newer live edge on every reload
+                return RedirectResponse(f"{playlist_url}?token={token}", status_code=redirect_status,
+                    headers={"X-Timeshift-Token": token})
+            offset = decode_token(token)
+
+            content = self.cached_timeshift_playlist(track, token, offset, uri_prefix)
+            if content is None:
+                raise HTTPException(status_code=404, detail="No segments to time-shift")
+
+            headers = {
+                "X-Timeshift-Token": token,
+                # the url to reload, it keeps the viewer at the same offset behind live
+                "Content-Location": f"{playlist_url}?token={token}",
+            }
+            return Response(content=content, media_type="application/vnd.apple.mpegurl", headers=headers)
+        except HTTPException:
+            raise
+        except ValueError as e:
+            logger.error("Invalid timeshift request for %s: %s", track, e)
+            raise HTTPException(status_code=400, detail="Invalid timeshift token")
+        except Exception as e:
+            logger.error("Error fetching timeshift playlist for %s: %s", track, e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
     @log_time
-    async def get_resolution_playlist(self, resolution: str):
+    async def get_resolution_playlist(self, resolution: str, start: float = None, token: str = None,
+        hls_msn: int = None, hls_part: int = None):
         '''
             The below code is for the handling of resolution based
             playlist fetching
         '''
-        logger.info(f'get_resolution_playlist is called for the resolution : {resolution}')
+        logger.debug('get_resolution_playlist is called for the resolution : %s', resolution)
+        if start is not None or token is not None:
+            return await self.get_timeshift_playlist(resolution,
+                f"/playlist_{resolution}.m3u8", start, token)
+        if hls_msn is not None and LOW_LATENCY_ENABLED:
+            # blocking playlist reload, answered once the playlist holds the requested part
+            await self.wait_for_part(resolution, hls_msn, hls_part)
         try:
-            resolution_dir = SEGMENTS_DIR / resolution
-            logger.info(f'resolution_dir : {resolution_dir}')
-            if not resolution_dir.exists():
-                logger.error(f"Resolution directory not found: {resolution_dir}")
-                raise HTTPException(status_code=404, detail="Resolution directory not found")
-
             '''
-                For now we are sorting the complete list everytime which is not the good design
-                and later we will maintain our dynamic container in sorted order and we don't
-                need to sort explicitly, which is the performance booster for this api
-                ::ts_files, is the sorted list of files
+                The window, the per segment durations and the program date time all
+                come from the metadata container, which is kept in sorted order, so
+                nothing is listed or sorted here
             '''
-            ts_files = sorted([f for f in os.listdir(resolution_dir) if f.endswith('.ts')])
-            # Ensure we have at least 20 segments to choose the last 10 from -20th position
-            if len(ts_files) < 20:
-                logger.error(f"Not enough segments to get last 10 from the -20th position: {resolution_dir}")
+            resolution_playlist_content = self.cached_live_playlist(VIDEO, resolution)
+            # None until startup_min_segments can be listed
+            if resolution_playlist_content is None:
+                logger.error("Not enough segments yet for the live playlist: %s", resolution)
                 raise HTTPException(status_code=404, detail="Not enough segments to generate playlist")
 
-            # Get the last 20 segments and then pick the last 10 from these
-            last_20_segments = ts_files[-20:]
-            segments = sorted(last_20_segments)[+10:]
-
-            playlist = []
-            
-            media_sequence = 0
-            # if segments is null that means we don't have any file in the perticular directory
-            if segments:
-                try:
-                    #if this is getting called means that segments is not none
-                    media_sequence = int(segments[0].split("__")[1].split('.')[0])
-                except Exception as e:
-                    logger.error(f"Error parsing media sequence from file name: {segments[0]}, error: {e}")
-                    raise
-            
-            # print the media_sequence of the first ts file among the list files
-            logger.info(f'The media_sequence number for the first sorted ts_file is : {media_sequence}')
-
-            playlist.append("#EXTM3U")
-            playlist.append("#EXT-X-VERSION:3")
-            playlist.append("#EXT-X-TARGETDURATION:7")
-            playlist.append(f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}")
-            
-            # TBD - abinash.km, missing tag in this response :: #EXT-X-PROGRAM-DATE-TIME:2024-06-12T02:28:07.920Z
-            for idx, ts_file in enumerate(segments):
-                playlist.append("#EXTINF:6.00600,")
-                playlist.append(f"{ts_file}")
-            resolution_playlist_content = "\n".join(playlist)
             return Response(content=resolution_playlist_content, media_type="application/vnd.apple.mpegurl")
         except HTTPException as he:
-            logger.error(f"Error fetching resolution playlist: {he}")
+            logger.error("Error fetching resolution playlist: %s", he)
             raise he
         except Exception as e:
-            logger.error(f"Error fetching resolution playlist: {e}")
+            logger.error("Error fetching resolution playlist: %s", e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
     @log_time
@@ -251,157 +494,169 @@ class StreamHandler:
             ts file download
         '''
         # this method is for the download of perticular ts file
-        logger.info(f'resolution: {resolution}, timestamp: {timestamp}, and seq: {seq}')
+        logger.debug('resolution: %s, timestamp: %s, and seq: %s', resolution, timestamp, seq)
         try:
+            if pack_reader:
+                ts_file_content = await asyncio.get_event_loop().run_in_executor(
+                    executor, pack_reader.read, resolution, seq)
+                if ts_file_content is None:
+                    logger.error('The requested segment %s of %s is not packed', seq, resolution)
+                    raise HTTPException(status_code=404, detail="TS file not found")
+                metrics.served(resolution, len(ts_file_content))
+                return Response(content=ts_file_content, media_type="video/MP2T")
+
             resolution_dir = SEGMENTS_DIR / resolution
             ts_file_path = resolution_dir / f"playlist_{resolution}_{timestamp}__{seq}.ts"
-            logger.info(f'ts_file_path: {ts_file_path}')
             if not ts_file_path.exists():
-                logger.error(f'The requested {ts_file_path} does not exist')
+                logger.error('The requested %s does not exist', ts_file_path)
                 raise HTTPException(status_code=404, detail="TS file not found")
 
             async with aiofiles.open(ts_file_path, 'rb') as file:
                 ts_file_content = await file.read()
 
-            logger.info("The ts file download completed successfully!!!")            
+            metrics.served(resolution, len(ts_file_content))
             return Response(content=ts_file_content, media_type="video/MP2T")
         
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error fetching TS file: {e}")
+            logger.error("Error fetching TS file: %s", e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
     @log_time
-    async def get_subtitle_playlist(self):
+    async def get_part_file(self, resolution: str, seq: int, index: int):
+        ''' LL-HLS partial segment, a preload hint request waits until the part is registered '''
+        if not LOW_LATENCY_ENABLED:
+            raise HTTPException(status_code=404, detail="Partial segments are disabled")
+        await self.wait_for_part(resolution, seq, index)
+        part = track_index.get_part(resolution, seq, index)
+        if part is None:
+            raise HTTPException(status_code=404, detail="Part not found")
+        try:
+            async with aiofiles.open(SEGMENTS_DIR / resolution / part["part_file"], 'rb') as file:
+                part_content = await file.read()
+        except FileNotFoundError:
+            logger.error('The part %s of %s is not on disk', part["part_file"], resolution)
+            raise HTTPException(status_code=404, detail="Part not found")
+        except Exception as e:
+            logger.error("Error fetching part: %s", e)
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        metrics.served(resolution, len(part_content))
+        return Response(content=part_content, media_type="video/MP2T")
+
+    @log_time
+    async def get_subtitle_playlist(self, start: float = None, token: str = None, language: str = None):
         ''' Utility method for subtitle playlist manifest
-            This Utility method is designed for the handling of 
-            get_subtitle_playlist method
-            Observations to improve the code ?
+            Without a language it is the eng playlist of /playlist_webvtt.m3u8, which
+            lists the segments by name. The playlist of a language lists them under
+            the language, e.g. fre/playlist_webvtt_022807__837223.vtt.
         '''
-        logger.info("get_subtitle_playlist utility method is called!")
+        logger.debug("get_subtitle_playlist utility method is called for %s", language)
+        uri_prefix, playlist_url = "", "/playlist_webvtt.m3u8"
+        if language is not None:
+            uri_prefix, playlist_url = f"{language}/", f"/playlist_webvtt_{language}.m3u8"
+        language = language or SUBTITLE_DIR_ENG.name
+        if start is not None or token is not None:
+            return await self.get_timeshift_playlist(language,
+                playlist_url, start, token, uri_prefix)
         try:
-            # abinash.km - TBD, as of now added for eng only, will improve
-            # as we get the more clarity and also when the actual metadata
-            # dynamic storage is maintained
-            subtitle_eng_dir = SUBTITLE_DIR_ENG
-            logger.info(f'The subtitle_eng_dir = {subtitle_eng_dir}')
-
-            if not subtitle_eng_dir.exists():
-                logger.error(f"eng sub titles directory not found: {subtitle_eng_dir}")
-                raise HTTPException(status_code=404, detail="eng sub titles directory not found")
-
-            # The below code need to be changed after we able to implement
-            # Dynamic metadata container for handling the metadat for *.ts and *.vtt
-            vtt_files = sorted([f for f in os.listdir(subtitle_eng_dir) if f.endswith('.vtt')])
-
-            if len(vtt_files) < 20:
-                logger.error(f"Not enough segments to get last 10 from the -20th position: {subtitle_eng_dir}")
-                raise HTTPException(status_code=404, detail="Not enough segments to generate playlist")
-
-            # Get the last 20 segments and then pick the last 10 from these
-            last_20_segments = vtt_files[-20:]
-            segments = sorted(last_20_segments)[+10:]
+            subtitle_playlist_content = self.cached_live_playlist(SUBTITLES, language, uri_prefix)
 
-            playlist = []
-            '''
-                If we are getting media_sequence as 0 , it means that 
-                there is no *.vtt files in the directory
-            '''
-            media_sequence = 0
-            if segments:
-                try:
-                    # I 'm trying to extract the sequence number of first .vtt file
-                    # in the last 10 *.vtt file
-                    media_sequence = int(segments[0].split("__")[1].split('.')[0])
-                    logger.info(f'The media_sequence of first vtt file is : {media_sequence}')
-                except Exception as e:
-                    logging.error(f"Error parsing media sequence from file name: {segments[0]}, error: {e}")
-                    raise
-
-            playlist.append("#EXTM3U")
-            playlist.append("#EXT-X-VERSION:3")
-            playlist.append("#EXT-X-TARGETDURATION:7")
-            playlist.append(f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}")
-            ''' TBD - abinash.km, 
-                missing tag in this response :: #EXT-X-PROGRAM-DATE-TIME:2024-06-12T02:28:07.920Z
-                Please note that this tag definately required to be updated when you will complete the
-                metadata storage container is ready and integerated with this code 
-            '''
-
-            for idx, vtt_file in enumerate(segments):
-                playlist.append("#EXTINF:6.00600,")
-                playlist.append(f"{vtt_file}")
+            if subtitle_playlist_content is None:
+                logger.error("Not enough segments yet for the live playlist: %s", language)
+                raise HTTPException(status_code=404, detail="Not enough segments to generate playlist")
 
-            subtitle_playlist_content = "\n".join(playlist)
-            logger.info("This method is completed successfully!")
             return Response(content=subtitle_playlist_content, 
                 media_type="application/vnd.apple.mpegurl")
 
         except HTTPException as he:
-            logger.error(f"Error fetching resolution playlist: {he}")
+            logger.error("Error fetching subtitle playlist: %s", he)
             raise he
 
         except Exception as e:
-            logger.error(f"Error fetching resolution playlist: {e}")
+            logger.error("Error fetching subtitle playlist: %s", e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
     @log_time
-    async def get_vtt_file(self, timestamp: str, seq: int):
+    async def get_vtt_file(self, timestamp: str, seq: int, language: str = None):
         ''' Function brief discription
-            This below code is for downloading the vtt file
+            This below code is for downloading the vtt file, of eng without a language
         '''
-        logger.info(f'The timestamp: {timestamp}, and the seq: {seq}')
+        logger.debug('The language: %s, the timestamp: %s, and the seq: %s', language, timestamp, seq)
+        language = language or SUBTITLE_DIR_ENG.name
+        # only registered languages, the name becomes a directory
+        if track_index.get_kind(language) != SUBTITLES:
+            raise HTTPException(status_code=404, detail="VTT file not found")
         try:
-            ''' Block comment for the title language
-                For now, just statically fixing eng subtitles but later
-                will do more dynamic multi-language support as per the metadata 
-                collected 
-            '''
-            subtitles_eng_dir = SUBTITLE_DIR_ENG
-            vtt_file_path = subtitles_eng_dir / f"playlist_webvtt_{timestamp}__{seq}.vtt"
-            logger.info(f'vtt_file_path: {vtt_file_path}')
+            if pack_reader:
+                vtt_file_content = await asyncio.get_event_loop().run_in_executor(
+                    executor, pack_reader.read, language, seq)
+                if vtt_file_content is None:
+                    logger.error('The requested subtitle segment %s of %s is not packed', seq, language)
+                    raise HTTPException(status_code=404, detail="VTT file not found")
+                metrics.served(language, len(vtt_file_content))
+                return Response(content=vtt_file_content, media_type="text/vtt")
+
+            vtt_file_path = subtitle_dir(language) / f"playlist_webvtt_{timestamp}__{seq}.vtt"
 
             if not vtt_file_path.exists():
-                logger.error(f'vtt_file_path: {vtt_file_path} doesnot exist')
+                logger.error('vtt_file_path: %s doesnot exist', vtt_file_path)
                 raise HTTPException(status_code=404, detail="VTT file not found")
 
             async with aiofiles.open(vtt_file_path, 'rb') as file:
                 vtt_file_content = await file.read()
-            
-            logger.info("The requested vtt file download executed successfully!!!")
+
+            metrics.served(language, len(vtt_file_content))
             return Response(content=vtt_file_content, media_type="text/vtt")
         
+        except HTTPException:
+            raise
         except Exception as e:
-            logging.error(f"Error fetching VTT file: {e}")
+            logger.error("Error fetching VTT file: %s", e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
 
     @log_time
     async def pause_stream(self, client_id: str, timestamp: datetime):
-        try:
-            self.hls_data.pause_data[client_id] = timestamp
-            logging.debug(f"Stream paused for client {client_id} at {timestamp}")
-            return {"status": "paused"}
-        except Exception as e:
-            logging.error(f"Error pausing stream: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
+        ''' Nothing is stored per client, the paused position is handed back
+            and the client passes it to /resume
+        '''
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        logger.debug("Stream paused for client %s at %s", client_id, timestamp)
+        return {"status": "paused", "client_id": client_id, "start": timestamp.timestamp()}
 
     @log_time
-    async def resume_stream(self, client_id: str):
+    async def resume_stream(self, resolution: str, start: float, client_id: str = None):
+        ''' Redirects (303, the POST becomes a GET) to the time-shifted playlist url whose
+            live edge is the paused position, the url the player keeps reloading
+        '''
+        logger.debug("Stream resumed for client %s from %s", client_id, start)
+        return await self.get_timeshift_playlist(resolution,
+            f"/playlist_{resolution}.m3u8", start=start, redirect_status=303)
+
+    @log_time
+    async def seek(self, time: float, resolution: str, languages: str = None, max_segments: int = 10):
+        ''' Aligned DVR windows for a wall clock time (epoch seconds): the segments of the
+            rendition from the one playing at `time`, and the subtitle segments of each
+            language (comma separated, all when missing) over the same time span
+        '''
+        if track_index.get_kind(resolution) != VIDEO:
+            raise HTTPException(status_code=404, detail="Unknown resolution")
+        if languages is None:
+            tracks = track_index.get_tracks(SUBTITLES)
+        else:
+            tracks = [language for language in languages.split(",") if language]
+            if any(track_index.get_kind(language) != SUBTITLES for language in tracks):
+                raise HTTPException(status_code=404, detail="Unknown subtitle language")
         try:
-            if client_id not in self.hls_data.pause_data:
-                raise HTTPException(status_code=404, detail="Client not found")
-            
-            timestamp = self.hls_data.pause_data[client_id]
-            segments = self.hls_data.segment_data.irange(minimum=timestamp, maximum=timestamp + timedelta(minutes=30))
-            
-            playlist = []
-            for ts, (seq, ts_file, vtt_file) in segments:
-                playlist.append({"sequence_number": seq, "ts_file": ts_file, "vtt_file": vtt_file})
-            
-            logging.debug(f"Stream resumed for client {client_id} from {timestamp}")
-            return {"playlist": playlist}
+            found = seek_windows(track_index, seek_cache, time, resolution, tracks,
+                max(1, min(max_segments, SEEK_MAX_SEGMENTS)))
         except Exception as e:
-            logging.error(f"Error resuming stream: {e}")
+            logger.error("Error seeking %s to %s: %s", resolution, time, e)
             raise HTTPException(status_code=500, detail="Internal Server Error")
+        if found is None:
+            raise HTTPException(status_code=404, detail="No segment at the requested time")
+        return Response(content=render_seek_response(time, *found), media_type="application/json")
 
     @log_time
     async def cleanup_data(self):
@@ -446,37 +701,74 @@ async def get_master_playlist():
 
 #This below code is for the GET '/playlist_webvtt.m3u8' fetching of webvtt playlist
 @app.get("/playlist_webvtt.m3u8")
-async def get_subtitle_playlist():
-    logger.info("'/playlist_webvtt.m3u8' api is called!!!")
-    return await stream_handler.get_subtitle_playlist()
+async def get_subtitle_playlist(start: float = None, token: str = None):
+    return await stream_handler.get_subtitle_playlist(start, token)
+
+# Subtitle playlist of any language the ingest registered, before the resolution route it would match
+@app.get("/playlist_webvtt_{language}.m3u8")
+async def get_language_subtitle_playlist(language: str, start: float = None, token: str = None):
+    return await stream_handler.get_subtitle_playlist(start, token, language)
 
 ##########################
 
 #This below code is for the GET '/playlist_{resolution}.m3u8' fetching of webvtt playlist
 @app.get("/playlist_{resolution}.m3u8")
-async def get_resolution_playlist(resolution: str):
-    logger.info("'/playlist_{resolution}.m3u8' is getting called!!!")
-    return await stream_handler.get_resolution_playlist(resolution)
+async def get_resolution_playlist(resolution: str, start: float = None, token: str = None,
+    hls_msn: int = Query(None, alias="_HLS_msn"), hls_part: int = Query(None, alias="_HLS_part")):
+    return await stream_handler.get_resolution_playlist(resolution, start, token, hls_msn, hls_part)
 
 ##########################
 
 @app.get("/playlist_{resolution}_{timestamp}__{seq}.ts")
 async def get_ts_file(resolution: str, timestamp: str, seq: int):
-    logger.info("'/playlist_{resolution}_{timestamp}__{seq}.ts' this api is called!!!")
     return await stream_handler.get_ts_file(resolution, timestamp, seq)
 
+@app.get("/part_{resolution}_{seq}_{index}.ts")
+async def get_part_file(resolution: str, seq: int, index: int):
+    return await stream_handler.get_part_file(resolution, seq, index)
+
 @app.get("/playlist_webvtt_{timestamp}__{seq}.vtt")
 async def get_vtt_file(timestamp: str, seq: int):
-    logger.info("'/playlist_webvtt_{timestamp}__{seq}.vtt' api is called!!!")
     return await stream_handler.get_vtt_file(timestamp, seq)
 
+@app.get("/{language}/playlist_webvtt_{timestamp}__{seq}.vtt")
+async def get_language_vtt_file(language: str, timestamp: str, seq: int):
+    return await stream_handler.get_vtt_file(timestamp, seq, language)
+
 @app.post("/pause")
 async def pause_stream(client_id: str, timestamp: datetime):
     return await stream_handler.pause_stream(client_id, timestamp)
 
 @app.post("/resume")
-async def resume_stream(client_id: str):
-    return await stream_handler.resume_stream(client_id)
+async def resume_stream(resolution: str, start: float, client_id: str = None):
+    return await stream_handler.resume_stream(resolution, start, client_id)
+
+# One lookup for a synchronized DVR seek of a rendition and its subtitles
+@app.get("/seek")
+async def seek(time: float, resolution: str, languages: str = None, max_segments: int = 10):
+    return await stream_handler.seek(time, resolution, languages, max_segments)
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Collapsed stacks of every thread, e.g. curl .../debug/profile?seconds=10 | flamegraph.pl > hls.svg
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}]")
+    # the sampling waits in the thread pool, the event loop keeps serving and is profiled meanwhile
+    stacks = await asyncio.get_running_loop().run_in_executor(executor, profile, seconds,
+        PROFILING_CONFIG.get("profile_interval_ms", 5) / 1000)
+    return Response(content=stacks + "\n", media_type="text/plain")
+
+@app.get("/debug/slow_requests")
+async def debug_slow_requests():
+    if slow_requests is None:
+        raise HTTPException(status_code=404, detail="Slow request capture is disabled")
+    return {"threshold_ms": slow_requests.threshold_ms, "requests": slow_requests.recent()}
 
 @app.post("/cleanup")
 async def cleanup_data():
@@ -484,46 +776,123 @@ async def cleanup_data():
 
 #############newly added metadata handling of api's####################
 
+def add_ts_segments(manager, resolution, segments):
+    # a malformed segment or a name registered as another kind is the client's error, nothing is added
+    try:
+        added = manager.add_segments(VIDEO, resolution, [(segment.date, segment.start_timestamp,
+            segment.sequence_number, segment.duration, segment.ts_file) for segment in segments])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error adding TS metadata: {e}")
+    for segment in segments:
+        if segment.size:
+            bandwidth_stats.record(resolution, segment.sequence_number, segment.size, segment.duration)
+    stream_handler.part_waiters.notify(resolution)
+    return added
+
+def add_vtt_segments(manager, language, segments):
+    try:
+        return manager.add_segments(SUBTITLES, language, [(segment.date, segment.start_timestamp,
+            segment.sequence_number, segment.duration, segment.vtt_file) for segment in segments])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error adding VTT metadata: {e}")
+
 # Adding the code for handling the Metadata for ts and vtt files
 @app.post("/add_tsmetadata")
 async def add_tsmetadata(request: TSMetadataRequest, 
-    manager: TSMetadataManager = Depends(get_ts_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
-        manager.add_tsmetadata(request.resolution, request.date, request.start_timestamp, request.sequence_number, request.duration, request.ts_file)
+        add_ts_segments(manager, request.resolution, [request])
         return {"status": "TS metadata added successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding TS metadata: {e}")
 
+# Every segment of one playlist reload, hls-download posts these instead of one request per segment
+@app.post("/add_tsmetadata_batch")
+async def add_tsmetadata_batch(request: TSMetadataBatchRequest,
+    manager: TrackIndex = Depends(get_track_index)):
+    try:
+        added = add_ts_segments(manager, request.resolution, request.segments)
+        return {"status": "TS metadata added successfully", "added": added}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding TS metadata: {e}")
+
+# LL-HLS partial segment, posted by hls-download once the part is on disk
+@app.post("/add_tspart")
+async def add_tspart(request: TSPartRequest,
+    manager: TrackIndex = Depends(get_track_index)):
+    try:
+        manager.add_part(VIDEO, request.resolution, request.sequence_number, request.part_index, request.duration, request.part_file, request.independent)
+        stream_handler.part_waiters.notify(request.resolution)
+        return {"status": "TS part added successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding TS part: {e}")
+
 @app.post("/add_vttmetadata")
 async def add_vttmetadata(request: VTTMetadataRequest, 
-    manager: VTTMetadataManager = Depends(get_vtt_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
-        manager.add_vttmetadata(request.language, request.date, request.start_timestamp, request.sequence_number, request.duration, request.vtt_file)
+        add_vtt_segments(manager, request.language, [request])
         return {"status": "VTT metadata added successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding VTT metadata: {e}")
+
+@app.post("/add_vttmetadata_batch")
+async def add_vttmetadata_batch(request: VTTMetadataBatchRequest,
+    manager: TrackIndex = Depends(get_track_index)):
+    try:
+        added = add_vtt_segments(manager, request.language, request.segments)
+        return {"status": "VTT metadata added successfully", "added": added}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding VTT metadata: {e}")
 
 @app.delete("/remove_tsmetadata/{resolution}/{sequence_number}")
 async def remove_tsmetadata(resolution: str, sequence_number: int, 
-    manager: TSMetadataManager = Depends(get_ts_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
-        manager.remove_tsmetadata(resolution, sequence_number)
+        manager.remove_segment(resolution, sequence_number)
         return {"status": "TS metadata removed successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing TS metadata: {e}")
 
+# The segments one cleanup pass deleted from a track, evicted under one lock
+@app.post("/remove_tsmetadata_batch/{resolution}")
+async def remove_tsmetadata_batch(resolution: str, request: RemoveSegmentsRequest,
+    manager: TrackIndex = Depends(get_track_index)):
+    try:
+        removed = manager.remove_segments(resolution, request.sequence_numbers)
+        return {"status": "TS metadata removed successfully", "removed": removed}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error removing TS metadata: {e}")
+
 @app.delete("/remove_vttmetadata/{language}/{sequence_number}")
 async def remove_vttmetadata(language: str, sequence_number: int, 
-    manager: VTTMetadataManager = Depends(get_vtt_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
-        manager.remove_vttmetadata(language, sequence_number)
+        manager.remove_segment(language, sequence_number)
         return {"status": "VTT metadata removed successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing VTT metadata: {e}")
 
+@app.post("/remove_vttmetadata_batch/{language}")
+async def remove_vttmetadata_batch(language: str, request: RemoveSegmentsRequest,
+    manager: TrackIndex = Depends(get_track_index)):
+    try:
+        removed = manager.remove_segments(language, request.sequence_numbers)
+        return {"status": "VTT metadata removed successfully", "removed": removed}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error removing VTT metadata: {e}")
+
 @app.get("/get_live_tsplaylist/{resolution}")
 async def get_live_tsplaylist(resolution: str, max_segments: int = 10, 
-    manager: TSMetadataManager = Depends(get_ts_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
         data = manager.get_live_playlist(resolution, max_segments)
         return data
@@ -533,7 +902,7 @@ async def get_live_tsplaylist(resolution: str, max_segments: int = 10,
 @app.get("/get_dvr_tsplaylist/{resolution}")
 async def get_dvr_tsplaylist(resolution: str, date: str, 
     timestamp: str, max_segments: int = 10, 
-    manager: TSMetadataManager = Depends(get_ts_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
         data = manager.get_dvr_playlist(resolution, date, timestamp, max_segments)
         return data
@@ -542,7 +911,7 @@ async def get_dvr_tsplaylist(resolution: str, date: str,
 
 @app.get("/get_live_vttplaylist/{language}")
 async def get_live_vttplaylist(language: str, max_segments: int = 10, 
-    manager: VTTMetadataManager = Depends(get_vtt_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
         data = manager.get_live_playlist(language, max_segments)
         return data
@@ -552,7 +921,7 @@ async def get_live_vttplaylist(language: str, max_segments: int = 10,
 @app.get("/get_dvr_vttplaylist/{language}")
 async def get_dvr_vttplaylist(language: str, date: str, 
     timestamp: str, max_segments: int = 10, 
-    manager: VTTMetadataManager = Depends(get_vtt_manager)):
+    manager: TrackIndex = Depends(get_track_index)):
     try:
         data = manager.get_dvr_playlist(language, date, timestamp, max_segments)
         return data
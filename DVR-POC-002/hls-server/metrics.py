@@ -0,0 +1,204 @@
+# metrics.py
+
+import time
+from collections import defaultdict
+from threading import Lock
+
+'''
+    In-process metrics for hls-server, exposed at /metrics in the Prometheus
+    text format.
+
+    Recording is a few integer operations with no lock: the request handlers
+    all run on the event loop thread. A metric updated from more than one
+    thread can lose an increment now and then, which is fine for monitoring
+    and much cheaper than a lock on every request.
+
+    Latencies go into HDR-style histograms: log-linear buckets with
+    2**SUB_BUCKET_BITS sub buckets per power of two (about 12% relative
+    error), in microseconds, so percentiles stay accurate from a cached
+    playlist hit to a slow disk read with a fixed, small memory footprint.
+'''
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + ((value >> shift) - SUB_BUCKETS)
+
+
+def bucket_upper_bound(index):
+    '''Largest value which falls into the bucket'''
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    sub_bucket = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * 64 * SUB_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        micros = int(seconds * 1_000_000)
+        self.counts[bucket_index(micros)] += 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+
+    def percentile(self, percent):
+        '''Upper bound of the bucket holding the percentile, in seconds'''
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bucket_upper_bound(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def cumulative(self):
+        '''(le seconds, cumulative count) at every power of two microseconds up to the max'''
+        buckets = []
+        seen = 0
+        next_index = 0
+        bound = 1
+        while True:
+            limit = bucket_index(bound)
+            while next_index <= limit:
+                seen += self.counts[next_index]
+                next_index += 1
+            buckets.append((bound / 1_000_000, seen))
+            if bound >= self.max:
+                return buckets
+            bound = bound * 2 + 1
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = defaultdict(LatencyHistogram)
+        self.lock_wait = defaultdict(LatencyHistogram)
+        self.in_flight = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.bytes_served = defaultdict(int)
+        self.playlist_cache = {"hit": 0, "miss": 0}
+        # name -> callable returning {label value: number}, read at scrape time
+        self.gauges = {}
+
+    def observe_request(self, route, status, seconds):
+        self.latency[route].record(seconds)
+        self.requests[(route, status)] += 1
+
+    def served(self, track, size):
+        self.bytes_served[track] += size
+
+    def cache(self, hit):
+        self.playlist_cache["hit" if hit else "miss"] += 1
+
+    def register_gauge(self, name, label, read):
+        self.gauges[name] = (label, read)
+
+    def render(self):
+        lines = []
+        add = lines.append
+
+        add("# TYPE hls_request_duration_seconds histogram")
+        for route, histogram in sorted(self.latency.items()):
+            for le, count in histogram.cumulative():
+                add(f'hls_request_duration_seconds_bucket{{route="{route}",le="{le:.6f}"}} {count}')
+            add(f'hls_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {histogram.count}')
+            add(f'hls_request_duration_seconds_sum{{route="{route}"}} {histogram.total / 1_000_000:.6f}')
+            add(f'hls_request_duration_seconds_count{{route="{route}"}} {histogram.count}')
+
+        add("# TYPE hls_request_duration_quantile_seconds gauge")
+        for route, histogram in sorted(self.latency.items()):
+            for quantile in (50, 99, 99.9):
+                add(f'hls_request_duration_quantile_seconds{{route="{route}",quantile="{quantile / 100}"}} '
+                    f'{histogram.percentile(quantile):.6f}')
+
+        add("# TYPE hls_requests_total counter")
+        for (route, status), count in sorted(self.requests.items()):
+            add(f'hls_requests_total{{route="{route}",status="{status}"}} {count}')
+
+        add("# TYPE hls_requests_in_flight gauge")
+        for kind, count in sorted(self.in_flight.items()):
+            add(f'hls_requests_in_flight{{kind="{kind}"}} {count}')
+
+        add("# TYPE hls_bytes_served_total counter")
+        for track, size in sorted(self.bytes_served.items()):
+            add(f'hls_bytes_served_total{{track="{track}"}} {size}')
+
+        add("# TYPE hls_playlist_cache_total counter")
+        for result, count in self.playlist_cache.items():
+            add(f'hls_playlist_cache_total{{result="{result}"}} {count}')
+        lookups = self.playlist_cache["hit"] + self.playlist_cache["miss"]
+        add("# TYPE hls_playlist_cache_hit_ratio gauge")
+        add(f'hls_playlist_cache_hit_ratio {self.playlist_cache["hit"] / lookups if lookups else 0.0:.4f}')
+
+        add("# TYPE hls_lock_wait_seconds summary")
+        for name, histogram in sorted(self.lock_wait.items()):
+            for quantile in (50, 99, 99.9):
+                add(f'hls_lock_wait_seconds{{lock="{name}",quantile="{quantile / 100}"}} '
+                    f'{histogram.percentile(quantile):.6f}')
+            add(f'hls_lock_wait_seconds_sum{{lock="{name}"}} {histogram.total / 1_000_000:.6f}')
+            add(f'hls_lock_wait_seconds_count{{lock="{name}"}} {histogram.count}')
+
+        for name, (label, read) in sorted(self.gauges.items()):
+            add(f"# TYPE {name} gauge")
+            for value, number in sorted(read().items()):
+                add(f'{name}{{{label}="{value}"}} {number}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+    '''A Lock which records how long every acquire waited'''
+    def __init__(self, histogram):
+        self.lock = Lock()
+        self.histogram = histogram
+
+    def __enter__(self):
+        if self.lock.acquire(blocking=False):
+            self.histogram.record(0.0)
+            return self
+        started = time.perf_counter()
+        self.lock.acquire()
+        self.histogram.record(time.perf_counter() - started)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def request_kind(path):
+    # in-flight requests are counted per kind, the route is only known once routing ran
+    extension = path.rsplit('.', 1)[-1] if '.' in path else ''
+    return {"m3u8": "playlist", "ts": "segment", "vtt": "subtitle"}.get(extension, "api")
+
+
+def metrics_middleware(app, metrics):
+    '''Registers the http middleware measuring every request by its route template'''
+    @app.middleware("http")
+    async def measure(request, call_next):
+        started = time.perf_counter()
+        kind = request_kind(request.url.path)
+        metrics.in_flight[kind] += 1
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.in_flight[kind] -= 1
+            # the template keeps the label set bounded, /playlist_{resolution}.m3u8 not every url
+            route = request.scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            metrics.observe_request(route, status, time.perf_counter() - started)
@@ -0,0 +1,114 @@
+# playlist_renderer.py
+
+import math
+import re
+
+'''
+    Renders media playlists from the segment dicts returned by the metadata
+    managers, e.g.
+        {"sequence_number": 837223, "date": "2024-06-12", "start_timestamp": "02:28:07.920",
+         "duration": 6.006, "ts_file": "playlist_1920x1080_022807__837223.ts"}
+
+    With a part_target the playlist is LL-HLS: the "parts" of the newest
+    segments and the parts of the segment being produced are listed as
+    EXT-X-PART, followed by a preload hint for the next part.
+
+    The master playlist is rendered from the renditions and subtitle
+    languages the managers registered, with the attributes the origin
+    declared for them.
+'''
+
+# CODECS="avc1.64001f,mp4a.40.2" holds a comma, attribute lists are not split on ","
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def render_part(part, uri):
+    independent = ",INDEPENDENT=YES" if part.get("independent") else ""
+    return f'#EXT-X-PART:DURATION={part["duration"]:.5f},URI="{uri}"{independent}'
+
+
+def render_media_playlist(segments, file_key, target_duration=None,
+                          part_target=None, pending_parts=(), next_part=None, part_uri=None, uri_prefix=""):
+    if target_duration is None:
+        target_duration = max((segment["duration"] for segment in segments), default=0)
+
+    media_sequence = segments[0]["sequence_number"] if segments else 0
+    playlist = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:6" if part_target else "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{math.ceil(target_duration)}",
+        f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}",
+    ]
+    if part_target:
+        # players start three parts behind the live edge and reload with _HLS_msn/_HLS_part
+        playlist.append(f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * part_target:.3f}")
+        playlist.append(f"#EXT-X-PART-INF:PART-TARGET={part_target:.5f}")
+    for segment in segments:
+        # the PDT of every segment lets the player seek by wall clock exactly
+        playlist.append(f"#EXT-X-PROGRAM-DATE-TIME:{segment['date']}T{segment['start_timestamp']}Z")
+        if part_target:
+            for part in segment.get("parts", ()):
+                playlist.append(render_part(part, part_uri(segment["sequence_number"], part["part_index"])))
+        playlist.append(f"#EXTINF:{segment['duration']:.5f},")
+        playlist.append(uri_prefix + segment[file_key])
+    if part_target:
+        for part in pending_parts:
+            playlist.append(render_part(part, part_uri(next_part[0], part["part_index"])))
+        if next_part is not None:
+            playlist.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{part_uri(*next_part)}"')
+    return "\n".join(playlist)
+
+
+# the attributes which describe a variant itself, group references (AUDIO, SUBTITLES,
+# CLOSED-CAPTIONS) point at renditions of the origin and are replaced by this server's
+VARIANT_ATTRIBUTES = ("BANDWIDTH", "AVERAGE-BANDWIDTH", "RESOLUTION", "CODECS", "FRAME-RATE")
+SUBTITLE_GROUP = "subs"
+
+
+def parse_variants(content):
+    '''{RESOLUTION: [(name, value), ...]} of the EXT-X-STREAM-INF lines of an origin master playlist'''
+    variants = {}
+    for line in content.splitlines():
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attributes = ATTRIBUTE_PATTERN.findall(line.split(":", 1)[1])
+            resolution = dict(attributes).get("RESOLUTION")
+            if resolution:
+                variants[resolution] = attributes
+    return variants
+
+
+def variant_attributes(resolution, declared=None, measured=None):
+    '''
+        The attributes of a variant: the declared ones, with BANDWIDTH and
+        AVERAGE-BANDWIDTH replaced by the measured (peak, average) when there
+        are measurements. None when neither gives a BANDWIDTH, which is required.
+    '''
+    attributes = [(name, value) for name, value in declared or () if name in VARIANT_ATTRIBUTES]
+    if measured:
+        peak, average = measured
+        attributes = [("BANDWIDTH", str(peak)), ("AVERAGE-BANDWIDTH", str(average))] + \
+            [(name, value) for name, value in attributes if name not in ("BANDWIDTH", "AVERAGE-BANDWIDTH")]
+    names = dict(attributes)
+    if "BANDWIDTH" not in names:
+        return None
+    if "RESOLUTION" not in names:
+        attributes.append(("RESOLUTION", resolution))
+    return attributes
+
+
+def render_master_playlist(variants, subtitles=()):
+    '''
+        variants: [(attributes, uri)] highest BANDWIDTH first, subtitles: [(language, uri)].
+        Every variant refers to the one subtitle group, the first language is the default.
+    '''
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for index, (language, uri) in enumerate(subtitles):
+        default = "YES" if index == 0 else "NO"
+        lines.append(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="{SUBTITLE_GROUP}",NAME="{language}",'
+                     f'LANGUAGE="{language}",DEFAULT={default},AUTOSELECT=YES,URI="{uri}"')
+    for attributes, uri in sorted(variants, key=lambda variant: -int(dict(variant[0])["BANDWIDTH"])):
+        if subtitles:
+            attributes = attributes + [("SUBTITLES", f'"{SUBTITLE_GROUP}"')]
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(f"{name}={value}" for name, value in attributes))
+        lines.append(uri)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,136 @@
+# profiler.py
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+'''
+    Opt-in sampling profiler for hls-server
+
+    A daemon thread takes the stack of every thread with
+    sys._current_frames() each interval. The target threads are never
+    interrupted, the cost is the sampling thread's share of the GIL, about
+    1% at 100 samples per second.
+
+    Stacks are returned in the collapsed format of flamegraph.pl and
+    speedscope, one line per distinct stack with its sample count:
+        MainThread;main.py:<module>;...;main.py:get_resolution_playlist 12
+
+    /debug/profile?seconds=N samples for N seconds on demand. With
+    slow_request_ms set a sampler runs all the time into a ring buffer, and
+    every request slower than that keeps the samples taken while it ran.
+    The handlers share the event loop thread, so the stacks of a request
+    which awaited may include other requests; a request which blocked the
+    loop (the usual cause of a slow one) is all its own samples.
+'''
+
+# Rendered frame labels, one per code object, so a sample costs no string formatting
+_labels = {}
+
+
+def frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return label
+
+
+class StackSampler:
+    def __init__(self, interval=0.01, capacity=6000):
+        self.interval = interval
+        # (monotonic time, thread name, code objects root first)
+        self.samples = deque(maxlen=capacity)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        now = time.monotonic()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((now, names.get(ident, str(ident)), tuple(stack)))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def between(self, start, end):
+        # deque iteration is not safe against the sampler appending, so copy first
+        return [sample for sample in list(self.samples) if start <= sample[0] <= end]
+
+
+def collapse(samples):
+    '''Collapsed stack lines "thread;frame;...;leaf count", most frequent first'''
+    counts = Counter((name,) + stack for _, name, stack in samples)
+    return "\n".join(f"{';'.join([key[0]] + [frame_label(code) for code in key[1:]])} {count}"
+                     for key, count in counts.most_common())
+
+
+def profile(seconds, interval=0.005):
+    '''Samples all threads for `seconds`, blocks the calling thread'''
+    sampler = StackSampler(interval, capacity=int(seconds / interval) * 64 + 1).start()
+    time.sleep(seconds)
+    sampler.stop()
+    return collapse(sampler.samples)
+
+
+class SlowRequestRecorder:
+    def __init__(self, sampler, threshold_ms=250.0, capacity=50):
+        self.sampler = sampler
+        self.threshold_ms = threshold_ms
+        self.requests = deque(maxlen=capacity)
+        self.logger = logging.getLogger(__name__)
+
+    def record(self, method, path, route, status, started, finished):
+        duration_ms = (finished - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        samples = self.sampler.between(started, finished)
+        self.requests.append({
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "at": time.time() - (time.monotonic() - started),
+            "samples": len(samples),
+            "stacks": collapse(samples),
+        })
+        self.logger.warning("Slow request %s %s: %.1f ms, %d stack samples kept", method, path, duration_ms, len(samples))
+
+    def recent(self):
+        return list(self.requests)
+
+
+def slow_request_middleware(app, recorder):
+    '''Registers the http middleware which hands every request's timing to the recorder'''
+    @app.middleware("http")
+    async def capture_slow(request, call_next):
+        started = time.monotonic()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            recorder.record(request.method, request.url.path, route.path if route is not None else "unmatched",
+                            status, started, time.monotonic())
@@ -0,0 +1,86 @@
+# seek.py
+
+import json
+import math
+import time
+from collections import OrderedDict
+
+from timeshift import key_to_epoch
+
+'''
+    Synchronized DVR seek for /seek
+
+    One lookup of the track index returns the window of the chosen rendition
+    starting at a wall clock time, and the subtitle segments which overlap
+    that window's time span, so video and subtitles agree at segment
+    boundaries.
+
+    Viewers scrubbing the same stream ask for nearby times, so the response
+    is computed for the start of the time bucket and cached per
+    (bucket, rendition, languages, max_segments). Only "time" and "offset"
+    (seconds from the window start to the requested time) are per request.
+    Entries expire after ttl_seconds, a window near the live edge or at the
+    eviction end does not stay stale for longer than that.
+'''
+
+
+class SeekCache:
+    def __init__(self, bucket_seconds=1.0, ttl_seconds=2.0, max_entries=10000, clock=time.monotonic):
+        self.bucket_seconds = bucket_seconds
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        # key -> (expires at, window start epoch, serialized windows), least recently used first
+        self.entries = OrderedDict()
+        self.lookups = {"hit": 0, "miss": 0}
+
+    def bucket(self, epoch):
+        return math.floor(epoch / self.bucket_seconds) * self.bucket_seconds
+
+    def get(self, key):
+        cached = self.entries.get(key)
+        if cached is None or cached[0] <= self.clock():
+            self.lookups["miss"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.lookups["hit"] += 1
+        return cached[1], cached[2]
+
+    def put(self, key, start_epoch, body):
+        self.entries[key] = (self.clock() + self.ttl_seconds, start_epoch, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def seek_windows(track_index, cache, epoch, resolution, languages, max_segments):
+    '''
+        (window start epoch, serialized windows) for a seek to epoch, None when the
+        rendition has no segment there. Computed once per bucket and track set.
+    '''
+    key = (cache.bucket(epoch), resolution, tuple(languages), max_segments)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    windows = track_index.aligned_windows(key[0], resolution, languages, max_segments)
+    if windows is not None:
+        start_epoch, body = serialize_windows(windows, resolution)
+        cache.put(key, start_epoch, body)
+        return start_epoch, body
+    # the bucket starts in a gap or before the oldest segment, the time itself may still be
+    # indexed. Not cached, another time of the bucket may be before this window starts.
+    windows = track_index.aligned_windows(epoch, resolution, languages, max_segments)
+    if windows is None:
+        return None
+    return serialize_windows(windows, resolution)
+
+
+def serialize_windows(windows, resolution):
+    segments = windows.pop(resolution)
+    start_epoch = key_to_epoch(segments[0]["date"], segments[0]["start_timestamp"])
+    return start_epoch, json.dumps({"resolution": resolution, "segments": segments, "subtitles": windows})
+
+
+def render_seek_response(epoch, start_epoch, body):
+    # the cached windows with the per request fields in front
+    return f'{{"time": {epoch}, "offset": {round(epoch - start_epoch, 3)}, {body[1:]}'
@@ -0,0 +1,92 @@
+# segment_pack.py
+
+import os
+import mmap
+import struct
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+'''
+    Reader for the packed segment container written by hls-download
+    (see hls-download/segment_pack.py for the full layout, keep both in sync)
+
+        {track}/pack_{track}_{pack_id:010d}.dat  -> raw segment bytes
+        {track}/pack_{track}_{pack_id:010d}.idx  -> fixed width (offset, length) slots
+
+    The index of a pack is mmap'ed and the data file descriptor is kept open
+    in a small LRU, so serving a segment is one slot lookup plus one pread(),
+    there is no open()/stat() per request.
+'''
+INDEX_RECORD = struct.Struct('<QI')
+
+
+def pack_file_names(track, pack_id):
+    base = f"pack_{track}_{pack_id:010d}"
+    return f"{base}.dat", f"{base}.idx"
+
+
+class SegmentPackReader:
+    def __init__(self, root_dir, segments_per_pack=100, max_open_packs=64, logger=None):
+        self.root_dir = Path(root_dir)
+        self.segments_per_pack = segments_per_pack
+        self.max_open_packs = max_open_packs
+        # (track, pack_id) -> (data_fd, index_mmap), least recently used first
+        self.open_packs = OrderedDict()
+        self.lock = Lock()
+        self.logger = logger
+
+    def _open_pack(self, track, pack_id):
+        key = (track, pack_id)
+        pack = self.open_packs.get(key)
+        if pack:
+            self.open_packs.move_to_end(key)
+            return pack
+
+        data_name, index_name = pack_file_names(track, pack_id)
+        track_dir = self.root_dir / track
+        try:
+            with open(track_dir / index_name, 'rb') as index_file:
+                index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            data_fd = os.open(track_dir / data_name, os.O_RDONLY)
+        except (FileNotFoundError, ValueError):
+            # ValueError: the index exists but has not been sized by the writer yet
+            return None
+
+        pack = (data_fd, index_map)
+        self.open_packs[key] = pack
+        if len(self.open_packs) > self.max_open_packs:
+            _, (old_fd, old_map) = self.open_packs.popitem(last=False)
+            old_map.close()
+            os.close(old_fd)
+        return pack
+
+    def read(self, track, sequence_number):
+        '''Returns the segment bytes or None if the segment is not packed'''
+        pack_id, slot = divmod(sequence_number, self.segments_per_pack)
+        with self.lock:
+            pack = self._open_pack(track, pack_id)
+            if pack is None:
+                return None
+            data_fd, index_map = pack
+            start = slot * INDEX_RECORD.size
+            if start + INDEX_RECORD.size > len(index_map):
+                return None
+            offset, length = INDEX_RECORD.unpack_from(index_map, start)
+            if length == 0:
+                return None
+            # read under the lock, an LRU eviction must not close the fd under us
+            content = os.pread(data_fd, length, offset)
+
+        if len(content) != length:
+            if self.logger:
+                self.logger.error(f"Short read for segment {sequence_number} of track {track}: {len(content)}/{length} bytes")
+            return None
+        return content
+
+    def close(self):
+        with self.lock:
+            for data_fd, index_map in self.open_packs.values():
+                index_map.close()
+                os.close(data_fd)
+            self.open_packs.clear()
@@ -0,0 +1,45 @@
+from bandwidth import BandwidthStats, RollingBitrate
+from playlist_renderer import render_master_playlist, parse_variants, variant_attributes
+
+
+def test_rolling_peak_and_average_follow_the_window():
+    rolling = RollingBitrate(window_segments=3)
+    for sequence_number, size in enumerate([600_000, 300_000, 150_000, 150_000]):
+        rolling.record(sequence_number, size, 6.0)
+    # 600 kB left the window, the peak is 300 kB / 6 s
+    assert rolling.peak() == 400_000
+    assert rolling.average() == (300_000 + 150_000 + 150_000) * 8 // 18
+    # a segment reported again is not counted twice
+    assert not rolling.record(3, 150_000, 6.0)
+    for sequence_number in range(4, 7):
+        rolling.record(sequence_number, 75_000, 6.0)
+    assert rolling.peak() == rolling.average() == 100_000
+
+
+def test_master_playlist_gets_measured_bandwidths():
+    stats = BandwidthStats(window_segments=10, min_segments=2)
+    for sequence_number in range(2):
+        stats.record("1280x720", sequence_number, 1_500_000 + sequence_number * 750_000, 6.0)
+    stats.record("640x360", 0, 600_000, 6.0)
+    declared = parse_variants("\n".join([
+        "#EXTM3U",
+        '#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2",AUDIO="aac"',
+        "playlist_1280x720.m3u8",
+        "#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360",
+        "playlist_640x360.m3u8",
+    ]))
+    measured = stats.measured()
+    variants = [(variant_attributes(resolution, declared.get(resolution), measured.get(resolution)),
+                 f"playlist_{resolution}.m3u8") for resolution in ("640x360", "1280x720")]
+    # a rendition the origin did not declare and with too few measurements has no BANDWIDTH yet
+    assert variant_attributes("384x216", None, measured.get("384x216")) is None
+
+    lines = render_master_playlist(variants, [("eng", "playlist_webvtt_eng.m3u8")]).splitlines()
+    assert lines[2] == ('#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="eng",LANGUAGE="eng",'
+                        'DEFAULT=YES,AUTOSELECT=YES,URI="playlist_webvtt_eng.m3u8"')
+    # highest bandwidth first, the origin's AUDIO group is not listed here
+    assert lines[3] == ('#EXT-X-STREAM-INF:BANDWIDTH=3000000,AVERAGE-BANDWIDTH=2500000,'
+                        'RESOLUTION=1280x720,CODECS="avc1.64001f,mp4a.40.2",SUBTITLES="subs"')
+    assert lines[4] == "playlist_1280x720.m3u8"
+    # one segment is not enough, the declared value stays
+    assert lines[5] == '#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,SUBTITLES="subs"'
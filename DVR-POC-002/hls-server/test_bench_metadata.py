@@ -0,0 +1,17 @@
+from bench_metadata import find_regressions, run_suite
+
+
+def test_find_regressions():
+    baseline = {"a": {"ops_per_sec": 1000.0}, "b": {"bytes_per_segment": 500.0}, "c": {"ops_per_sec": 10.0}}
+    results = {"a": {"ops_per_sec": 700.0}, "b": {"bytes_per_segment": 520.0}, "c": {"ops_per_sec": 50.0},
+               "new": {"ops_per_sec": 1.0}}
+    regressions = find_regressions(results, baseline, 0.2)
+    assert [(case, metric) for case, metric, *_ in regressions] == [("a", "ops_per_sec")]
+    assert find_regressions({"b": {"bytes_per_segment": 700.0}}, baseline, 0.2)[0][0] == "b"
+
+
+def test_suite_smoke():
+    results = run_suite([30], [2], [(1, 1)], min_seconds=0.005, contention_seconds=0.05)
+    assert results["ts.get_live_window[window=30,renditions=2]"]["ops_per_sec"] > 0
+    assert results["memory[window=30,renditions=2]"]["bytes_per_segment"] > 0
+    assert "contention[window=30,renditions=2,readers=1,writers=1]" in results
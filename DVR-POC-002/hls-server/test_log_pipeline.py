@@ -0,0 +1,44 @@
+import logging
+import queue
+
+from log_pipeline import AccessLogSampler, NonBlockingQueueHandler
+
+
+def test_records_are_formatted_by_the_writer_not_the_caller():
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue)
+    record = logging.LogRecord("hls", logging.INFO, __file__, 1, "segment %s of %s, %.1fs", (42, "1280x720", 6.0), None)
+    handler.handle(record)
+    queued = log_queue.get_nowait()
+    assert (queued.msg, queued.args) == ("segment %s of %s, %.1fs", (42, "1280x720", 6.0))
+    assert queued.getMessage() == "segment 42 of 1280x720, 6.0s"
+
+
+def test_mutable_args_are_rendered_by_the_caller():
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue)
+    segment = {"sequence_number": 1}
+    handler.handle(logging.LogRecord("hls", logging.INFO, __file__, 1, "added %s", (segment,), None))
+    # the event loop changes the entry before the writer thread gets to the record
+    segment["sequence_number"] = 2
+    assert log_queue.get_nowait().getMessage() == "added {'sequence_number': 1}"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(logging.LogRecord("hls", logging.INFO, __file__, 1, "line", (), None))
+    assert handler.dropped == 2
+
+
+def test_sampler_keeps_errors_and_slow_requests():
+    sampler = AccessLogSampler(rate=0.0, slow_ms=500)
+
+    def record(status, duration_ms):
+        r = logging.LogRecord("hls.access", logging.INFO, __file__, 1, "", (), None)
+        r.status, r.duration_ms = status, duration_ms
+        return r
+
+    assert not sampler.filter(record(200, 3.0))
+    assert sampler.filter(record(404, 3.0))
+    assert sampler.filter(record(200, 900.0))
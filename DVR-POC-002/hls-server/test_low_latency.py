@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+import pytest
+
+from low_latency import BlockedRequestError, PartWaiters
+from playlist_renderer import render_media_playlist
+from track_index import TrackIndex, VIDEO
+
+TRACK = '1280x720'
+
+
+def add_segment(manager, sequence_number):
+    seconds = sequence_number * 4
+    manager.add_segment(VIDEO, TRACK, '2024-07-16', f"10:{seconds // 60:02d}:{seconds % 60:02d}.000", sequence_number, 4.0,
+                           f"playlist_{TRACK}_10{seconds // 60:02d}{seconds % 60:02d}__{sequence_number}.ts")
+
+
+def add_parts(manager, sequence_number, count):
+    for index in range(count):
+        manager.add_part(VIDEO, TRACK, sequence_number, index, 1.0, f"part_{sequence_number}.{index}.ts", index == 0)
+
+
+def test_parts_are_listed_for_recent_segments_and_the_pending_one():
+    manager = TrackIndex(logging.getLogger(__name__))
+    for sequence_number in range(6):
+        add_parts(manager, sequence_number, 4)
+        add_segment(manager, sequence_number)
+    # part 1 arrives before part 0, only the gap-free prefix is listed
+    manager.add_part(VIDEO, TRACK, 6, 1, 1.0, "part_6.1.ts")
+    assert manager.get_pending_parts(TRACK) == (6, [])
+    manager.add_part(VIDEO, TRACK, 6, 0, 1.0, "part_6.0.ts", True)
+    next_sequence, pending = manager.get_pending_parts(TRACK)
+    assert next_sequence == 6 and [part["part_index"] for part in pending] == [0, 1]
+
+    window = manager.get_live_window(TRACK, 6, 1)
+    assert [("parts" in segment) for segment in window] == [False, False, False, True, True, True]
+    assert manager.has_part(TRACK, 6, 1) and not manager.has_part(TRACK, 6, 2)
+    assert manager.has_part(TRACK, 5, 9)
+
+    playlist = render_media_playlist(window, "ts_file", 4.0, manager.get_part_target(TRACK), pending,
+                                     (next_sequence, len(pending)), lambda seq, index: f"part_{TRACK}_{seq}_{index}.ts")
+    assert "#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK=3.000" in playlist
+    assert '#EXT-X-PART:DURATION=1.00000,URI="part_1280x720_3_0.ts",INDEPENDENT=YES' in playlist
+    assert playlist.endswith('#EXT-X-PART:DURATION=1.00000,URI="part_1280x720_6_1.ts"\n'
+                             '#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part_1280x720_6_2.ts"')
+
+
+def test_blocking_reload_waits_for_the_part():
+    manager = TrackIndex(logging.getLogger(__name__))
+    for sequence_number in range(3):
+        add_segment(manager, sequence_number)
+    waiters = PartWaiters()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(waiters.wait_for_part(manager, TRACK, 3, 0, timeout=2))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        manager.add_part(VIDEO, TRACK, 3, 0, 1.0, "part_3.0.ts")
+        waiters.notify(TRACK)
+        await asyncio.wait_for(blocked, 1)
+
+        with pytest.raises(BlockedRequestError) as too_far:
+            await waiters.wait_for_part(manager, TRACK, 9, 0, timeout=1)
+        assert too_far.value.status_code == 400
+        with pytest.raises(BlockedRequestError) as late:
+            await waiters.wait_for_part(manager, TRACK, 3, 1, timeout=0.05)
+        assert late.value.status_code == 503
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+from metrics import LatencyHistogram, Metrics, TimedLock, bucket_index, bucket_upper_bound
+
+
+def test_buckets_keep_relative_error_bounded():
+    for value in (0, 7, 8, 15, 16, 17, 1000, 123456, 10**9):
+        upper = bucket_upper_bound(bucket_index(value))
+        assert value <= upper <= value * 1.125 + 1
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for _ in range(990):
+        histogram.record(0.001)
+    for _ in range(10):
+        histogram.record(0.250)
+    assert 0.001 <= histogram.percentile(50) < 0.0012
+    assert 0.250 <= histogram.percentile(99.9) <= 0.250
+    le, count = histogram.cumulative()[-1]
+    assert le >= 0.25 and count == 1000
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.observe_request("/playlist_{resolution}.m3u8", 200, 0.002)
+    metrics.served("1280x720", 1000)
+    metrics.cache(True)
+    metrics.cache(False)
+    with TimedLock(metrics.lock_wait["ts_metadata"]):
+        pass
+    metrics.register_gauge("hls_metadata_index_segments", "track", lambda: {"1280x720": 42})
+
+    text = metrics.render()
+    assert 'hls_request_duration_seconds_count{route="/playlist_{resolution}.m3u8"} 1' in text
+    assert 'hls_requests_total{route="/playlist_{resolution}.m3u8",status="200"} 1' in text
+    assert 'hls_bytes_served_total{track="1280x720"} 1000' in text
+    assert 'hls_playlist_cache_hit_ratio 0.5000' in text
+    assert 'hls_lock_wait_seconds_count{lock="ts_metadata"} 1' in text
+    assert 'hls_metadata_index_segments{track="1280x720"} 42' in text
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from profiler import SlowRequestRecorder, StackSampler, profile
+
+
+def busy_handler(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_returns_collapsed_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_handler, args=(stop,), name="worker")
+    worker.start()
+    try:
+        stacks = profile(0.2, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+    lines = [line for line in stacks.splitlines() if line.startswith("worker;")]
+    assert lines and any("test_profiler.py:busy_handler" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and " " not in stack
+
+
+def test_only_slow_requests_are_kept():
+    sampler = StackSampler(0.005).start()
+    recorder = SlowRequestRecorder(sampler, threshold_ms=50, capacity=2)
+    try:
+        started = time.monotonic()
+        recorder.record("GET", "/playlist_1280x720.m3u8", "/playlist_{resolution}.m3u8", 200, started, started + 0.001)
+        time.sleep(0.1)
+        recorder.record("GET", "/playlist_1280x720.m3u8", "/playlist_{resolution}.m3u8", 200, started, time.monotonic())
+    finally:
+        sampler.stop()
+    slow = recorder.recent()
+    assert len(slow) == 1 and slow[0]["duration_ms"] >= 50
+    assert slow[0]["samples"] > 0 and "MainThread;" in slow[0]["stacks"]
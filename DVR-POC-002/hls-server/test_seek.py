@@ -0,0 +1,62 @@
+import json
+import logging
+
+from seek import SeekCache, seek_windows, render_seek_response
+from timeshift import key_to_epoch
+from track_index import TrackIndex, VIDEO, SUBTITLES
+
+
+def build_index():
+    index = TrackIndex(logging.getLogger(__name__))
+    # 6 s video segments from 10:00:00, 4 s subtitles shifted by 1 s
+    index.add_segments(VIDEO, "1280x720", [("2024-07-16", f"10:00:{6 * n:02d}.000", n, 6.0, f"v_{n}.ts")
+                                           for n in range(10)])
+    index.add_segments(SUBTITLES, "eng", [("2024-07-16", f"10:00:{4 * n + 1:02d}.000", n, 4.0, f"s_{n}.vtt")
+                                          for n in range(14)])
+    return index
+
+
+def test_subtitles_cover_the_time_span_of_the_video_window():
+    index = build_index()
+    windows = index.aligned_windows(key_to_epoch("2024-07-16", "10:00:13.000"), "1280x720", ["eng", "fre"], 2)
+    # video 12-24 s, subtitles ending after 12 s and starting before 24 s
+    assert [s["sequence_number"] for s in windows["1280x720"]] == [2, 3]
+    assert [s["vtt_file"] for s in windows["eng"]] == ["s_2.vtt", "s_3.vtt", "s_4.vtt", "s_5.vtt"]
+    assert windows["fre"] == []
+    assert index.aligned_windows(key_to_epoch("2024-07-16", "11:00:00.000"), "1280x720") is None
+
+
+def test_seeks_into_the_same_bucket_share_the_cached_windows():
+    index = build_index()
+    now = [0.0]
+    cache = SeekCache(bucket_seconds=1.0, ttl_seconds=2.0, clock=lambda: now[0])
+    epoch = key_to_epoch("2024-07-16", "10:00:13.000")
+    first = seek_windows(index, cache, epoch + 0.25, "1280x720", ["eng"], 2)
+    second = seek_windows(index, cache, epoch + 0.75, "1280x720", ["eng"], 2)
+    assert first[1] is second[1] and cache.lookups == {"hit": 1, "miss": 1}
+
+    response = json.loads(render_seek_response(epoch + 0.75, *second))
+    assert response["offset"] == 1.75 and response["segments"][0]["ts_file"] == "v_2.ts"
+    assert [s["sequence_number"] for s in response["subtitles"]["eng"]] == [2, 3, 4, 5]
+
+    # another track set is another entry, an expired entry is looked up again
+    seek_windows(index, cache, epoch, "1280x720", [], 2)
+    now[0] = 5.0
+    seek_windows(index, cache, epoch, "1280x720", ["eng"], 2)
+    assert cache.lookups == {"hit": 1, "miss": 3}
+
+
+def test_a_window_found_past_the_bucket_start_is_not_cached_for_the_bucket():
+    index = TrackIndex(logging.getLogger(__name__))
+    # the oldest segment starts half a second into the bucket
+    index.add_segments(VIDEO, "1280x720", [("2024-07-16", f"10:00:{6 * n:02d}.500", n, 6.0, f"v_{n}.ts")
+                                           for n in range(3)])
+    cache = SeekCache(bucket_seconds=1.0, ttl_seconds=2.0, clock=lambda: 0.0)
+    bucket = key_to_epoch("2024-07-16", "10:00:00.000")
+    start_epoch, body = seek_windows(index, cache, bucket + 0.9, "1280x720", [], 2)
+    assert json.loads(render_seek_response(bucket + 0.9, start_epoch, body))["offset"] == 0.4
+    # earlier in the same bucket, before the oldest segment
+    assert seek_windows(index, cache, bucket + 0.2, "1280x720", [], 2) is None
+    start_epoch, body = seek_windows(index, cache, bucket + 0.6, "1280x720", [], 2)
+    assert json.loads(render_seek_response(bucket + 0.6, start_epoch, body))["offset"] == 0.1
+    assert cache.entries == {}
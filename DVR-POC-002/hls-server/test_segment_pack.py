@@ -0,0 +1,85 @@
+# test_segment_pack.py
+
+import importlib.util
+from pathlib import Path
+
+from segment_pack import SegmentPackReader, INDEX_RECORD, pack_file_names
+
+
+def load_writer_module():
+    # hls-download/segment_pack.py writes the packs, it shares the module name with the reader
+    path = Path(__file__).resolve().parent.parent / "hls-download" / "segment_pack.py"
+    spec = importlib.util.spec_from_file_location("download_segment_pack", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_pack(track_dir, track, pack_id, segments_per_pack, segments):
+    '''Builds a pack the way hls-download lays it out: data first, then the slot'''
+    data_name, index_name = pack_file_names(track, pack_id)
+    index = bytearray(segments_per_pack * INDEX_RECORD.size)
+    data = bytearray()
+    for sequence_number, content in segments.items():
+        slot = sequence_number % segments_per_pack
+        INDEX_RECORD.pack_into(index, slot * INDEX_RECORD.size, len(data), len(content))
+        data += content
+    (track_dir / data_name).write_bytes(data)
+    (track_dir / index_name).write_bytes(index)
+
+
+def test_read_packed_segments(tmp_path):
+    track_dir = tmp_path / "1920x1080"
+    track_dir.mkdir()
+    write_pack(track_dir, "1920x1080", 0, 10, {3: b"a" * 10, 4: b"b" * 20})
+    write_pack(track_dir, "1920x1080", 1, 10, {11: b"c" * 5})
+
+    reader = SegmentPackReader(tmp_path, segments_per_pack=10, max_open_packs=1)
+    assert reader.read("1920x1080", 4) == b"b" * 20
+    assert reader.read("1920x1080", 11) == b"c" * 5
+    # pack 0 was evicted from the LRU, it has to be reopened transparently
+    assert reader.read("1920x1080", 3) == b"a" * 10
+    reader.close()
+
+
+def test_missing_segments(tmp_path):
+    track_dir = tmp_path / "eng"
+    track_dir.mkdir()
+    write_pack(track_dir, "eng", 0, 10, {1: b"WEBVTT"})
+
+    reader = SegmentPackReader(tmp_path, segments_per_pack=10)
+    assert reader.read("eng", 1) == b"WEBVTT"
+    assert reader.read("eng", 2) is None
+    assert reader.read("eng", 25) is None
+    assert reader.read("640x360", 1) is None
+    reader.close()
+
+
+def test_writer_packs_are_read_back(tmp_path):
+    writer_module = load_writer_module()
+    assert writer_module.INDEX_RECORD.format == INDEX_RECORD.format
+    writer = writer_module.SegmentPackWriter(tmp_path, segments_per_pack=10)
+    assert writer.append("1280x720", 8, b"a" * 10)
+    assert writer.append("1280x720", 9, b"b" * 20)
+    # the next sequence number opens pack 1
+    assert writer.append("1280x720", 10, b"c" * 5)
+    assert not writer.append("1280x720", 9, b"x")
+    assert writer.has_segment("1280x720", 9) and not writer.has_segment("1280x720", 11)
+    writer.close()
+
+    # a restarted downloader reopens the existing packs and appends behind their data
+    writer = writer_module.SegmentPackWriter(tmp_path, segments_per_pack=10)
+    assert writer.segment_size("1280x720", 8) == 10
+    assert not writer.append("1280x720", 10, b"x")
+    assert writer.append("1280x720", 11, b"d" * 7)
+    assert writer.append("1280x720", 7, b"e" * 3)
+    writer.close()
+
+    reader = SegmentPackReader(tmp_path, segments_per_pack=10)
+    assert reader.read("1280x720", 7) == b"e" * 3
+    assert reader.read("1280x720", 8) == b"a" * 10
+    assert reader.read("1280x720", 9) == b"b" * 20
+    assert reader.read("1280x720", 10) == b"c" * 5
+    assert reader.read("1280x720", 11) == b"d" * 7
+    assert reader.read("1280x720", 12) is None
+    reader.close()
@@ -0,0 +1,166 @@
+# test_timeshift.py
+
+import logging
+
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from timeshift import encode_token, decode_token, key_to_epoch
+from track_index import TrackIndex, VIDEO, SUBTITLES
+from playlist_renderer import render_media_playlist
+
+
+def fill_manager(count, duration=6.006):
+    manager = TrackIndex(logging.getLogger(__name__))
+    start_time = datetime(2024, 6, 12, 2, 0, 0)
+    for sequence_number in range(1, count + 1):
+        manager.add_segment(VIDEO, "1920x1080", start_time.date().isoformat(),
+            start_time.strftime("%H:%M:%S.%f")[:-3], sequence_number, duration,
+            f"playlist_1920x1080_{start_time:%H%M%S}__{sequence_number}.ts")
+        start_time += timedelta(seconds=duration)
+    return manager
+
+
+def test_token_round_trip():
+    assert decode_token(encode_token(1234.567)) == 1234.567
+    assert encode_token(0) == "0"
+
+
+def test_window_trails_live_edge_by_offset():
+    manager = fill_manager(100)
+    live = manager.get_timeshift_playlist("1920x1080", 0, 10)
+    assert [s["sequence_number"] for s in live] == list(range(91, 101))
+
+    # one minute behind live is ten 6s segments back
+    shifted = manager.get_timeshift_playlist("1920x1080", 60, 10)
+    assert shifted[-1]["sequence_number"] == 91
+    assert len(shifted) == 10
+
+    # far past the retention the window clamps to the oldest segment
+    assert manager.get_timeshift_playlist("1920x1080", 10_000, 10)[0]["sequence_number"] == 1
+
+
+def test_live_edge_and_render():
+    manager = fill_manager(3, duration=6.0)
+    expected = datetime(2024, 6, 12, 2, 0, 18, tzinfo=timezone.utc).timestamp()
+    assert manager.get_live_edge("1920x1080") == expected
+    assert key_to_epoch("2024-06-12", "02:00:18.000000") == expected
+
+    playlist = render_media_playlist(manager.get_timeshift_playlist("1920x1080", 0, 10), "ts_file")
+    lines = playlist.splitlines()
+    assert lines[2] == "#EXT-X-TARGETDURATION:6"
+    assert lines[3] == "#EXT-X-MEDIA-SEQUENCE:1"
+    assert lines[4] == "#EXT-X-PROGRAM-DATE-TIME:2024-06-12T02:00:00.000Z"
+    assert lines[5] == "#EXTINF:6.00000,"
+
+
+def test_live_window_uses_running_max_target_duration():
+    manager = fill_manager(25)
+    manager.add_segment(VIDEO, "1920x1080", "2024-06-12", "02:02:30.150", 26, 7.2, "playlist_1920x1080_020230__26.ts")
+    assert manager.get_target_duration("1920x1080") == 7.2
+
+    window = manager.get_live_window("1920x1080", 10)
+    assert [s["sequence_number"] for s in window] == list(range(17, 27))
+    assert "#EXT-X-TARGETDURATION:8" in render_media_playlist(window, "ts_file", 7.2)
+
+
+def test_live_window_startup_and_hold_back():
+    # served as soon as startup_min_segments can be listed, growing up to the window size
+    assert fill_manager(2).get_live_window("1920x1080", 10, 3) is None
+    assert [s["sequence_number"] for s in fill_manager(3).get_live_window("1920x1080", 10, 3)] == [1, 2, 3]
+
+    manager = fill_manager(25)
+    held = manager.get_live_window("1920x1080", 5, 3, hold_back_segments=4)
+    assert [s["sequence_number"] for s in held] == list(range(17, 22))
+    # 13 s behind the live edge is inside segment 23, two segments and a bit before the newest
+    held = manager.get_live_window("1920x1080", 5, 3, hold_back_seconds=13)
+    assert [s["sequence_number"] for s in held] == list(range(19, 24))
+    assert fill_manager(5).get_live_window("1920x1080", 10, 3, hold_back_segments=3) is None
+
+
+def test_tracks_are_registered_by_their_first_segment():
+    manager = TrackIndex(logging.getLogger("test"))
+    assert manager.get_tracks() == []
+    # reads and removals of a track nobody ingested are empty, not KeyErrors
+    assert manager.get_live_window("3840x2160") is None
+    assert manager.get_dvr_playlist("3840x2160", "2024-07-16", "00:00:00.000") == []
+    manager.remove_segment("3840x2160", 1)
+    assert manager.get_pending_parts("3840x2160") == (None, [])
+    assert manager.registry_version == 0
+
+    manager.add_part(VIDEO, "3840x2160", 1, 0, 1.0, "part_3840x2160_1_0.ts")
+    manager.add_segment(VIDEO, "2560x1440", "2024-07-16", "00:00:00.000", 1, 6.0, "playlist_2560x1440_000000__1.ts")
+    manager.add_segment(VIDEO, "2560x1440", "2024-07-16", "00:00:06.000", 2, 6.0, "playlist_2560x1440_000006__2.ts")
+    assert manager.get_tracks() == ["3840x2160", "2560x1440"]
+    assert manager.registry_version == 2
+    assert manager.get_part("3840x2160", 1, 0)["part_file"] == "part_3840x2160_1_0.ts"
+
+
+def test_start_redirects_to_the_token_url(monkeypatch):
+    testclient = pytest.importorskip("fastapi.testclient")
+    import main
+    manager = fill_manager(20)
+    monkeypatch.setattr(main, "track_index", manager)
+    client = testclient.TestClient(main.app)
+    live_edge = manager.get_live_edge("1920x1080")
+
+    response = client.get("/playlist_1920x1080.m3u8", params={"start": live_edge - 60}, follow_redirects=False)
+    assert response.status_code == 307
+    # the offset is resolved once, reloading the redirect target keeps the viewer 60 s behind live
+    assert response.headers["location"] == f"/playlist_1920x1080.m3u8?token={encode_token(60)}"
+    playlist = client.get(response.headers["location"])
+    assert playlist.status_code == 200 and "#EXTINF" in playlist.text
+
+    resumed = client.post("/resume", params={"resolution": "1920x1080", "start": live_edge - 60}, follow_redirects=False)
+    assert resumed.status_code == 303 and resumed.headers["location"] == response.headers["location"]
+
+
+def test_timeshift_renders_are_shared_per_token_until_the_track_changes(monkeypatch):
+    testclient = pytest.importorskip("fastapi.testclient")
+    import main
+    manager = fill_manager(20, duration=6.0)
+    monkeypatch.setattr(main, "track_index", manager)
+    monkeypatch.setattr(main.stream_handler, "timeshift_cache", main.OrderedDict())
+    renders = []
+    def counting_render(*args, **kwargs):
+        renders.append(args[0][-1]["sequence_number"])
+        return render_media_playlist(*args, **kwargs)
+    monkeypatch.setattr(main, "render_media_playlist", counting_render)
+    client = testclient.TestClient(main.app)
+    live_edge = manager.get_live_edge("1920x1080")
+
+    # two viewers seeking inside the same second get the same token
+    first = client.get("/playlist_1920x1080.m3u8", params={"start": live_edge - 30.2}, follow_redirects=False)
+    second = client.get("/playlist_1920x1080.m3u8", params={"start": live_edge - 30.7}, follow_redirects=False)
+    assert first.headers["location"] == second.headers["location"]
+    assert first.headers["x-timeshift-token"] == encode_token(30)
+    for _ in range(3):
+        assert client.get(first.headers["location"]).status_code == 200
+    assert renders == [15]
+
+    # a new segment moves the window, the next reload renders it again
+    manager.add_segment(VIDEO, "1920x1080", "2024-06-12", "02:02:00.000", 21, 6.0, "playlist_1920x1080_020200__21.ts")
+    assert client.get(first.headers["location"]).status_code == 200
+    assert renders == [15, 16]
+
+
+def test_a_caption_language_is_served_from_its_own_directory(monkeypatch, tmp_path):
+    testclient = pytest.importorskip("fastapi.testclient")
+    import main
+    manager = TrackIndex(logging.getLogger(__name__))
+    # registered by live-captioning, which writes to segments_dir/eng-auto
+    for sequence_number in range(1, 4):
+        manager.add_segment(SUBTITLES, "eng-auto", "2024-06-12", f"02:00:{6 * sequence_number:02d}.000",
+            sequence_number, 6.0, f"playlist_webvtt_020000__{sequence_number}.vtt")
+    (tmp_path / "eng-auto").mkdir()
+    (tmp_path / "eng-auto" / "playlist_webvtt_020000__3.vtt").write_text("WEBVTT\n\n")
+    monkeypatch.setattr(main, "track_index", manager)
+    monkeypatch.setattr(main, "SEGMENTS_DIR", tmp_path)
+    client = testclient.TestClient(main.app)
+
+    playlist = client.get("/playlist_webvtt_eng-auto.m3u8")
+    assert playlist.status_code == 200
+    uri = playlist.text.splitlines()[-1]
+    assert uri.endswith("eng-auto/playlist_webvtt_020000__3.vtt")
+    vtt = client.get(uri)
+    assert vtt.status_code == 200 and vtt.text == "WEBVTT\n\n"
@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+
+import track_index
+from track_index import TrackIndex, VIDEO, SUBTITLES
+from timeshift import key_to_epoch
+
+
+def rows(first, count, duration=6.0, start=datetime(2024, 7, 16, 23, 59, 0), name="seg"):
+    moment = start + timedelta(seconds=first * duration)
+    for sequence_number in range(first, first + count):
+        yield (moment.date().isoformat(), moment.strftime("%H:%M:%S.%f")[:-3], sequence_number, duration,
+               f"{name}_{sequence_number}")
+        moment += timedelta(seconds=duration)
+
+
+def test_batches_evict_from_the_head_and_compact(monkeypatch):
+    monkeypatch.setattr(track_index, "COMPACT_AFTER", 4)
+    index = TrackIndex(logging.getLogger(__name__))
+    assert index.add_segments(VIDEO, "1280x720", rows(0, 20)) == 20
+    # the downloader posts the window again, nothing changes
+    version = index.get_version("1280x720")
+    assert index.add_segments(VIDEO, "1280x720", rows(0, 20)) == 0
+    assert index.get_version("1280x720") == version
+
+    assert index.remove_segments("1280x720", range(0, 12)) == 12
+    track = index.tracks["1280x720"]
+    # compacted once the dead prefix was as long as the live part
+    assert len(track) == 8 and track.head < 12 and len(track.ends) < 20
+    assert [s["sequence_number"] for s in index.get_live_window("1280x720", 3)] == [17, 18, 19]
+    assert not index.remove_segment("1280x720", 3)
+
+
+def test_out_of_order_and_reposted_segments_stay_in_time_order():
+    index = TrackIndex(logging.getLogger(__name__))
+    index.add_segments(VIDEO, "1280x720", rows(5, 3))
+    index.add_segments(VIDEO, "1280x720", rows(2, 3))
+    # segment 6 is posted again with another file name, it replaces the first post
+    index.add_segments(VIDEO, "1280x720", rows(6, 1, name="retry"))
+    window = index.get_live_window("1280x720", 10, 1)
+    assert [s["sequence_number"] for s in window] == [2, 3, 4, 5, 6, 7]
+    assert window[4]["ts_file"] == "retry_6"
+
+
+def test_segments_at_covers_every_track_across_midnight():
+    index = TrackIndex(logging.getLogger(__name__))
+    index.add_segments(VIDEO, "1280x720", rows(0, 30))
+    index.add_segments(SUBTITLES, "eng", rows(0, 15, duration=12.0, name="sub"))
+    assert index.get_tracks(SUBTITLES) == ["eng"]
+    # segment 12 starts at 00:00:12 of the next day
+    windows = index.segments_at(key_to_epoch("2024-07-17", "00:00:15.000"), max_segments=2)
+    assert [s["sequence_number"] for s in windows["1280x720"]] == [12, 13]
+    assert windows["1280x720"][0]["date"] == "2024-07-17"
+    assert [s["vtt_file"] for s in windows["eng"]] == ["sub_6", "sub_7"]
+    assert index.get_dvr_playlist("eng", "2024-07-16", "12:00:00.000") == []
+    # a track name belongs to one kind
+    with pytest.raises(ValueError):
+        index.add_segments(SUBTITLES, "1280x720", rows(30, 1))
+    assert index.get_kind("1280x720") == VIDEO and len(index.tracks["1280x720"]) == 30
+
+
+def test_batch_endpoints_ingest_a_reload_and_reject_bad_rows(monkeypatch):
+    testclient = pytest.importorskip("fastapi.testclient")
+    import main
+    index = TrackIndex(logging.getLogger(__name__))
+    monkeypatch.setattr(main, "track_index", index)
+    client = testclient.TestClient(main.app)
+    segments = [dict(zip(("date", "start_timestamp", "sequence_number", "duration", "ts_file"), row), size=750_000)
+                for row in rows(0, 5)]
+
+    response = client.post("/add_tsmetadata_batch", json={"resolution": "1280x720", "segments": segments})
+    assert response.status_code == 200 and response.json()["added"] == 5
+    # the next reload posts the same window, nothing changes
+    assert client.post("/add_tsmetadata_batch", json={"resolution": "1280x720", "segments": segments}).json()["added"] == 0
+
+    bad = dict(segments[0], sequence_number=5, start_timestamp="25:00:00.000")
+    assert client.post("/add_tsmetadata_batch", json={"resolution": "1280x720", "segments": [bad]}).status_code == 400
+    assert client.post("/add_tsmetadata", json=dict(bad, resolution="1280x720")).status_code == 400
+    # a video track is not a subtitle language
+    vtt = {"date": "2024-07-16", "start_timestamp": "23:59:00.000", "sequence_number": 0, "duration": 6.0,
+           "vtt_file": "sub_0.vtt"}
+    assert client.post("/add_vttmetadata_batch", json={"language": "1280x720", "segments": [vtt]}).status_code == 400
+    assert client.post("/add_vttmetadata", json=dict(vtt, language="1280x720")).status_code == 400
+    assert len(index.tracks["1280x720"]) == 5
+
+    response = client.post("/remove_tsmetadata_batch/1280x720", json={"sequence_numbers": [0, 1, 9]})
+    assert response.status_code == 200 and response.json()["removed"] == 2
+    assert [s["sequence_number"] for s in index.get_live_window("1280x720", 10, 1)] == [2, 3, 4]
@@ -0,0 +1,49 @@
+# timeshift.py
+
+from datetime import datetime, timezone
+
+'''
+    Helpers for the time-shifted (DVR) playlists
+
+    The track index keeps the segments in time order by their epoch, so a
+    wall clock position is found with one bisect, O(log n).
+
+    A time-shifted viewer is described only by how far it is behind the live
+    edge. That offset is the whole "session": it is encoded in a compact token
+    (base36 milliseconds) which the player carries in the playlist url, so
+    the server keeps no per client state at all.
+'''
+
+
+def encode_token(offset_seconds):
+    offset_ms = max(0, int(round(offset_seconds * 1000)))
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    token = ''
+    while True:
+        offset_ms, remainder = divmod(offset_ms, 36)
+        token = digits[remainder] + token
+        if offset_ms == 0:
+            return token
+
+
+def decode_token(token):
+    '''Returns the offset behind live in seconds, raises ValueError for a bad token'''
+    if not token or len(token) > 12:
+        raise ValueError(f"Invalid timeshift token: {token}")
+    return int(token, 36) / 1000
+
+
+# date string -> epoch of its midnight, one entry per day of the stream
+_day_epochs = {}
+
+
+def key_to_epoch(date, timestamp):
+    '''Epoch seconds of a date ("2024-06-12") and timestamp ("02:28:07.920"), raises ValueError for a bad one'''
+    day = _day_epochs.get(date)
+    if day is None:
+        day = _day_epochs[date] = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    hours, minutes, seconds = timestamp.split(":")
+    # the same fields strptime accepts for %H:%M:%S.%f, without building a datetime per segment
+    if not (0 <= int(hours) < 24 and 0 <= int(minutes) < 60 and 0 <= float(seconds) < 60):
+        raise ValueError(f"Invalid timestamp: {timestamp}")
+    return day + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
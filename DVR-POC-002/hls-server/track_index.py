@@ -0,0 +1,438 @@
+# track_index.py
+
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from timeshift import key_to_epoch
+
+'''
+    One metadata index for every track of the stream: video renditions,
+    subtitle languages and audio tracks
+
+    A track is registered with its kind by its first segment or part. The
+    segments of a track are kept in time order, one array per field
+    (columns), instead of a tuple and a dict entry per segment:
+        starts, ends, durations   float epoch seconds, array('d')
+        sequence_numbers          array('q')
+        dates, start_timestamps   the strings as ingested, for the playlists
+        files                     segment file names
+    Wall clock lookups are a bisect over `ends`. The oldest segments are
+    evicted by moving `head` forward, the arrays are compacted once the dead
+    prefix is as long as the live part, so a sliding window costs O(1)
+    amortized per segment.
+
+    The timestamps are parsed once at ingest by key_to_epoch, reads never
+    parse a timestamp again.
+'''
+
+# LL-HLS parts are only listed for the newest segments, older ones are whole segments only
+PART_SEGMENTS_KEPT = 3
+# the dead prefix is only compacted once it is this long, evicting one segment stays O(1)
+COMPACT_AFTER = 1024
+
+
+class TrackKind(NamedTuple):
+    name: str
+    # keys of the track name and the file name in the segment dicts, as the API returns them
+    track_key: str
+    file_key: str
+
+
+VIDEO = TrackKind("video", "resolution", "ts_file")
+SUBTITLES = TrackKind("subtitles", "language", "vtt_file")
+AUDIO = TrackKind("audio", "language", "audio_file")
+
+# (date, start_timestamp, sequence_number, duration, file)
+SegmentRow = Tuple[str, str, int, float, str]
+
+
+class Track:
+    __slots__ = ("kind", "starts", "ends", "durations", "sequence_numbers", "dates", "start_timestamps",
+                 "files", "head", "positions", "target_duration", "version", "parts", "part_target")
+
+    def __init__(self, kind: TrackKind):
+        self.kind = kind
+        self.starts = array('d')
+        self.ends = array('d')
+        self.durations = array('d')
+        self.sequence_numbers = array('q')
+        self.dates = []
+        self.start_timestamps = []
+        self.files = []
+        # index of the oldest live segment, the rows before it are evicted
+        self.head = 0
+        # sequence_number -> end epoch, to find a segment by its number with one bisect
+        self.positions = {}
+        # running max of the segment durations, the EXT-X-TARGETDURATION of the track
+        self.target_duration = 0.0
+        # bumped on every change of the track, rendered playlists are cached per version
+        self.version = 0
+        # LL-HLS partial segments, sequence_number -> {part_index: part}, the parts of the
+        # segment being produced are here before the segment itself
+        self.parts = {}
+        # running max of the part durations, the PART-TARGET of the track
+        self.part_target = 0.0
+
+    def __len__(self):
+        return len(self.ends) - self.head
+
+    def columns(self):
+        return (self.starts, self.ends, self.durations, self.sequence_numbers,
+                self.dates, self.start_timestamps, self.files)
+
+    def find(self, sequence_number):
+        # row of the segment, None if it is not indexed
+        end = self.positions.get(sequence_number)
+        if end is None:
+            return None
+        row = bisect_left(self.ends, end, self.head)
+        # segments may share an end, e.g. a repeated timestamp of the origin
+        while row < len(self.ends) and self.ends[row] == end:
+            if self.sequence_numbers[row] == sequence_number:
+                return row
+            row += 1
+        return None
+
+    def append(self, start, end, duration, sequence_number, date, start_timestamp, file):
+        row = bisect_right(self.ends, end, self.head)
+        values = (start, end, duration, sequence_number, date, start_timestamp, file)
+        if row == len(self.ends):
+            for column, value in zip(self.columns(), values):
+                column.append(value)
+        else:
+            # out of order, e.g. a retried post, rare enough for the memmove
+            for column, value in zip(self.columns(), values):
+                column.insert(row, value)
+        self.positions[sequence_number] = end
+
+    def delete(self, row):
+        self.positions.pop(self.sequence_numbers[row], None)
+        if row == self.head:
+            self.head += 1
+            if self.head >= COMPACT_AFTER and self.head * 2 >= len(self.ends):
+                for column in self.columns():
+                    del column[:self.head]
+                self.head = 0
+        else:
+            for column in self.columns():
+                del column[row]
+
+    def newest_sequence(self):
+        return self.sequence_numbers[-1] if len(self) else None
+
+    def listed_parts(self, sequence_number):
+        # parts are downloaded in parallel so only the gap-free prefix is listed
+        parts = self.parts.get(sequence_number)
+        listed = []
+        while parts and len(listed) in parts:
+            listed.append(parts[len(listed)])
+        return listed
+
+    def entry(self, name, row):
+        kind = self.kind
+        sequence_number = self.sequence_numbers[row]
+        entry = {
+            kind.track_key: name,
+            "sequence_number": sequence_number,
+            "date": self.dates[row],
+            "start_timestamp": self.start_timestamps[row],
+            "duration": self.durations[row],
+            kind.file_key: self.files[row],
+        }
+        parts = self.listed_parts(sequence_number)
+        if parts:
+            entry["parts"] = parts
+        return entry
+
+    def window_ending_at(self, offset_seconds, max_segments):
+        # rows of the max_segments long window whose last segment plays offset_seconds behind live
+        if not len(self):
+            return range(0)
+        target = self.ends[-1] - offset_seconds
+        # first segment ending at or after the target, i.e. the one playing at target
+        end_row = min(bisect_left(self.ends, target, self.head) + 1, len(self.ends))
+        return range(max(self.head, end_row - max_segments), end_row)
+
+    def playing_at(self, epoch):
+        # row of the segment playing at epoch, None in a gap or outside the index
+        row = bisect_left(self.ends, epoch, self.head)
+        if row < len(self.ends) and self.starts[row] <= epoch:
+            return row
+        return None
+
+
+class TrackIndex:
+    def __init__(self, logger, lock=None):
+        # name -> Track in the order of their first segment, a track is created by its first ingest
+        self.tracks: Dict[str, Track] = {}
+        # bumped when a track appears, the master playlist is cached per registry version
+        self.registry_version = 0
+        self.lock = lock or Lock()
+        self.logger = logger
+
+    def _register(self, kind, name):
+        # caller holds the lock
+        track = self.tracks.get(name)
+        if track is None:
+            track = self.tracks[name] = Track(kind)
+            self.registry_version += 1
+            self.logger.info("Registered %s track %s", kind.name, name)
+        elif track.kind != kind:
+            raise ValueError(f"Track {name} is a {track.kind.name} track, not {kind.name}")
+        return track
+
+    def get_tracks(self, kind: Optional[TrackKind] = None) -> List[str]:
+        with self.lock:
+            return [name for name, track in self.tracks.items() if kind is None or track.kind == kind]
+
+    def get_kind(self, name) -> Optional[TrackKind]:
+        track = self.tracks.get(name)
+        return track.kind if track is not None else None
+
+    def index_sizes(self) -> Dict[str, int]:
+        with self.lock:
+            return {name: len(track) for name, track in self.tracks.items()}
+
+    def add_segments(self, kind: TrackKind, name: str, rows: Iterable[SegmentRow]) -> int:
+        '''
+            Adds a batch of (date, start_timestamp, sequence_number, duration, file) rows under one lock,
+            returns how many changed the index. A malformed row or a track of another kind raises
+            ValueError and nothing of the batch is added.
+        '''
+        # parsed before taking the lock, readers do not wait on it
+        parsed = []
+        for date, start_timestamp, sequence_number, duration, file in rows:
+            start = key_to_epoch(date, start_timestamp)
+            parsed.append((start, start + duration, duration, sequence_number, date, start_timestamp, file))
+        added = 0
+        with self.lock:
+            track = self._register(kind, name)
+            for start, end, duration, sequence_number, date, start_timestamp, file in parsed:
+                row = track.find(sequence_number)
+                if row is not None:
+                    # the downloader posts the whole live window on every poll, a known segment is not a change
+                    if track.starts[row] == start and track.durations[row] == duration and track.files[row] == file:
+                        continue
+                    track.delete(row)
+                track.append(start, end, duration, sequence_number, date, start_timestamp, file)
+                if duration > track.target_duration:
+                    track.target_duration = duration
+                added += 1
+            if added:
+                track.version += 1
+                newest = track.newest_sequence()
+                for stale in [seq for seq in track.parts if seq <= newest - PART_SEGMENTS_KEPT]:
+                    del track.parts[stale]
+        self.logger.debug("Added %d of %d segments to %s track %s", added, len(parsed), kind.name, name)
+        return added
+
+    def add_segment(self, kind: TrackKind, name: str, date: str, start_timestamp: str,
+                    sequence_number: int, duration: float, file: str) -> bool:
+        return self.add_segments(kind, name, [(date, start_timestamp, sequence_number, duration, file)]) > 0
+
+    def remove_segments(self, name: str, sequence_numbers: Iterable[int]) -> int:
+        '''Evicts a batch of segments under one lock, returns how many were indexed'''
+        try:
+            removed = 0
+            with self.lock:
+                track = self.tracks.get(name)
+                for sequence_number in sequence_numbers:
+                    row = track.find(sequence_number) if track is not None else None
+                    if row is None:
+                        self.logger.warning("Attempt to remove non-existing segment of track %s: sequence_number=%s", name, sequence_number)
+                        continue
+                    track.delete(row)
+                    track.parts.pop(sequence_number, None)
+                    removed += 1
+                if removed:
+                    track.version += 1
+            self.logger.debug("Removed %d segments of track %s", removed, name)
+            return removed
+        except Exception as e:
+            self.logger.error("Error removing segments of %s: %s", name, e)
+            return 0
+
+    def remove_segment(self, name: str, sequence_number: int) -> bool:
+        return self.remove_segments(name, [sequence_number]) > 0
+
+    def add_part(self, kind: TrackKind, name: str, sequence_number: int, part_index: int,
+                 duration: float, part_file: str, independent: bool = False):
+        try:
+            with self.lock:
+                track = self.tracks.get(name)
+                newest = track.newest_sequence() if track is not None else None
+                if newest is not None and sequence_number <= newest - PART_SEGMENTS_KEPT:
+                    # too old to be listed, e.g. a late retry of the downloader
+                    return
+                track = self._register(kind, name)
+                part = {"part_index": part_index, "duration": duration, "part_file": part_file, "independent": independent}
+                parts = track.parts.setdefault(sequence_number, {})
+                if parts.get(part_index) == part:
+                    return
+                parts[part_index] = part
+                track.version += 1
+                if duration > track.part_target:
+                    track.part_target = duration
+            self.logger.debug("Added part of track %s: sequence_number=%s, part_index=%s, duration=%s", name, sequence_number, part_index, duration)
+        except Exception as e:
+            self.logger.error("Error adding part: %s", e)
+
+    def get_part_target(self, name):
+        with self.lock:
+            track = self.tracks.get(name)
+            return track.part_target if track is not None else 0.0
+
+    def get_pending_parts(self, name):
+        # (sequence number, listed parts) of the segment after the newest complete one
+        with self.lock:
+            track = self.tracks.get(name)
+            newest = track.newest_sequence() if track is not None else None
+            if newest is None:
+                return None, []
+            return newest + 1, track.listed_parts(newest + 1)
+
+    def get_part(self, name, sequence_number, part_index):
+        with self.lock:
+            track = self.tracks.get(name)
+            return track.parts.get(sequence_number, {}).get(part_index) if track is not None else None
+
+    def get_newest_sequence(self, name):
+        with self.lock:
+            track = self.tracks.get(name)
+            return track.newest_sequence() if track is not None else None
+
+    def has_part(self, name, sequence_number, part_index=None):
+        # the blocking reload condition: segment complete, or with part_index that part listed
+        with self.lock:
+            track = self.tracks.get(name)
+            if track is None:
+                return False
+            if sequence_number in track.positions:
+                return True
+            if part_index is None:
+                return False
+            return len(track.listed_parts(sequence_number)) > part_index
+
+    def get_version(self, name):
+        track = self.tracks.get(name)
+        return track.version if track is not None else 0
+
+    def get_target_duration(self, name):
+        with self.lock:
+            track = self.tracks.get(name)
+            return track.target_duration if track is not None else 0.0
+
+    def get_live_window(self, name, max_segments=10, min_segments=3, hold_back_segments=0, hold_back_seconds=0.0):
+        '''
+            The newest max_segments segments, read from the tail by position, O(log n +
+            max_segments) whatever the size of the index. The newest hold_back_segments,
+            or the newest hold_back_seconds, are not listed yet. None while fewer than
+            min_segments can be listed, so a restarted server serves as soon as a few
+            segments are back.
+        '''
+        with self.lock:
+            track = self.tracks.get(name)
+            if track is None or not len(track):
+                return None
+            if hold_back_seconds:
+                rows = track.window_ending_at(hold_back_seconds, max_segments)
+            else:
+                end_row = max(track.head, len(track.ends) - hold_back_segments)
+                rows = range(max(track.head, end_row - max_segments), end_row)
+            if len(rows) < max(min_segments, 1):
+                return None
+            return [track.entry(name, row) for row in rows]
+
+    def get_live_edge(self, name):
+        # wall clock (epoch seconds) at which the newest segment ends, None if there is none
+        with self.lock:
+            track = self.tracks.get(name)
+            return track.ends[-1] if track is not None and len(track) else None
+
+    def get_timeshift_playlist(self, name, offset_seconds, max_segments=10):
+        # sliding window which trails the live edge by offset_seconds, O(log n)
+        with self.lock:
+            track = self.tracks.get(name)
+            if track is None:
+                return []
+            return [track.entry(name, row) for row in track.window_ending_at(offset_seconds, max_segments)]
+
+    def segments_at(self, epoch: float, names: Optional[Iterable[str]] = None,
+                    max_segments: int = 1) -> Dict[str, list]:
+        '''
+            For every track (all of them without names) the max_segments long window
+            starting with the segment playing at epoch, under one lock so all windows
+            come from the same state of the index. Tracks with nothing at epoch are [].
+        '''
+        with self.lock:
+            windows = {}
+            for name in self.tracks if names is None else names:
+                track = self.tracks.get(name)
+                row = track.playing_at(epoch) if track is not None else None
+                windows[name] = [] if row is None else \
+                    [track.entry(name, i) for i in range(row, min(row + max_segments, len(track.ends)))]
+            return windows
+
+    def aligned_windows(self, epoch: float, name: str, others: Iterable[str] = (),
+                        max_segments: int = 10) -> Optional[Dict[str, list]]:
+        '''
+            The max_segments long window of `name` starting with the segment playing at
+            epoch, and for every track of `others` the segments overlapping the time span
+            of that window. One lock, so the windows agree at the segment boundaries.
+            None when `name` has nothing at epoch.
+        '''
+        with self.lock:
+            track = self.tracks.get(name)
+            row = track.playing_at(epoch) if track is not None else None
+            if row is None:
+                return None
+            rows = range(row, min(row + max_segments, len(track.ends)))
+            span_start, span_end = track.starts[row], track.ends[rows[-1]]
+            windows = {name: [track.entry(name, i) for i in rows]}
+            for other in others:
+                other_track = self.tracks.get(other)
+                if other_track is None:
+                    windows[other] = []
+                    continue
+                # ending after the span starts and starting before it ends
+                first = bisect_right(other_track.ends, span_start, other_track.head)
+                last = bisect_left(other_track.starts, span_end, first)
+                windows[other] = [other_track.entry(other, i) for i in range(first, last)]
+            return windows
+
+    def get_live_playlist(self, name, max_segments=10, min_segments=3):
+        # the newest max_segments segments, the /get_live_tsplaylist and /get_live_vttplaylist view of get_live_window
+        try:
+            if name not in self.tracks:
+                self.logger.error("No segment data found for track: %s", name)
+                return {"error": "No segment data found for the given track"}
+            live_playlist = self.get_live_window(name, max_segments, min_segments)
+            if live_playlist is None:
+                self.logger.info("Too few segments to return live playlist for track %s, so wait...", name)
+                return {"error": "Too few segments to return, WAIT..."}
+            self.logger.debug("Live playlist of last %s segments for track %s: %d segments", max_segments, name, len(live_playlist))
+            return live_playlist
+        except Exception as e:
+            self.logger.error("Error getting live playlist: %s", e)
+            return {"error": f"Error getting live playlist: {e}"}
+
+    def get_dvr_playlist(self, name, date, timestamp, max_segments=10):
+        # the segment playing at date/timestamp and the ones after it
+        try:
+            dvr_playlist = self.segments_at(key_to_epoch(date, timestamp), [name], max_segments)[name]
+            self.logger.debug("DVR playlist from %s for track %s: %d segments", timestamp, name, len(dvr_playlist))
+            return dvr_playlist
+        except ValueError as e:
+            self.logger.error("ValueError in timestamp conversion: %s", e)
+            return []
+        except Exception as e:
+            self.logger.error("Error getting DVR playlist: %s", e)
+            return []
+
+# Example usage:
+# logger = logging.getLogger(__name__)
+# track_index = TrackIndex(logger)
+# track_index.add_segment(VIDEO, '1920x1080', '2023-07-02', '12:00:00.000', 1, 10, 'file1.ts')
+# track_index.add_segment(SUBTITLES, 'eng', '2023-07-02', '12:00:00.000', 1, 10, 'file1.vtt')
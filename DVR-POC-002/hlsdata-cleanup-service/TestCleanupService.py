@@ -1,9 +1,9 @@
 import unittest
-from unittest.mock import patch, mock_open, MagicMock
+from unittest.mock import patch, mock_open, MagicMock, call
 import os
 from io import StringIO
 import logging
-from main import load_config, clean_old_segments
+from main import load_config, clean_old_segments, delete_file
 from datetime import datetime, timedelta
 
 class TestCleanupService(unittest.TestCase):
@@ -35,5 +35,35 @@ class TestCleanupService(unittest.TestCase):
             self.assertIn('Deleted old file:', log.output[-2])
             self.assertIn('Total files deleted: 1', log.output[-1])
 
+    @patch('os.path.getmtime',
+        return_value=(datetime.now() - timedelta(minutes=40)).timestamp())
+    @patch('os.remove')
+    def test_part_files_are_not_removed_as_segments(self, mock_remove, mock_getmtime):
+        cutoff_time = datetime.now() - timedelta(minutes=30)
+        part = os.path.join('hls_data', '1280x720', 'part_837223.2.ts')
+        self.assertEqual(delete_file(part, cutoff_time, 'part_837223.2.ts'), [])
+        mock_remove.assert_called_once_with(part)
+
+        segment = os.path.join('hls_data', '1280x720', 'playlist_1280x720_20240716__837223.ts')
+        self.assertEqual(delete_file(segment, cutoff_time, 'playlist_1280x720_20240716__837223.ts'),
+            [('ts', '1280x720', 837223)])
+
+    @patch('os.path.exists', return_value=True)
+    @patch('os.walk', return_value=[
+        (os.path.join('hls_data', '1280x720'), [], ['playlist_1280x720_080950__2.ts',
+            'playlist_1280x720_080950__1.ts', 'part_3.0.ts']),
+        (os.path.join('hls_data', 'eng'), [], ['playlist_webvtt_080950__1.vtt'])])
+    @patch('os.path.getmtime',
+        return_value=(datetime.now() - timedelta(minutes=40)).timestamp())
+    @patch('os.remove')
+    @patch('main.remove_metadata_batch')
+    def test_metadata_is_removed_with_one_request_per_track(self, mock_remove_batch, mock_remove,
+            mock_getmtime, mock_walk, mock_exists):
+        clean_old_segments('hls_data', 30, set(), 'http://localhost:8000')
+        self.assertEqual(mock_remove.call_count, 4)
+        self.assertCountEqual(mock_remove_batch.call_args_list, [
+            call('http://localhost:8000', 'ts', '1280x720', [1, 2]),
+            call('http://localhost:8000', 'vtt', 'eng', [1])])
+
 if __name__ == "__main__":
     unittest.main()
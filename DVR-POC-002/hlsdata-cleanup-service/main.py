@@ -2,6 +2,7 @@
 import os
 import time
 import json
+import struct
 from datetime import datetime, timedelta
 import logging
 from logging.handlers import TimedRotatingFileHandler
@@ -64,57 +65,79 @@ def parse_vtt_file(file_path):
         logging.error(f"Failed to parse VTT file path {file_path}: {e}")
         return None, None
 
-def remove_ts_metadata(api_base_url, resolution, sequence_number):
-    """Call the FastAPI endpoint to remove TS metadata."""
-    url = f"{api_base_url}/remove_tsmetadata/{resolution}/{sequence_number}"
+# Slot layout of the pack index written by hls-download/segment_pack.py
+PACK_INDEX_RECORD = struct.Struct('<QI')
+
+def parse_pack_index(file_path):
+    """Extract the track and the packed sequence numbers from a pack index file."""
     try:
-        response = requests.delete(url)
-        if response.status_code == 200:
-            logging.info(f"Successfully removed TS metadata: {resolution}, {sequence_number}")
-        else:
-            logging.error(f"Failed to remove TS metadata: {resolution}, {sequence_number}, status code: {response.status_code}")
+        parts = file_path.split(os.sep)
+        track = parts[-2]
+        pack_id = int(parts[-1].rsplit('_', 1)[-1].split('.')[0])
+        with open(file_path, 'rb') as index_file:
+            index = index_file.read()
+        # the writer pre-sizes the index, so its size gives the pack capacity
+        segments_per_pack = len(index) // PACK_INDEX_RECORD.size
+        records = PACK_INDEX_RECORD.iter_unpack(index[:segments_per_pack * PACK_INDEX_RECORD.size])
+        sequence_numbers = [pack_id * segments_per_pack + slot
+            for slot, (_, length) in enumerate(records) if length > 0]
+        return track, sequence_numbers
     except Exception as e:
-        logging.error(f"Exception during TS metadata removal: {e}")
+        logging.error(f"Failed to parse pack index {file_path}: {e}")
+        return None, []
 
-def remove_vtt_metadata(api_base_url, language, sequence_number):
-    """Call the FastAPI endpoint to remove VTT metadata."""
-    url = f"{api_base_url}/remove_vttmetadata/{language}/{sequence_number}"
+def remove_metadata_batch(api_base_url, kind, track, sequence_numbers):
+    """Call the FastAPI endpoint to remove the TS or VTT metadata of a track's deleted segments at once."""
+    url = f"{api_base_url}/remove_{kind}metadata_batch/{track}"
     try:
-        response = requests.delete(url)
+        response = requests.post(url, json={"sequence_numbers": sequence_numbers})
         if response.status_code == 200:
-            logging.info(f"Successfully removed VTT metadata: {language}, {sequence_number}")
+            logging.info(f"Successfully removed {kind.upper()} metadata of {len(sequence_numbers)} segments of {track}")
         else:
-            logging.error(f"Failed to remove VTT metadata: {language}, {sequence_number}, status code: {response.status_code}")
+            logging.error(f"Failed to remove {kind.upper()} metadata of {track}: {sequence_numbers}, status code: {response.status_code}")
     except Exception as e:
-        logging.error(f"Exception during VTT metadata removal: {e}")
+        logging.error(f"Exception during {kind.upper()} metadata removal: {e}")
 
 ###############Utility Methods Ends here##############
 
-def delete_file(file_path, cutoff_time, file, api_base_url):
-    """Deletes a single file if it is older than the cutoff time."""
+def delete_file(file_path, cutoff_time, file):
+    """Deletes a single file if it is older than the cutoff time. Returns the (kind, track,
+    sequence number) index entries of the deleted segments, None if nothing was deleted."""
     try:
         file_mod_time = datetime.fromtimestamp(os.path.getmtime(file_path))
         if file_mod_time < cutoff_time:
+            # a pack index has to be read before it is gone, it names the packed segments
+            packed_track, packed_sequences = (None, [])
+            if file.endswith('.idx'):
+                packed_track, packed_sequences = parse_pack_index(file_path)
+
             os.remove(file_path)
             logging.info(f"Deleted old file: {file_path}")
 
-            # Remove metadata
-            if file.endswith('.ts'):
+            # Metadata to remove, batched per track by the caller
+            if file.startswith('part_'):
+                # LL-HLS parts (part_{seq}.{index}.ts) are not indexed as segments,
+                # hls-server drops the parts of old segments by itself
+                return []
+            elif file.endswith('.ts'):
                 resolution, sequence_number = parse_ts_file(file_path)
-                if resolution and sequence_number:
-                    remove_ts_metadata(api_base_url, resolution, sequence_number)
+                if resolution and sequence_number is not None:
+                    return [('ts', resolution, sequence_number)]
             elif file.endswith('.vtt'):
                 language, sequence_number = parse_vtt_file(file_path)
-                if language and sequence_number:
-                    remove_vtt_metadata(api_base_url, language, sequence_number)
-            
-            return True
+                if language and sequence_number is not None:
+                    return [('vtt', language, sequence_number)]
+            elif packed_track:
+                # the track directory is a resolution like 1920x1080 or a language like eng
+                kind = 'ts' if packed_track[0].isdigit() else 'vtt'
+                return [(kind, packed_track, sequence_number) for sequence_number in packed_sequences]
+            return []
         else:
             logging.debug(f"File retained (not old): {file_path}")
-            return False
+            return None
     except Exception as e:
         logging.error(f"Failed to delete {file_path}: {e}")
-        return False
+        return None
 
 def clean_old_segments(directory, retention_period,
      exception_set, api_base_url):
@@ -146,11 +169,19 @@ def clean_old_segments(directory, retention_period,
                     continue
 
                 file_path = os.path.join(root, file)
-                tasks.append(executor.submit(delete_file, file_path, cutoff_time, file, api_base_url))
+                tasks.append(executor.submit(delete_file, file_path, cutoff_time, file))
 
+        # (kind, track) -> sequence numbers deleted this cycle, removed with one request per track
+        removed = {}
         for future in as_completed(tasks):
-            if future.result():
+            entries = future.result()
+            if entries is not None:
                 file_count += 1
+                for kind, track, sequence_number in entries:
+                    removed.setdefault((kind, track), []).append(sequence_number)
+
+    for (kind, track), sequence_numbers in removed.items():
+        remove_metadata_batch(api_base_url, kind, track, sorted(sequence_numbers))
 
     if file_count == 0:
         logging.info("No old files were deleted during this cycle.")
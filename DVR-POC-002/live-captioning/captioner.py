@@ -0,0 +1,161 @@
+import concurrent.futures
+import logging
+import os
+import subprocess
+import time
+from collections import deque
+from threading import Lock
+
+'''
+    Live captioning stage
+
+    Every TS segment the downloader ingested for the caption source
+    resolution is turned into the WebVTT segment with the same sequence
+    number, start and duration, so the subtitle track lines up 1:1 with the
+    video segments:
+        ts -> 16 kHz mono PCM (ffmpeg, in memory) -> speech to text backend
+           -> playlist_webvtt_{timestamp}__{seq}.vtt -> /add_vttmetadata
+    Cue times are local to the segment, the X-TIMESTAMP-MAP header ties them
+    to the PTS of the first frame of the TS segment.
+
+    Segments are captioned in a worker pool. To keep the caption lag bounded
+    (about one segment duration) a segment which waited longer than
+    max_lag_seconds in the queue is not transcribed, an empty VTT segment is
+    registered instead so the track has no hole and catches up.
+'''
+
+SAMPLE_RATE = 16000
+
+
+class LocalBackend:
+    '''Stand-in speech to text backend, captions every segment with `text_for(seq)`'''
+    def __init__(self, text_for=None, delay=0.0):
+        self.text_for = text_for or (lambda seq: f"segment {seq}")
+        self.delay = delay
+
+    def transcribe(self, pcm, duration, sequence_number):
+        time.sleep(self.delay)
+        return [(0.0, duration, self.text_for(sequence_number))]
+
+
+class WhisperBackend:
+    '''faster-whisper running locally, the model is loaded once per process'''
+    def __init__(self, model_size='small', language='en', device='auto', compute_type='int8'):
+        from faster_whisper import WhisperModel
+        import numpy
+        self.numpy = numpy
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        self.language = language
+        self.lock = Lock()
+
+    def transcribe(self, pcm, duration, sequence_number):
+        audio = self.numpy.frombuffer(pcm, dtype=self.numpy.int16).astype(self.numpy.float32) / 32768.0
+        with self.lock:
+            segments, _ = self.model.transcribe(audio, language=self.language, beam_size=1)
+            return [(s.start, min(s.end, duration), s.text.strip()) for s in segments if s.text.strip()]
+
+
+def extract_audio(ts_path):
+    '''Returns (first PTS in seconds, raw s16le mono PCM) of a TS segment'''
+    probe = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=start_time',
+                            '-of', 'default=noprint_wrappers=1:nokey=1', ts_path],
+                           capture_output=True, text=True, check=True)
+    start_pts = float(probe.stdout.strip() or 0)
+    pcm = subprocess.run(['ffmpeg', '-v', 'error', '-i', ts_path, '-vn', '-ac', '1',
+                          '-ar', str(SAMPLE_RATE), '-f', 's16le', '-'],
+                         capture_output=True, check=True).stdout
+    return start_pts, pcm
+
+
+def vtt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+
+def render_vtt(cues, start_pts):
+    parts = [f"WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:{int(round(start_pts * 90000))},LOCAL:00:00:00.000\n\n"]
+    for start, end, text in cues:
+        parts.append(f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}\n{text}\n\n")
+    return ''.join(parts)
+
+
+def vtt_file_name(ts_file, sequence_number):
+    # playlist_1280x720_080950__1.ts -> playlist_webvtt_080950__1.vtt
+    timestamp = ts_file.rsplit('__', 1)[0].rsplit('_', 1)[-1]
+    return f"playlist_webvtt_{timestamp}__{sequence_number}.vtt"
+
+
+class CaptionPipeline:
+    def __init__(self, backend, segments_dir, register, language='eng-auto',
+                 workers=2, max_lag_seconds=6.0, dedup_window=256, audio_extractor=extract_audio):
+        self.backend = backend
+        self.segments_dir = segments_dir
+        # hls-server serves a language from segments_dir/<language>. A name of its own keeps
+        # the captions apart from an upstream subtitle track the downloader stores there
+        self.output_dir = os.path.join(segments_dir, language)
+        self.register = register
+        self.language = language
+        self.max_lag_seconds = max_lag_seconds
+        self.audio_extractor = audio_extractor
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        # the downloader posts every segment of the live window on each poll, only the new ones are captioned
+        self.dedup_window = dedup_window
+        self.seen_order = deque()
+        self.seen = set()
+        self.lock = Lock()
+        self.lags = deque(maxlen=100)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def submit(self, metadata):
+        '''Queues a TS segment (the /add_tsmetadata payload), returns None if it was seen already'''
+        sequence_number = metadata['sequence_number']
+        with self.lock:
+            if sequence_number in self.seen:
+                return None
+            self.seen.add(sequence_number)
+            self.seen_order.append(sequence_number)
+            if len(self.seen_order) > self.dedup_window:
+                self.seen.discard(self.seen_order.popleft())
+        return self.executor.submit(self.caption, metadata, time.monotonic())
+
+    def caption(self, metadata, queued_at):
+        sequence_number = metadata['sequence_number']
+        duration = metadata['duration']
+        ts_path = os.path.join(self.segments_dir, metadata['resolution'], metadata['ts_file'])
+        vtt_file = vtt_file_name(metadata['ts_file'], sequence_number)
+        try:
+            start_pts, pcm = self.audio_extractor(ts_path)
+            waited = time.monotonic() - queued_at
+            if waited > self.max_lag_seconds:
+                logging.warning(f"Segment {sequence_number} waited {waited:.1f}s, registered without captions")
+                cues = []
+            else:
+                cues = self.backend.transcribe(pcm, duration, sequence_number)
+
+            with open(os.path.join(self.output_dir, vtt_file), 'w') as vtt:
+                vtt.write(render_vtt(cues, start_pts))
+            self.register({
+                "language": self.language,
+                "date": metadata['date'],
+                "start_timestamp": metadata['start_timestamp'],
+                "sequence_number": sequence_number,
+                "duration": duration,
+                "vtt_file": vtt_file
+            })
+            lag = time.monotonic() - queued_at
+            self.lags.append(lag)
+            logging.info(f"Captioned segment {sequence_number} ({len(cues)} cues) in {lag:.2f}s")
+            return vtt_file
+        except Exception as e:
+            logging.error(f"Failed to caption segment {sequence_number}: {e}")
+            with self.lock:
+                self.seen.discard(sequence_number)
+            return None
+
+    def max_lag(self):
+        return max(self.lags, default=0.0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
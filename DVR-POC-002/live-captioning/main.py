@@ -0,0 +1,84 @@
+# main.py
+
+import json
+import logging
+from pathlib import Path
+from logging.handlers import TimedRotatingFileHandler
+
+import requests
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from captioner import CaptionPipeline, LocalBackend, WhisperBackend
+
+####################Loading of configuration start here##########
+try:
+    with open('config.json', 'r') as config_file:
+        config = json.load(config_file)
+except FileNotFoundError:
+    logging.error("Config file not found.")
+    raise
+except json.JSONDecodeError:
+    logging.error("Error decoding config file.")
+    raise
+
+SEGMENTS_DIR = Path(config["segments_dir"])
+API_BASE_URL = config["api_base_url"]
+LANGUAGE = config.get("language", "eng-auto")
+BACKEND = config.get("backend", "local")
+WORKERS = config.get("workers", 2)
+# upper bound of the queueing lag, about one segment duration
+MAX_LAG_SECONDS = config.get("max_lag_seconds", 6)
+####################Loading of configuration ends here##########
+
+LOGS_DIR = Path(config["logging_dir"])
+LOGS_DIR.mkdir(parents=True, exist_ok=True)
+handler = TimedRotatingFileHandler(LOGS_DIR / 'live_captioning.log', when='midnight', interval=1, backupCount=30)
+handler.suffix = "%Y-%m-%d"
+handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(filename)s:%(lineno)d:%(message)s'))
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# one session for every registration, keeps the connection to hls-server alive
+session = requests.Session()
+
+def register_vtt_segment(metadata):
+    response = session.post(f"{API_BASE_URL}/add_vttmetadata", json=metadata, timeout=5)
+    response.raise_for_status()
+
+if BACKEND == "whisper":
+    backend = WhisperBackend(config.get("whisper_model", "small"))
+else:
+    backend = LocalBackend()
+
+pipeline = CaptionPipeline(backend, SEGMENTS_DIR, register_vtt_segment,
+    language=LANGUAGE, workers=WORKERS, max_lag_seconds=MAX_LAG_SECONDS)
+
+app = FastAPI()
+
+class TSMetadataRequest(BaseModel):
+    resolution: str
+    date: str
+    start_timestamp: str
+    sequence_number: int
+    duration: float
+    ts_file: str
+
+# Called by hls-download once a segment of the caption source resolution is on disk
+@app.post("/caption_segment")
+async def caption_segment(request: TSMetadataRequest):
+    queued = pipeline.submit(request.dict()) is not None
+    return {"status": "queued" if queued else "already captioned"}
+
+@app.get("/status")
+async def status():
+    return {"max_lag_seconds": round(pipeline.max_lag(), 3), "backend": BACKEND}
+
+@app.on_event("shutdown")
+def shutdown():
+    pipeline.shutdown()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=config.get("port", 8010))
@@ -0,0 +1,46 @@
+from captioner import CaptionPipeline, LocalBackend, vtt_file_name
+
+
+def metadata(seq):
+    return {"resolution": "640x360", "date": "2024-07-16", "start_timestamp": f"08:09:{50 + seq:02d}.000",
+            "sequence_number": seq, "duration": 6.0, "ts_file": f"playlist_640x360_080950__{seq}.ts"}
+
+
+def fake_audio(ts_path):
+    return 1.4, b"\x00\x00" * 16000
+
+
+def test_segments_are_captioned_and_registered_once(tmp_path):
+    registered = []
+    pipeline = CaptionPipeline(LocalBackend(), tmp_path / "hls_data", registered.append,
+                               workers=2, audio_extractor=fake_audio)
+    futures = [pipeline.submit(metadata(seq)) for seq in (1, 2)]
+    # the downloader posts the whole live window again on its next poll
+    assert pipeline.submit(metadata(1)) is None
+    assert [f.result() for f in futures] == ["playlist_webvtt_080950__1.vtt", "playlist_webvtt_080950__2.vtt"]
+    pipeline.shutdown()
+
+    assert sorted(r["sequence_number"] for r in registered) == [1, 2]
+    first = next(r for r in registered if r["sequence_number"] == 1)
+    assert (first["language"], first["start_timestamp"], first["duration"]) == ("eng-auto", "08:09:51.000", 6.0)
+    # the directory hls-server serves the registered language from, not the upstream eng one
+    assert (tmp_path / "hls_data" / "eng-auto" / "playlist_webvtt_080950__1.vtt").read_text() == (
+        "WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:126000,LOCAL:00:00:00.000\n\n"
+        "00:00:00.000 --> 00:00:06.000\nsegment 1\n\n")
+
+
+def test_lagging_segments_are_registered_empty(tmp_path):
+    registered = []
+    pipeline = CaptionPipeline(LocalBackend(delay=0.2), tmp_path / "hls_data", registered.append,
+                               workers=1, max_lag_seconds=0.1, audio_extractor=fake_audio)
+    futures = [pipeline.submit(metadata(seq)) for seq in (1, 2, 3)]
+    for future in futures:
+        future.result()
+    pipeline.shutdown()
+
+    # 1 is captioned, 2 and 3 waited longer than the bound and are skipped to catch up
+    captions = tmp_path / "hls_data" / "eng-auto"
+    assert "segment 1" in (captions / vtt_file_name(metadata(1)["ts_file"], 1)).read_text()
+    assert "-->" not in (captions / vtt_file_name(metadata(2)["ts_file"], 2)).read_text()
+    assert len(registered) == 3
+    assert pipeline.max_lag() < 0.2 * 3
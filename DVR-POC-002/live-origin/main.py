@@ -0,0 +1,97 @@
+# main.py
+
+import json
+import logging
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from origin import EdgeProbe, LiveOrigin
+
+####################Loading of configuration start here##########
+try:
+    with open('config.json', 'r') as config_file:
+        config = json.load(config_file)
+except FileNotFoundError:
+    logging.error("Config file not found.")
+    raise
+except json.JSONDecodeError:
+    logging.error("Error decoding config file.")
+    raise
+
+RENDITIONS = config["renditions"]
+LANGUAGES = config.get("languages", ["eng"])
+FAULTS = config.get("faults", {})
+EDGE_PROBE = config.get("edge_probe", {})
+####################Loading of configuration ends here##########
+
+logging.basicConfig(level=config.get("log_level", "INFO"),
+    format='%(asctime)s:%(levelname)s:%(filename)s:%(lineno)d:%(message)s')
+
+origin = LiveOrigin(RENDITIONS, LANGUAGES,
+    segment_duration=config.get("segment_duration", 6.0),
+    window_segments=config.get("window_segments", 10),
+    retain_segments=config.get("retain_segments", 60),
+    segment_bytes=config.get("segment_bytes"),
+    jitter_seconds=FAULTS.get("jitter_seconds", 0.0),
+    loss_rate=FAULTS.get("loss_rate", 0.0),
+    stall_every_seconds=FAULTS.get("stall_every_seconds", 0),
+    stall_duration_seconds=FAULTS.get("stall_duration_seconds", 0),
+    seed=config.get("seed", 1))
+
+# the probe times the whole ingest path, origin -> hls-download -> hls-server live playlist
+probe = None
+if EDGE_PROBE.get("enabled", False):
+    probe = EdgeProbe(origin, EDGE_PROBE["server_url"], [r["resolution"] for r in RENDITIONS],
+        EDGE_PROBE.get("interval_seconds", 0.5)).start()
+
+app = FastAPI()
+
+def respond(status, body, media_type):
+    if status != 200:
+        raise HTTPException(status_code=status)
+    return Response(content=body, media_type=media_type,
+        # live playlists change every segment duration, a CDN must not keep them longer
+        headers={"Cache-Control": "max-age=1" if media_type == "application/vnd.apple.mpegurl" else "max-age=3600"})
+
+@app.get("/playlist.m3u8")
+async def master_playlist():
+    return respond(*origin.get_playlist(), "application/vnd.apple.mpegurl")
+
+@app.get("/{track}/{name}")
+async def track_file(track: str, name: str):
+    if name.endswith(".m3u8"):
+        return respond(*origin.get_playlist(track), "application/vnd.apple.mpegurl")
+    media_type = "video/mp2t" if name.endswith(".ts") else "text/vtt"
+    return respond(*origin.get_segment(track, name), media_type)
+
+class StallRequest(BaseModel):
+    seconds: float
+
+# Freezes the playlists now, for failover and recovery tests driven by a script
+@app.post("/stall")
+async def stall(request: StallRequest):
+    origin.stall(request.seconds)
+    return {"status": "stalled", "seconds": request.seconds}
+
+class FaultsRequest(BaseModel):
+    loss_rate: float
+
+@app.post("/faults")
+async def faults(request: FaultsRequest):
+    origin.loss_rate = request.loss_rate
+    return {"loss_rate": origin.loss_rate}
+
+@app.get("/stats")
+async def stats():
+    return origin.stats()
+
+@app.on_event("shutdown")
+def shutdown():
+    if probe:
+        probe.stop()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=config.get("port", 8020))
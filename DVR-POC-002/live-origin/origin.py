@@ -0,0 +1,301 @@
+import logging
+import math
+import random
+import re
+import time
+import urllib.request
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+
+'''
+    Synthetic live origin
+
+    Publishes what the CloudFront origin of the encoder publishes, without
+    an encoder: a master playlist, one sliding media playlist per rendition
+    and WebVTT subtitle tracks, with segments named like the real ones
+    (playlist_{resolution}_{HHMMSS}__{seq}.ts, playlist_webvtt_{HHMMSS}__{seq}.vtt)
+    so hls-download, Segment_Generator and hls-server run unchanged against it.
+
+    Segment n of every track is published once it is fully "encoded", at
+        epoch + (n + 1) * segment_duration + jitter(n)
+    The jitter is drawn from a generator seeded with (seed, n), so two runs
+    with the same config publish the same timeline.
+
+    Faults:
+        loss_rate   share of the playlist and segment requests answered with
+                    503, as a CDN does when the origin fetch fails
+        stalls      periodic (stall_every_seconds/stall_duration_seconds) or
+                    injected at runtime: the playlists freeze, afterwards the
+                    segments encoded meanwhile appear at once, like an encoder
+                    flushing its buffer after a network outage
+
+    The origin measures the ingest side of a run itself: publish to first
+    fetch latency per track, how long the ingest took to fetch the first new
+    segment after a stall ended, and with an EdgeProbe the time until a
+    segment is listed in the hls-server live playlist.
+
+    End to end run on one box: start main.py (port 8020), point "hls_url" of
+    hls-download and Segment_Generator at http://localhost:8020/playlist.m3u8,
+    enable "edge_probe" when hls-server runs, then read GET /stats.
+'''
+
+TS_PACKET_SIZE = 188
+SEGMENT_PATTERN = re.compile(r'__(\d+)\.(ts|vtt)$')
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda percent: ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+    return {"count": len(ordered), "p50": round(pick(50), 3), "p99": round(pick(99), 3), "max": round(ordered[-1], 3)}
+
+
+class LiveOrigin:
+    def __init__(self, renditions, languages=('eng',), segment_duration=6.0, window_segments=10,
+                 retain_segments=60, segment_bytes=None, jitter_seconds=0.0, loss_rate=0.0,
+                 stall_every_seconds=0, stall_duration_seconds=0, seed=1, clock=time.time):
+        '''renditions: [{"resolution": "1280x720", "bandwidth": 2500000}], segment_bytes overrides the bitrate'''
+        self.renditions = {r["resolution"]: r for r in renditions}
+        self.languages = list(languages)
+        self.segment_duration = segment_duration
+        self.window_segments = window_segments
+        self.retain_segments = max(retain_segments, window_segments)
+        # jitter beyond one segment duration would publish segments out of order
+        self.jitter_seconds = min(jitter_seconds, segment_duration * 0.99)
+        self.loss_rate = loss_rate
+        self.stall_every_seconds = stall_every_seconds
+        self.stall_duration_seconds = stall_duration_seconds
+        self.seed = seed
+        self.clock = clock
+        self.epoch = clock()
+        self.injected_stalls = []
+
+        self.payloads = {}
+        for resolution, rendition in self.renditions.items():
+            size = segment_bytes or int(rendition.get("bandwidth", 1000000) * segment_duration / 8)
+            packets = max(2, size // TS_PACKET_SIZE)
+            self.payloads[resolution] = (b'\x47' + b'\xff' * (TS_PACKET_SIZE - 1)) * (packets - 1)
+
+        self.lock = Lock()
+        self.random = random.Random(seed)
+        self.requests = defaultdict(int)
+        self.bytes_served = 0
+        self.first_fetched = defaultdict(set)
+        self.fetch_latency = defaultdict(lambda: deque(maxlen=10000))
+        self.edge_latency = defaultdict(lambda: deque(maxlen=10000))
+        self.recoveries = {}
+
+    # timeline
+
+    def publish_time(self, sequence_number):
+        jitter = random.Random(self.seed * 1000003 + sequence_number).uniform(0, self.jitter_seconds) \
+            if self.jitter_seconds else 0.0
+        return self.epoch + (sequence_number + 1) * self.segment_duration + jitter
+
+    def stalls(self, now):
+        '''(start, end) of every stall which began before now'''
+        stalls = [stall for stall in self.injected_stalls if stall[0] <= now]
+        if self.stall_every_seconds and self.stall_duration_seconds:
+            for k in range(1, int((now - self.epoch) // self.stall_every_seconds) + 1):
+                start = self.epoch + k * self.stall_every_seconds
+                stalls.append((start, start + self.stall_duration_seconds))
+        return sorted(stalls)
+
+    def stall(self, seconds):
+        now = self.clock()
+        with self.lock:
+            self.injected_stalls.append((now, now + seconds))
+        logging.info("Injected a %.1fs stall", seconds)
+
+    def newest_sequence(self, now=None):
+        '''Newest published sequence number, -1 before the first segment'''
+        now = self.clock() if now is None else now
+        effective = now
+        for start, end in self.stalls(now):
+            if start <= now < end:
+                effective = start
+        newest = int((effective - self.epoch) // self.segment_duration) - 1
+        if newest >= 0 and self.publish_time(newest) > effective:
+            newest -= 1
+        return newest
+
+    def segment_start(self, sequence_number):
+        return datetime.fromtimestamp(self.epoch + sequence_number * self.segment_duration, timezone.utc)
+
+    def segment_name(self, track, sequence_number):
+        stamp = self.segment_start(sequence_number).strftime('%H%M%S')
+        if track in self.renditions:
+            return f"playlist_{track}_{stamp}__{sequence_number}.ts"
+        return f"playlist_webvtt_{stamp}__{sequence_number}.vtt"
+
+    # playlists
+
+    def master_playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for language in self.languages:
+            lines.append(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{language}",LANGUAGE="{language}",'
+                         f'AUTOSELECT=YES,DEFAULT=NO,URI="{language}/playlist_webvtt.m3u8"')
+        subtitles = ',SUBTITLES="subs"' if self.languages else ''
+        for resolution, rendition in self.renditions.items():
+            lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={rendition.get('bandwidth', 1000000)},"
+                         f"RESOLUTION={resolution}{subtitles}")
+            lines.append(f"{resolution}/playlist_{resolution}.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self, track):
+        newest = self.newest_sequence()
+        first = max(0, newest - self.window_segments + 1)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3",
+                 f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_duration)}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for sequence_number in range(first, newest + 1):
+            program_date_time = self.segment_start(sequence_number).isoformat(timespec='milliseconds')
+            lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{program_date_time.replace('+00:00', 'Z')}")
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            lines.append(self.segment_name(track, sequence_number))
+        return "\n".join(lines) + "\n"
+
+    # segments
+
+    def ts_payload(self, resolution, sequence_number):
+        # the first packet carries the sequence number, so no two segments have the same bytes
+        header = b'\x47' + f"{resolution}:{sequence_number}".encode().ljust(TS_PACKET_SIZE - 1, b'\xff')
+        return header + self.payloads[resolution]
+
+    def vtt_payload(self, language, sequence_number):
+        start = sequence_number * self.segment_duration
+        return (f"WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:{int(start * 90000)},LOCAL:00:00:00.000\n\n"
+                f"00:00:00.000 --> 00:00:{self.segment_duration:06.3f}\n"
+                f"{language} caption {sequence_number}\n").encode()
+
+    def inject_loss(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+            if self.loss_rate and self.random.random() < self.loss_rate:
+                self.requests[f"{kind}_lost"] += 1
+                return True
+        return False
+
+    def get_playlist(self, track=None):
+        '''(status, body) of the master playlist or the media playlist of a track'''
+        if self.inject_loss("playlist"):
+            return 503, None
+        if track is None:
+            return 200, self.master_playlist()
+        if track not in self.renditions and track not in self.languages:
+            return 404, None
+        return 200, self.media_playlist(track)
+
+    def get_segment(self, track, name):
+        '''(status, body) of a TS or VTT segment of a track'''
+        match = SEGMENT_PATTERN.search(name)
+        if match is None or (track not in self.renditions and track not in self.languages):
+            return 404, None
+        if self.inject_loss("segment"):
+            return 503, None
+        sequence_number = int(match.group(1))
+        now = self.clock()
+        newest = self.newest_sequence(now)
+        if not newest - self.retain_segments < sequence_number <= newest or \
+                name != self.segment_name(track, sequence_number):
+            return 404, None
+        body = self.ts_payload(track, sequence_number) if track in self.renditions \
+            else self.vtt_payload(track, sequence_number)
+        self.record_fetch(track, sequence_number, now, len(body))
+        return 200, body
+
+    # measurements
+
+    def record_fetch(self, track, sequence_number, now, size):
+        with self.lock:
+            self.bytes_served += size
+            fetched = self.first_fetched[track]
+            if sequence_number in fetched:
+                return
+            fetched.add(sequence_number)
+            if len(fetched) > 4 * self.retain_segments:
+                oldest = sequence_number - self.retain_segments
+                fetched.difference_update([n for n in fetched if n < oldest])
+            published = self.publish_time(sequence_number)
+            stalls = self.stalls(now)
+            self.fetch_latency[track].append(max(0.0, now - self.stall_end(published, stalls)))
+            for start, end in stalls:
+                # the first segment encoded during or after the stall marks the recovery of the track
+                if end <= now and published > start and (start, track) not in self.recoveries:
+                    self.recoveries[(start, track)] = now - end
+
+    @staticmethod
+    def stall_end(moment, stalls):
+        # when a moment was published, a segment encoded during a stall only appears when the stall ends
+        for start, end in stalls:
+            if start <= moment < end:
+                return end
+        return moment
+
+    def record_edge(self, track, sequence_number, now):
+        published = self.publish_time(sequence_number)
+        self.edge_latency[track].append(max(0.0, now - self.stall_end(published, self.stalls(now))))
+
+    def stats(self):
+        now = self.clock()
+        elapsed = now - self.epoch
+        with self.lock:
+            requests = dict(self.requests)
+            bytes_served = self.bytes_served
+            recoveries = [{"stall_start": round(start - self.epoch, 3), "track": track, "seconds": round(seconds, 3)}
+                          for (start, track), seconds in sorted(self.recoveries.items())]
+        return {
+            "uptime_seconds": round(elapsed, 3),
+            "newest_sequence": self.newest_sequence(now),
+            "requests": requests,
+            "bytes_served": bytes_served,
+            "ingest_throughput_bps": round(bytes_served * 8 / elapsed, 1) if elapsed > 0 else 0.0,
+            "fetch_latency_seconds": {track: percentiles(list(samples)) for track, samples in self.fetch_latency.items()},
+            "edge_latency_seconds": {track: percentiles(list(samples)) for track, samples in self.edge_latency.items()},
+            "stall_recoveries": recoveries,
+        }
+
+
+class EdgeProbe:
+    '''Polls the hls-server live playlists and records when each segment shows up in them'''
+    def __init__(self, origin, server_url, tracks, interval=0.5):
+        self.origin = origin
+        self.server_url = server_url.rstrip('/')
+        self.tracks = tracks
+        self.interval = interval
+        self.newest = {}
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def poll(self, track):
+        url = f"{self.server_url}/playlist_{track}.m3u8"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            playlist = response.read().decode()
+        sequence_numbers = [int(match.group(1)) for match in map(SEGMENT_PATTERN.search, playlist.split()) if match]
+        if not sequence_numbers:
+            return
+        now = self.origin.clock()
+        newest = max(sequence_numbers)
+        # the first poll only sets the mark, the segments listed already are not timed
+        if track in self.newest:
+            for sequence_number in range(self.newest[track] + 1, newest + 1):
+                self.origin.record_edge(track, sequence_number, now)
+        self.newest[track] = max(newest, self.newest.get(track, newest))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for track in self.tracks:
+                try:
+                    self.poll(track)
+                except Exception as e:
+                    logging.debug("Edge probe of %s failed: %s", track, e)
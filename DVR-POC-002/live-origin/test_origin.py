@@ -0,0 +1,65 @@
+from origin import LiveOrigin
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_origin(clock, **kwargs):
+    return LiveOrigin([{"resolution": "1280x720", "bandwidth": 2800000}], ["eng"], segment_duration=6.0,
+                      window_segments=3, clock=clock, **kwargs)
+
+
+def segment_lines(playlist):
+    return [line for line in playlist.splitlines() if line and not line.startswith('#')]
+
+
+def test_playlist_slides_and_segments_are_served():
+    clock = Clock()
+    origin = make_origin(clock, segment_bytes=188 * 10)
+    assert segment_lines(origin.get_playlist("1280x720")[1]) == []
+    clock.now += 6 * 5
+    status, playlist = origin.get_playlist("1280x720")
+    assert status == 200 and "#EXT-X-MEDIA-SEQUENCE:2" in playlist
+    names = segment_lines(playlist)
+    assert [int(name.split('__')[-1].split('.')[0]) for name in names] == [2, 3, 4]
+    status, body = origin.get_segment("1280x720", names[-1])
+    assert status == 200 and len(body) == 188 * 10 and body[0] == 0x47
+    # not published yet
+    assert origin.get_segment("1280x720", names[-1].replace("__4.", "__5."))[0] == 404
+    vtt = segment_lines(origin.get_playlist("eng")[1])
+    status, body = origin.get_segment("eng", vtt[0])
+    assert status == 200 and body.startswith(b"WEBVTT")
+    assert 'URI="eng/playlist_webvtt.m3u8"' in origin.get_playlist()[1]
+
+
+def test_stall_freezes_then_bursts_and_recovery_is_measured():
+    clock = Clock()
+    origin = make_origin(clock)
+    clock.now += 6 * 5
+    origin.stall(18)
+    clock.now += 12
+    assert origin.newest_sequence() == 4
+    clock.now += 7
+    assert origin.newest_sequence() == 7
+    name = segment_lines(origin.get_playlist("1280x720")[1])[-1]
+    clock.now += 0.5
+    origin.get_segment("1280x720", name)
+    recovery = origin.stats()["stall_recoveries"]
+    assert recovery == [{"stall_start": 30.0, "track": "1280x720", "seconds": 1.5}]
+
+
+def test_loss_and_jitter_are_reproducible():
+    runs = []
+    for _ in range(2):
+        clock = Clock()
+        origin = make_origin(clock, loss_rate=0.3, jitter_seconds=2.0, seed=7)
+        runs.append(([origin.get_playlist("1280x720")[0] for _ in range(50)],
+                     [origin.publish_time(n) - origin.epoch for n in range(10)]))
+    assert runs[0] == runs[1]
+    assert 5 < runs[0][0].count(503) < 30
+    assert all(6 * (n + 1) <= t < 6 * (n + 2) for n, t in enumerate(runs[0][1]))
@@ -1,9 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from pathlib import Path
 import os
-from datetime import datetime, timedelta
+from bisect import bisect_left
 import logging
 
+from segment_index import SegmentIndex
+from pause_store import PauseStore
+
 app = FastAPI()
 
 # Configuration
@@ -11,55 +14,85 @@ SEGMENTS_DIR = Path("../hls-download/hls_data")
 SEGMENT_DURATION = 6  # Duration of each segment in seconds
 MAX_PAUSE_DURATION = 30  # Max pause duration in minutes
 
-# For demonstration, using a simple dictionary to store paused positions and timestamps
-paused_positions = {}
-
-def get_segments(resolution: str) -> list:
-    """Returns a list of all segment files for a given resolution sorted by name."""
+# Paused positions as absolute media sequence numbers, expired after MAX_PAUSE_DURATION
+pause_store = PauseStore(ttl_seconds=MAX_PAUSE_DURATION * 60)
+
+# Incrementally maintained segment lists, keyed by (directory, suffix)
+segment_indexes = {}
+# Rendered manifests per resolution, only valid for the segment set versions they were built from
+# resolution -> {"versions": (segment_version, subtitle_version), "by_start": {start_index: manifest}}
+manifest_cache = {}
+
+def get_segment_index(directory: Path, suffix: str) -> SegmentIndex:
+    key = (directory, suffix)
+    index = segment_indexes.get(key)
+    if index is None:
+        index = segment_indexes.setdefault(key, SegmentIndex(directory, suffix, SEGMENT_DURATION))
+    index.refresh()
+    return index
+
+def get_segments(resolution: str) -> SegmentIndex:
+    """Returns the up to date segment index for a given resolution, sorted by name."""
     resolution_dir = SEGMENTS_DIR / resolution
     if not resolution_dir.exists():
         raise HTTPException(status_code=404, detail=f"Resolution directory {resolution} not found.")
-    return sorted(resolution_dir.glob('*.ts'), key=lambda x: x.name)
+    return get_segment_index(resolution_dir, '.ts')
 
-def get_subtitle_segments() -> list:
-    """Returns a list of all subtitle files sorted by name."""
+def get_subtitle_segments() -> SegmentIndex:
+    """Returns the up to date subtitle index, sorted by name."""
     subtitle_dir = SEGMENTS_DIR / 'eng'
     if not subtitle_dir.exists():
         raise HTTPException(status_code=404, detail="Subtitle directory 'eng' not found.")
-    return sorted(subtitle_dir.glob('*.vtt'), key=lambda x: x.name)
+    return get_segment_index(subtitle_dir, '.vtt')
+
+def get_cached_manifest(cache_key: str, versions: tuple, start_index: int):
+    cache = manifest_cache.get(cache_key)
+    if cache is None or cache["versions"] != versions:
+        # the segment set changed, every manifest rendered from the old one is stale
+        cache = {"versions": versions, "by_start": {}}
+        manifest_cache[cache_key] = cache
+    return cache["by_start"].get(start_index), cache["by_start"]
+
+def render_manifest(media_sequence: int, entries: list, trailer: str = "") -> str:
+    """Renders a manifest with a single join over the pre-rendered segment entries."""
+    return "".join([
+        "#EXTM3U\n#EXT-X-VERSION:3\n",
+        f"#EXT-X-TARGETDURATION:{SEGMENT_DURATION}\n",
+        f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}\n",
+        *entries,
+        trailer,
+    ])
 
 @app.get("/manifest/{resolution}")
 async def get_manifest(resolution: str, pause_id: str = None):
     """Generate and return the HLS manifest dynamically based on pause position."""
     try:
-        segment_files = get_segments(resolution)
-        subtitle_files = get_subtitle_segments()
+        segment_version, segment_files, segment_entries, segment_sequences = get_segments(resolution).snapshot()
+        subtitle_version, subtitle_files, _, _ = get_subtitle_segments().snapshot()
         start_index = max(0, len(segment_files) - 10)  # Default to the latest 10 segments
 
-        if pause_id and pause_id in paused_positions:
-            pause_info = paused_positions[pause_id]
-            paused_time = pause_info['timestamp']
-            current_time = datetime.now()
+        # An expired pause is already evicted from the store, so it plays live
+        pause_session = pause_store.get(pause_id) if pause_id else None
+        if pause_session:
+            pause_position = bisect_left(segment_sequences, pause_session.media_sequence)
+            start_index = max(0, pause_position - 1)
 
-            if current_time - paused_time < timedelta(minutes=MAX_PAUSE_DURATION):
-                pause_position = pause_info['segment']
-                start_index = max(0, pause_position - 1)
+        manifest_content, cached = get_cached_manifest(resolution,
+            (segment_version, subtitle_version), start_index)
+        if manifest_content is not None:
+            return manifest_content
 
         end_index = min(start_index + 10, len(segment_files))
-        segments_to_serve = segment_files[start_index:end_index]
-        subtitles_to_serve = subtitle_files[start_index:end_index] if len(subtitle_files) >= end_index else []
-
-        manifest_content = "#EXTM3U\n#EXT-X-VERSION:3\n"
-        manifest_content += f"#EXT-X-TARGETDURATION:{SEGMENT_DURATION}\n"
-        manifest_content += f"#EXT-X-MEDIA-SEQUENCE:{start_index}\n"
-        
-        for seg in segments_to_serve:
-            manifest_content += f"#EXTINF:{SEGMENT_DURATION},\n{seg.name}\n"
-
-        if subtitles_to_serve:
-            manifest_content += "#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID=\"subs\",NAME=\"English\",DEFAULT=YES,AUTOSELECT=YES,LANGUAGE=\"en\",URI=\"subtitles.m3u8\"\n"
+        subtitles_to_serve = start_index < end_index <= len(subtitle_files)
+        subtitle_media = "#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID=\"subs\",NAME=\"English\",DEFAULT=YES,AUTOSELECT=YES,LANGUAGE=\"en\",URI=\"subtitles.m3u8\"\n"
 
+        media_sequence = segment_sequences[start_index] if start_index < len(segment_sequences) else 0
+        manifest_content = render_manifest(media_sequence, segment_entries[start_index:end_index],
+            subtitle_media if subtitles_to_serve else "")
+        cached[start_index] = manifest_content
         return manifest_content
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -67,45 +100,45 @@ async def get_manifest(resolution: str, pause_id: str = None):
 async def get_subtitle_manifest():
     """Generate and return the subtitle manifest."""
     try:
-        subtitle_files = get_subtitle_segments()
+        subtitle_version, subtitle_files, subtitle_entries, subtitle_sequences = get_subtitle_segments().snapshot()
         start_index = max(0, len(subtitle_files) - 10)  # Default to the latest 10 subtitles
 
-        end_index = min(start_index + 10, len(subtitle_files))
-        subtitles_to_serve = subtitle_files[start_index:end_index]
-
-        manifest_content = "#EXTM3U\n#EXT-X-VERSION:3\n"
-        manifest_content += f"#EXT-X-TARGETDURATION:{SEGMENT_DURATION}\n"
-        manifest_content += f"#EXT-X-MEDIA-SEQUENCE:{start_index}\n"
-
-        for sub in subtitles_to_serve:
-            manifest_content += f"#EXTINF:{SEGMENT_DURATION},\n{sub.name}\n"
+        manifest_content, cached = get_cached_manifest("subtitles", (subtitle_version,), start_index)
+        if manifest_content is not None:
+            return manifest_content
 
+        end_index = min(start_index + 10, len(subtitle_files))
+        media_sequence = subtitle_sequences[start_index] if start_index < len(subtitle_sequences) else 0
+        manifest_content = render_manifest(media_sequence, subtitle_entries[start_index:end_index])
+        cached[start_index] = manifest_content
         return manifest_content
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/pause/{pause_id}")
 async def pause_stream(pause_id: str, resolution: str):
     """Store the current position of the stream when paused."""
-    segment_files = get_segments(resolution)
-    if not segment_files:
+    _, _, _, segment_sequences = get_segments(resolution).snapshot()
+    if not segment_sequences:
         raise HTTPException(status_code=404, detail="No segments found.")
-    current_segment = len(segment_files) - 1
-    paused_positions[pause_id] = {
-        "segment": current_segment,
-        "timestamp": datetime.now(),
-        "resolution": resolution
-    }
+    current_segment = segment_sequences[-1]
+    pause_store.pause(pause_id, resolution, current_segment)
     return {"pause_id": pause_id, "paused_at_segment": current_segment}
 
 @app.post("/resume/{pause_id}")
-async def resume_stream(pause_id: str):
+async def resume_stream(pause_id: str, resolution: str = None):
     """Resume the stream from the last paused position or live if paused too long."""
-    if pause_id not in paused_positions:
-        raise HTTPException(status_code=404, detail="Pause ID not found.")
+    pause_session = pause_store.get(pause_id)
+    if pause_session:
+        resolution = pause_session.resolution
+    elif resolution is None:
+        # paused too long: the session is evicted but its resolution is kept, so it plays live
+        resolution = pause_store.expired_resolution(pause_id)
+        if resolution is None:
+            raise HTTPException(status_code=404, detail="Pause ID not found.")
     # Return the manifest which starts from the paused segment or live position
-    pause_info = paused_positions[pause_id]
-    resolution = pause_info['resolution']
     return await get_manifest(resolution, pause_id)
 
 if __name__ == "__main__":
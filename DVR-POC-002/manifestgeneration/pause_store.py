@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class PauseSession:
+    """One paused viewer, kept as small as possible since there can be millions."""
+    __slots__ = ("resolution", "media_sequence", "paused_at")
+
+    def __init__(self, resolution: str, media_sequence: int, paused_at: float):
+        self.resolution = resolution
+        self.media_sequence = media_sequence
+        self.paused_at = paused_at
+
+
+class PauseStore:
+    """Pause sessions with a fixed time to live.
+
+    Every session lives for the same `ttl_seconds`, so the pause order is also
+    the expiry order: the OrderedDict is both the lookup table and the expiry
+    queue, and expiring is popping from its front, O(1) per session. Pausing
+    again moves the session to the back. Memory is bounded by the sessions
+    paused within the last ttl (and by `max_sessions` as a hard cap).
+
+    An expired session leaves its resolution behind in `expired` for
+    `expired_ttl_seconds` (the ttl by default), so resuming it still knows
+    which live window to serve. It is dropped the same way, from the front,
+    so memory stays bounded by the sessions paused within the last two ttls.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int = 5_000_000, clock=time.monotonic,
+                 expired_ttl_seconds: float = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.expired_ttl_seconds = ttl_seconds if expired_ttl_seconds is None else expired_ttl_seconds
+        self.sessions = OrderedDict()
+        # pause_id -> (resolution, expired at) of the expired sessions, oldest first
+        self.expired = OrderedDict()
+        self.lock = Lock()
+
+    def _evict_expired(self, now: float):
+        deadline = now - self.ttl_seconds
+        sessions = self.sessions
+        while sessions:
+            session = next(iter(sessions.values()))
+            if session.paused_at > deadline and len(sessions) <= self.max_sessions:
+                break
+            pause_id, session = sessions.popitem(last=False)
+            self.expired[pause_id] = (session.resolution, now)
+            self.expired.move_to_end(pause_id)
+        expired = self.expired
+        expired_deadline = now - self.expired_ttl_seconds
+        while expired and (next(iter(expired.values()))[1] <= expired_deadline
+                           or len(expired) > self.max_sessions):
+            expired.popitem(last=False)
+
+    def pause(self, pause_id: str, resolution: str, media_sequence: int) -> PauseSession:
+        now = self.clock()
+        session = PauseSession(resolution, media_sequence, now)
+        with self.lock:
+            self.sessions[pause_id] = session
+            self.sessions.move_to_end(pause_id)
+            self.expired.pop(pause_id, None)
+            self._evict_expired(now)
+        return session
+
+    def get(self, pause_id: str):
+        """Returns the session, or None if it never existed or has expired."""
+        now = self.clock()
+        with self.lock:
+            self._evict_expired(now)
+            return self.sessions.get(pause_id)
+
+    def expired_resolution(self, pause_id: str):
+        """Returns the resolution of an expired session, or None if it is not known."""
+        with self.lock:
+            self._evict_expired(self.clock())
+            expired = self.expired.get(pause_id)
+            return expired[0] if expired else None
+
+    def __len__(self):
+        with self.lock:
+            self._evict_expired(self.clock())
+            return len(self.sessions)
@@ -0,0 +1,80 @@
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+# The directory mtime is the change detector, but its granularity is a clock
+# tick, so a directory changed within the last tick is always rescanned
+MTIME_SETTLE_NS = 50_000_000
+
+
+def sequence_of(name: str) -> int:
+    """Media sequence number of 'playlist_..._{timestamp}__{seq}.ts', -1 if the name has none."""
+    try:
+        return int(name.split("__")[1].split('.')[0])
+    except (IndexError, ValueError):
+        return -1
+
+
+class SegmentIndex:
+    """Sorted list of the segment files of one directory, maintained incrementally.
+
+    A request costs one stat() of the directory. Only when the directory has
+    changed it is rescanned, and the new names are appended (segments arrive
+    in name order) instead of re-sorting everything.
+    """
+
+    def __init__(self, directory: Path, suffix: str, segment_duration: int):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.names = []
+        # absolute media sequence number of every name
+        self.sequences = []
+        # pre-rendered "#EXTINF" entry of every name, manifests are slices of this list
+        self.entries = []
+        self.known = set()
+        self.dir_mtime_ns = None
+        self.version = 0
+        self.segment_duration = segment_duration
+        self.lock = Lock()
+
+    def refresh(self) -> int:
+        """Syncs with the directory and returns the version of the segment set."""
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        with self.lock:
+            if mtime_ns == self.dir_mtime_ns and time.time_ns() - mtime_ns > MTIME_SETTLE_NS:
+                return self.version
+
+            with os.scandir(self.directory) as entries:
+                current = {entry.name for entry in entries if entry.name.endswith(self.suffix)}
+            added = current - self.known
+            removed = self.known - current
+
+            # the lists are replaced, never mutated, so snapshots stay consistent
+            names, entries, sequences = self.names, self.entries, self.sequences
+            if removed:
+                keep = [i for i, name in enumerate(names) if name in current]
+                names = [names[i] for i in keep]
+                entries = [entries[i] for i in keep]
+                sequences = [sequences[i] for i in keep]
+            if added:
+                new_names = sorted(added)
+                if names and new_names[0] < names[-1]:
+                    # a late segment, fall back to a full merge
+                    new_names = sorted(names + new_names)
+                    names, entries, sequences = [], [], []
+                names = names + new_names
+                entries = entries + [f"#EXTINF:{self.segment_duration},\n{name}\n" for name in new_names]
+                sequences = sequences + [sequence_of(name) for name in new_names]
+            self.names, self.entries, self.sequences = names, entries, sequences
+
+            if added or removed:
+                self.known = current
+                self.version += 1
+            self.dir_mtime_ns = mtime_ns
+            return self.version
+
+    def snapshot(self):
+        """Returns (version, names, entries, sequences), the lists must not be modified."""
+        with self.lock:
+            return self.version, self.names, self.entries, self.sequences
@@ -0,0 +1,79 @@
+from pause_store import PauseStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_expire_after_ttl():
+    clock = FakeClock()
+    store = PauseStore(ttl_seconds=1800, clock=clock)
+    store.pause("a", "1280x720", 837223)
+    clock.now = 1000
+    store.pause("b", "640x360", 837400)
+
+    session = store.get("a")
+    assert (session.resolution, session.media_sequence) == ("1280x720", 837223)
+
+    clock.now = 1801
+    assert store.get("a") is None
+    assert store.get("b").media_sequence == 837400
+    assert len(store) == 1
+
+
+def test_pausing_again_renews_the_session():
+    clock = FakeClock()
+    store = PauseStore(ttl_seconds=10, clock=clock)
+    store.pause("a", "1280x720", 1)
+    store.pause("b", "1280x720", 2)
+    clock.now = 5
+    store.pause("a", "1280x720", 3)
+
+    clock.now = 12
+    assert store.get("b") is None
+    assert store.get("a").media_sequence == 3
+
+
+def test_max_sessions_bounds_memory():
+    store = PauseStore(ttl_seconds=60, max_sessions=2, clock=FakeClock())
+    for pause_id in ("a", "b", "c"):
+        store.pause(pause_id, "1280x720", 1)
+    assert store.get("a") is None
+    assert len(store) == 2
+
+
+def test_expired_session_keeps_its_resolution_for_live_resume():
+    clock = FakeClock()
+    store = PauseStore(ttl_seconds=10, clock=clock)
+    store.pause("a", "1280x720", 1)
+    clock.now = 11
+    assert store.get("a") is None
+    assert store.expired_resolution("a") == "1280x720"
+    assert store.expired_resolution("never-paused") is None
+    # pausing again makes it a live session
+    store.pause("a", "640x360", 2)
+    assert store.expired_resolution("a") is None
+
+
+def test_expired_sessions_are_forgotten_after_their_own_ttl():
+    clock = FakeClock()
+    store = PauseStore(ttl_seconds=10, clock=clock, expired_ttl_seconds=5)
+    store.pause("a", "1280x720", 1)
+    clock.now = 3
+    store.pause("b", "640x360", 2)
+    clock.now = 11
+    assert store.get("a") is None
+    assert store.expired_resolution("a") == "1280x720"
+    clock.now = 14
+    assert store.get("b") is None
+    clock.now = 16
+    # a expired at 11, b at 14
+    assert store.expired_resolution("a") is None
+    assert store.expired_resolution("b") == "640x360"
+    clock.now = 19
+    assert store.expired_resolution("b") is None
+    assert not store.expired
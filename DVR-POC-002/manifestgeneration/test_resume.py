@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import main
+from pause_store import PauseStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_resuming_an_expired_session_serves_live(tmp_path, monkeypatch):
+    for directory, suffix in (("1280x720", "ts"), ("eng", "vtt")):
+        (tmp_path / directory).mkdir()
+        for seq in range(101, 131):
+            (tmp_path / directory / f"playlist_{directory}_080950__{seq}.{suffix}").write_bytes(b"")
+    clock = FakeClock()
+    monkeypatch.setattr(main, "SEGMENTS_DIR", tmp_path)
+    monkeypatch.setattr(main, "segment_indexes", {})
+    monkeypatch.setattr(main, "manifest_cache", {})
+    monkeypatch.setattr(main, "pause_store", PauseStore(ttl_seconds=60, clock=clock))
+
+    main.pause_store.pause("viewer", "1280x720", 105)
+    assert "#EXT-X-MEDIA-SEQUENCE:104\n" in asyncio.run(main.resume_stream("viewer"))
+
+    clock.now = 61
+    # paused too long: live, without passing the resolution again
+    assert "#EXT-X-MEDIA-SEQUENCE:121\n" in asyncio.run(main.resume_stream("viewer"))
+    with pytest.raises(main.HTTPException):
+        asyncio.run(main.resume_stream("unknown"))
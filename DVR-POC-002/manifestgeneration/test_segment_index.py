@@ -0,0 +1,42 @@
+import os
+
+from segment_index import SegmentIndex
+
+
+def touch(directory, name):
+    (directory / name).write_bytes(b"")
+
+
+def test_incremental_refresh(tmp_path):
+    for seq in (1, 2, 3):
+        touch(tmp_path, f"playlist_1280x720_080950__{seq}.ts")
+    touch(tmp_path, "playlist_1280x720.m3u8")
+
+    index = SegmentIndex(tmp_path, ".ts", 6)
+    version = index.refresh()
+    _, names, entries, sequences = index.snapshot()
+    assert names == [f"playlist_1280x720_080950__{seq}.ts" for seq in (1, 2, 3)]
+    assert sequences == [1, 2, 3]
+    assert entries[0] == "#EXTINF:6,\nplaylist_1280x720_080950__1.ts\n"
+
+    # unchanged directory keeps the version, so cached manifests stay valid
+    assert index.refresh() == version
+
+    touch(tmp_path, "playlist_1280x720_080956__4.ts")
+    os.remove(tmp_path / "playlist_1280x720_080950__1.ts")
+    assert index.refresh() == version + 1
+    _, names, entries, sequences = index.snapshot()
+    assert sequences == [2, 3, 4]
+    assert names == [f"playlist_1280x720_0809{ts}__{seq}.ts" for ts, seq in (("50", 2), ("50", 3), ("56", 4))]
+    assert len(entries) == 3
+
+
+def test_late_segment_is_merged_in_order(tmp_path):
+    touch(tmp_path, "b.vtt")
+    index = SegmentIndex(tmp_path, ".vtt", 6)
+    index.refresh()
+    touch(tmp_path, "a.vtt")
+    index.refresh()
+    _, names, entries, _ = index.snapshot()
+    assert names == ["a.vtt", "b.vtt"]
+    assert entries == ["#EXTINF:6,\na.vtt\n", "#EXTINF:6,\nb.vtt\n"]
@@ -1,50 +1,143 @@
 import subprocess
 import boto3
 import os
+import json
 import logging
 
 # Import the time module
 import time  
 
+from invalidation import InvalidationBatcher
+from uploader import S3Uploader
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# The rendition ladder used across the DVR pipeline: (name, width, height, video kbps, audio kbps)
+LADDER = [
+    ('1920x1080', 1920, 1080, 5000, 128),
+    ('1280x720', 1280, 720, 2800, 128),
+    ('1024x576', 1024, 576, 1800, 96),
+    ('640x360', 640, 360, 800, 96),
+    ('384x216', 384, 216, 365, 64),
+]
+
 class MediaConverter:
-    """Class to handle media conversion from MP4 to HLS using FFmpeg."""
-    def __init__(self, input_file, output_dir):
+    """Class to handle media conversion from MP4 to a multi-rendition HLS ladder using FFmpeg."""
+    def __init__(self, input_file, output_dir, ladder=LADDER, segment_duration=6, poll_interval=1.0,
+                 threads=None):
         self.input_file = input_file
         self.output_dir = output_dir
-
-    def convert_to_hls(self):
-        """Converts an MP4 file to HLS format using FFmpeg."""
-        command = [
-            'ffmpeg', '-i', self.input_file, '-profile:v', 'baseline', '-level', '3.0',
-            '-s', '640x360', '-start_number', '0', '-hls_time', '10', '-hls_list_size', '0',
-            '-f', 'hls', f'{self.output_dir}/index.m3u8'
-        ]
+        self.ladder = ladder
+        self.segment_duration = segment_duration
+        self.poll_interval = poll_interval
+        # FFmpeg threads, set when several conversions share the machine
+        self.threads = threads
+        self.duration = None
+
+    def probe(self):
+        """Probes the input once for its duration and for an audio stream.
+
+        Returns (duration in seconds or None, has_audio). The ladder maps audio
+        only when there is one, and the duration gives the realtime factor.
+        """
+        command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration:stream=codec_type',
+                   '-of', 'json', self.input_file]
         try:
-            subprocess.run(command, check=True)
-            logging.info("Conversion completed. HLS files are in %s", self.output_dir)
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to convert video. Error: %s", e)
-
-class S3Uploader:
-    """Class to handle file uploading to AWS S3."""
-    def __init__(self, bucket_name, source_dir):
-        self.bucket_name = bucket_name
-        self.source_dir = source_dir
-        self.s3 = boto3.client('s3')
-
-    def upload_files(self):
-        """Uploads files from a directory to an S3 bucket."""
+            result = subprocess.run(command, check=True, capture_output=True, text=True)
+            info = json.loads(result.stdout)
+            duration = info.get('format', {}).get('duration')
+            has_audio = any(stream.get('codec_type') == 'audio' for stream in info.get('streams', []))
+            return (float(duration) if duration else None), has_audio
+        except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+            logging.warning("Failed to probe %s, assuming no audio. Error: %s", self.input_file, e)
+            return None, False
+
+    def build_command(self, with_audio=True):
+        """Builds one FFmpeg command which decodes the input once and encodes every rendition.
+
+        The decoded video is split with filter_complex into one scaler per rung,
+        so the (expensive) decode is shared and the encoders run in parallel.
+        """
+        count = len(self.ladder)
+        filters = [f"[0:v]split={count}" + ''.join(f"[v{i}]" for i in range(count))]
+        filters += [f"[v{i}]scale=w={width}:h={height}[v{i}out]"
+                    for i, (_, width, height, _, _) in enumerate(self.ladder)]
+
+        command = ['ffmpeg', '-y', '-i', self.input_file, '-filter_complex', ';'.join(filters)]
+        if self.threads:
+            command += ['-threads', str(self.threads)]
+        stream_map = []
+        for i, (name, _, _, video_kbps, audio_kbps) in enumerate(self.ladder):
+            command += ['-map', f'[v{i}out]', f'-c:v:{i}', 'libx264', f'-b:v:{i}', f'{video_kbps}k',
+                        f'-maxrate:v:{i}', f'{int(video_kbps * 1.07)}k', f'-bufsize:v:{i}', f'{video_kbps * 2}k']
+            if with_audio:
+                command += ['-map', 'a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', f'{audio_kbps}k']
+                stream_map.append(f'v:{i},a:{i},name:{name}')
+            else:
+                stream_map.append(f'v:{i},name:{name}')
+
+        # Keyframes on segment boundaries so every rendition cuts at the same points
+        command += ['-sc_threshold', '0', '-force_key_frames', f'expr:gte(t,n_forced*{self.segment_duration})']
+        # 'event' (not 'vod') makes FFmpeg rewrite the playlists after every segment,
+        # which is how finalized segments are detected while the job is still running
+        command += ['-f', 'hls', '-hls_time', str(self.segment_duration), '-hls_list_size', '0',
+                    '-hls_playlist_type', 'event', '-hls_flags', 'independent_segments',
+                    '-hls_segment_filename', os.path.join(self.output_dir, '%v', 'playlist_%v_%05d.ts'),
+                    '-master_pl_name', 'playlist.m3u8',
+                    '-var_stream_map', ' '.join(stream_map),
+                    os.path.join(self.output_dir, 'playlist_%v.m3u8')]
+        return command
+
+    def finalized_segments(self):
+        """Returns the segment paths already listed in the variant playlists."""
+        segments = []
+        for name, *_ in self.ladder:
+            playlist_path = os.path.join(self.output_dir, f'playlist_{name}.m3u8')
+            try:
+                with open(playlist_path, 'r') as playlist:
+                    lines = playlist.read().splitlines()
+            except FileNotFoundError:
+                continue
+            # segment uris are relative to the playlist, e.g. 1920x1080/playlist_1920x1080_00001.ts
+            segments += [os.path.join(self.output_dir, line)
+                         for line in lines if line and not line.startswith('#')]
+        return segments
+
+    def convert_to_hls(self, on_segment=None):
+        """Converts an MP4 file to the HLS ladder, calling on_segment for each finalized segment.
+
+        Returns True when FFmpeg succeeded.
+        """
+        for name, *_ in self.ladder:
+            os.makedirs(os.path.join(self.output_dir, name), exist_ok=True)
+        self.duration, has_audio = self.probe()
+        command = self.build_command(has_audio)
         try:
-            for root, _, files in os.walk(self.source_dir):
-                for file in files:
-                    if file.endswith(('.m3u8', '.ts')):
-                        self.s3.upload_file(os.path.join(root, file), self.bucket_name, file)
-                        logging.info("Uploaded %s to %s/%s", file, self.bucket_name, file)
-        except Exception as e:
-            logging.error("Failed to upload files. Error: %s", e)
+            process = subprocess.Popen(command)
+        except OSError as e:
+            logging.error("Failed to start FFmpeg. Error: %s", e)
+            return False
+
+        handled = set()
+
+        def handle_new_segments():
+            for segment in self.finalized_segments():
+                if segment not in handled:
+                    handled.add(segment)
+                    if on_segment:
+                        on_segment(segment)
+
+        while process.poll() is None:
+            handle_new_segments()
+            time.sleep(self.poll_interval)
+
+        if process.returncode != 0:
+            logging.error("Failed to convert video. FFmpeg exited with %s", process.returncode)
+            return False
+        handle_new_segments()
+        logging.info("Conversion completed. %d HLS segments are in %s", len(handled), self.output_dir)
+        return True
 
 class CloudFrontManager:
     """Class to manage AWS CloudFront distributions."""
@@ -52,6 +145,7 @@ class CloudFrontManager:
         self.bucket_name = bucket_name
         self.distribution_id = distribution_id
         self.cf = boto3.client('cloudfront')
+        self.batcher = InvalidationBatcher(self.cf, distribution_id)
 
     def get_distribution(self):
         """Checks if the specified distribution ID exists and returns it."""
@@ -106,23 +200,13 @@ class CloudFrontManager:
             return new_distribution_id
         return self.distribution_id
 
-    def invalidate_cache(self):
-        """Invalidates CloudFront distribution cache if S3 content changes."""
+    def invalidate_cache(self, *paths):
+        """Invalidates the changed S3 keys (everything when none is given) on the distribution, batched per window."""
         if self.distribution_id:
-            try:
-                response = self.cf.create_invalidation(
-                    DistributionId=self.distribution_id,
-                    InvalidationBatch={
-                        'Paths': {
-                            'Quantity': 1,
-                            'Items': ['/*']
-                        },
-                        'CallerReference': str(time.time())  # Use timestamp as a unique reference
-                    }
-                )
-                logging.info("Cache invalidated for distribution ID: %s", self.distribution_id)
-            except Exception as e:
-                logging.error("Failed to invalidate cache. Error: %s", e)
+            self.batcher.add(*(paths or ('/*',)))
+
+    def flush_invalidations(self):
+        return self.batcher.flush()
 
 def main():
     input_file = 'input/video.mp4'
@@ -133,17 +217,25 @@ def main():
     # Replace with your actual ID or None if you want to create a new distribution
     #distribution_id = 'E3307LF0PMAAC5'
 
-    uploader = S3Uploader(bucket_name, output_dir)
     #cf_manager = CloudFrontManager(bucket_name, distribution_id)
+    # Only keys overwriting an earlier upload (mostly the playlists) can be stale on the edge
+    #uploader = S3Uploader(bucket_name, output_dir, on_replaced=cf_manager.invalidate_cache)
+    uploader = S3Uploader(bucket_name, output_dir)
 
-    converter.convert_to_hls()
-    uploader.upload_files()
+    # Segments are uploaded as soon as FFmpeg finalizes them, the playlists
+    # only at the end so they never reference a segment not uploaded yet
+    if converter.convert_to_hls(on_segment=uploader.submit):
+        failed = uploader.wait()
+        failed += uploader.upload_files(extensions=('.m3u8',))
+        if failed:
+            logging.error("Upload incomplete, %d files failed", len(failed))
+    uploader.shutdown()
 
     # This will check for existing ID or create a new one
     #cf_manager.create_distribution()
     
-    # Invalidate cache after ensuring distribution is set up
-    #cf_manager.invalidate_cache()
+    # Invalidate the replaced keys now instead of waiting for the batch window
+    #cf_manager.flush_invalidations()
     #print("Using CloudFront Distribution:", distribution_id)
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import posixpath
+import threading
+import time
+
+
+def coalesce_paths(paths, wildcard_threshold=20, max_total=3000):
+    """Reduces changed object paths to the cheapest set of invalidation paths.
+
+    CloudFront bills a wildcard like a single path, so the paths of one
+    directory are replaced by `<dir>/*` once there are at least
+    `wildcard_threshold` of them. Paths already covered by a wildcard are
+    dropped. If the result is still above `max_total`, the biggest
+    directories are collapsed first and, as the last resort, everything
+    becomes `/*`.
+    """
+    paths = {p if p.startswith('/') else '/' + p for p in paths}
+    if not paths:
+        return []
+    if '/*' in paths:
+        return ['/*']
+
+    wildcards = {p for p in paths if p.endswith('*')}
+    groups = {}
+    for path in paths - wildcards:
+        if any(path.startswith(w[:-1]) for w in wildcards):
+            continue
+        groups.setdefault(posixpath.dirname(path), set()).add(path)
+
+    for directory, members in list(groups.items()):
+        if len(members) >= wildcard_threshold:
+            wildcards.add(directory.rstrip('/') + '/*')
+            del groups[directory]
+
+    total = len(wildcards) + sum(len(members) for members in groups.values())
+    for directory in sorted(groups, key=lambda d: len(groups[d]), reverse=True):
+        if total <= max_total or len(groups[directory]) < 2:
+            break
+        total -= len(groups[directory]) - 1
+        wildcards.add(directory.rstrip('/') + '/*')
+        del groups[directory]
+    if total > max_total:
+        return ['/*']
+
+    return sorted(wildcards) + sorted(p for members in groups.values() for p in members)
+
+
+# CloudFront error codes worth another attempt, anything else is a bad request which fails the same way again
+RETRYABLE_ERROR_CODES = {'Throttling', 'TooManyInvalidationsInProgress', 'ServiceUnavailable', 'InternalError'}
+
+
+def is_retryable(error):
+    """Throttling and 5xx responses are retried, and so are errors without a response (connection, timeout)."""
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return True
+    code = response.get('Error', {}).get('Code')
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return code in RETRYABLE_ERROR_CODES or status >= 500
+
+
+class InvalidationBatcher:
+    """Collects changed paths and invalidates them together, once per window.
+
+    The first path added opens a window of `window_seconds`; every path
+    added meanwhile goes into the same invalidation, so a whole upload run
+    costs a single request instead of flushing the distribution per file.
+    `max_paths` is the per request limit, paths beyond it are sent in
+    additional requests. `max_in_progress` and `max_wildcards` are the
+    CloudFront limits of paths being invalidated at the same time, above them
+    directories are collapsed into wildcards.
+
+    A request failing with throttling or a 5xx is retried `retry_seconds`
+    later (also with window_seconds=0, where only flush() sends), up to
+    `max_attempts` times per path; paths are dropped and logged after their
+    last attempt or a non retryable error.
+    """
+    def __init__(self, cf_client, distribution_id, window_seconds=10, wildcard_threshold=20,
+                 max_paths=1000, max_in_progress=3000, max_wildcards=15, max_attempts=5, retry_seconds=10):
+        self.cf = cf_client
+        self.distribution_id = distribution_id
+        self.window_seconds = window_seconds
+        self.wildcard_threshold = wildcard_threshold
+        self.max_paths = max_paths
+        self.max_in_progress = max_in_progress
+        self.max_wildcards = max_wildcards
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.pending = set()
+        # path -> failed attempts so far, only for paths waiting for a retry
+        self.attempts = {}
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, *paths):
+        with self.lock:
+            self.pending.update(paths)
+            self._schedule(self.window_seconds)
+
+    def _schedule(self, delay):
+        if self.timer is None and delay > 0:
+            self.timer = threading.Timer(delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _retry(self, items, error):
+        """Puts the items of a failed request back, unless they are out of attempts."""
+        retry, dropped = [], []
+        with self.lock:
+            for path in items:
+                attempts = self.attempts.pop(path, 0) + 1
+                if is_retryable(error) and attempts < self.max_attempts:
+                    self.attempts[path] = attempts
+                    retry.append(path)
+                else:
+                    dropped.append(path)
+            self.pending.update(retry)
+            if retry:
+                self._schedule(self.window_seconds or self.retry_seconds)
+        if dropped:
+            logging.error("Giving up invalidating %d paths on distribution %s: %s",
+                          len(dropped), self.distribution_id, ', '.join(sorted(dropped)))
+
+    def batches(self, paths):
+        paths = coalesce_paths(paths, self.wildcard_threshold, self.max_in_progress)
+        wildcards = [p for p in paths if p.endswith('*')]
+        if len(wildcards) > self.max_wildcards:
+            # too many wildcards in progress get throttled, a single flush is cheaper
+            return [['/*']]
+        exact = [p for p in paths if not p.endswith('*')]
+        batches = []
+        current = list(wildcards)
+        for path in exact:
+            if len(current) == self.max_paths:
+                batches.append(current)
+                current = []
+            current.append(path)
+        if current:
+            batches.append(current)
+        return batches
+
+    def flush(self):
+        """Sends the pending paths now, returns the created invalidation ids."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            paths, self.pending = self.pending, set()
+        if not paths or not self.distribution_id:
+            return []
+
+        invalidation_ids = []
+        for items in self.batches(paths):
+            # unique per request: CloudFront ignores a reused reference, and a playlist
+            # replaced again must be invalidated again with the same paths
+            digest = hashlib.sha1('\n'.join(items).encode()).hexdigest()[:16]
+            try:
+                response = self.cf.create_invalidation(
+                    DistributionId=self.distribution_id,
+                    InvalidationBatch={
+                        'Paths': {'Quantity': len(items), 'Items': items},
+                        'CallerReference': f"{int(time.time())}-{digest}"
+                    }
+                )
+                invalidation_ids.append(response['Invalidation']['Id'])
+                logging.info("Invalidated %d paths on distribution %s", len(items), self.distribution_id)
+                with self.lock:
+                    for path in items:
+                        self.attempts.pop(path, None)
+            except Exception as e:
+                logging.error("Failed to invalidate %d paths. Error: %s", len(items), e)
+                self._retry(items, e)
+        return invalidation_ids
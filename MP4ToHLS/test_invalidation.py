@@ -0,0 +1,116 @@
+import logging
+
+import app
+from invalidation import InvalidationBatcher, coalesce_paths
+from uploader import S3Uploader
+
+
+class StubCloudFront:
+    """Stand-in for the boto3 CloudFront client, records the invalidation batches."""
+    def __init__(self, fail=0, error=None):
+        self.batches = []
+        self.fail = fail
+        self.error = error or ConnectionError("simulated connection reset")
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        if self.fail:
+            self.fail -= 1
+            raise self.error
+        paths = InvalidationBatch['Paths']
+        assert paths['Quantity'] == len(paths['Items'])
+        self.batches.append(paths['Items'])
+        return {'Invalidation': {'Id': f'I{len(self.batches)}'}}
+
+
+def test_paths_are_coalesced_per_directory():
+    paths = [f'/1920x1080/playlist_1920x1080_{i:05d}.ts' for i in range(25)]
+    paths += ['playlist.m3u8', '/playlist_1920x1080.m3u8', '/640x360/playlist_640x360_00001.ts']
+    assert coalesce_paths(paths, wildcard_threshold=20) == [
+        '/1920x1080/*',
+        '/640x360/playlist_640x360_00001.ts',
+        '/playlist.m3u8',
+        '/playlist_1920x1080.m3u8',
+    ]
+    assert coalesce_paths(['/1920x1080/*', '/1920x1080/a.ts', '/b.m3u8']) == ['/1920x1080/*', '/b.m3u8']
+    assert coalesce_paths(['/a/1', '/a/2', '/b/1'], max_total=2) == ['/a/*', '/b/1']
+    assert coalesce_paths(['/a/1', '/b/1', '/c/1'], max_total=2) == ['/*']
+
+
+def test_window_is_sent_as_one_request():
+    cf = StubCloudFront()
+    batcher = InvalidationBatcher(cf, 'E123', window_seconds=0)
+    batcher.add('/playlist.m3u8')
+    batcher.add('/playlist_1280x720.m3u8', '/playlist.m3u8')
+    assert batcher.flush() == ['I1']
+    assert cf.batches == [['/playlist.m3u8', '/playlist_1280x720.m3u8']]
+    assert batcher.flush() == []
+
+
+def test_request_limits_split_batches_and_failures_are_retried():
+    cf = StubCloudFront(fail=1)
+    batcher = InvalidationBatcher(cf, 'E123', window_seconds=0, wildcard_threshold=100, max_paths=3)
+    batcher.add(*[f'/{d}/index.m3u8' for d in 'abcde'])
+    assert batcher.flush() == ['I1']
+    assert len(cf.batches[0]) == 2
+
+    assert batcher.flush() == ['I2']
+    assert sorted(cf.batches[0] + cf.batches[1]) == [f'/{d}/index.m3u8' for d in 'abcde']
+
+
+class ClientError(Exception):
+    """Shaped like botocore's ClientError, which carries the parsed error response."""
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+def test_throttled_paths_are_retried_a_limited_number_of_times(caplog):
+    cf = StubCloudFront(fail=10, error=ClientError('Throttling', 400))
+    batcher = InvalidationBatcher(cf, 'E123', window_seconds=0, max_attempts=3, retry_seconds=60)
+    batcher.add('/playlist.m3u8')
+    assert batcher.flush() == []
+    # without a window the retry still gets its own timer
+    assert batcher.timer is not None and batcher.pending == {'/playlist.m3u8'}
+    assert batcher.flush() == []
+    with caplog.at_level(logging.ERROR):
+        assert batcher.flush() == []
+    assert batcher.pending == set() and batcher.timer is None and batcher.attempts == {}
+    assert "Giving up invalidating 1 paths" in caplog.text and '/playlist.m3u8' in caplog.text
+    assert cf.fail == 7
+
+
+def test_client_errors_are_not_retried():
+    cf = StubCloudFront(fail=1, error=ClientError('InvalidArgument', 400))
+    batcher = InvalidationBatcher(cf, 'E123', window_seconds=0)
+    batcher.add('/bad path')
+    assert batcher.flush() == []
+    assert batcher.pending == set() and batcher.timer is None
+
+    cf = StubCloudFront(fail=1, error=ClientError('ServiceUnavailable', 503))
+    batcher = InvalidationBatcher(cf, 'E123', window_seconds=0)
+    batcher.add('/playlist.m3u8')
+    assert batcher.flush() == []
+    assert batcher.flush() == ['I1'] and batcher.attempts == {}
+
+
+class StubS3:
+    def upload_file(self, Filename, Bucket, Key, Config=None):
+        pass
+
+
+def test_replaced_keys_are_batched_as_whole_paths(tmp_path, monkeypatch):
+    cf = StubCloudFront()
+    monkeypatch.setattr(app.boto3, 'client', lambda service: cf)
+    cf_manager = app.CloudFrontManager('bucket', 'E123')
+    playlist = tmp_path / 'playlist_1280x720.m3u8'
+    playlist.write_text('#EXTM3U\n')
+    uploader = S3Uploader('bucket', str(tmp_path), s3_client=StubS3(), on_replaced=cf_manager.invalidate_cache)
+    assert uploader.upload_file(str(playlist))
+    playlist.write_text('#EXTM3U\n#EXT-X-VERSION:3\n')
+    assert uploader.upload_file(str(playlist))
+    uploader.shutdown()
+    assert cf_manager.batcher.pending == {'/playlist_1280x720.m3u8'}
+
+    cf_manager.invalidate_cache()
+    assert cf_manager.flush_invalidations() == ['I1']
+    assert cf.batches == [['/*']]
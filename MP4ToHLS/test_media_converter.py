@@ -0,0 +1,111 @@
+import os
+
+import app
+from app import MediaConverter
+
+LADDER = [
+    ('1280x720', 1280, 720, 2800, 128),
+    ('640x360', 640, 360, 800, 96),
+]
+
+
+def option(command, name):
+    return command[command.index(name) + 1]
+
+
+def test_command_splits_the_decode_into_one_scaler_per_rung(tmp_path):
+    converter = MediaConverter('input.mp4', str(tmp_path), ladder=LADDER, segment_duration=4)
+    command = converter.build_command()
+
+    filters = option(command, '-filter_complex').split(';')
+    assert filters == ['[0:v]split=2[v0][v1]', '[v0]scale=w=1280:h=720[v0out]', '[v1]scale=w=640:h=360[v1out]']
+    assert command.count('-map') == 4 and command.count('a:0') == 2
+    assert option(command, '-var_stream_map') == 'v:0,a:0,name:1280x720 v:1,a:1,name:640x360'
+    assert option(command, '-b:v:1') == '800k' and option(command, '-b:a:0') == '128k'
+    # every rendition cuts at the same, forced keyframes
+    assert option(command, '-force_key_frames') == 'expr:gte(t,n_forced*4)'
+    assert option(command, '-sc_threshold') == '0' and option(command, '-hls_time') == '4'
+    assert option(command, '-master_pl_name') == 'playlist.m3u8'
+    assert command[-1] == os.path.join(str(tmp_path), 'playlist_%v.m3u8')
+    assert '-threads' not in command
+
+
+def test_command_without_audio_maps_video_only(tmp_path):
+    converter = MediaConverter('input.mp4', str(tmp_path), ladder=LADDER, threads=2)
+    command = converter.build_command(with_audio=False)
+
+    assert 'a:0' not in command and '-c:a:0' not in command
+    assert command.count('-map') == 2
+    assert option(command, '-var_stream_map') == 'v:0,name:1280x720 v:1,name:640x360'
+    assert option(command, '-threads') == '2'
+
+
+class FakeFFmpeg:
+    """Stand-in for the FFmpeg process, every poll runs the next step of the job."""
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.returncode = None
+
+    def poll(self):
+        if self.steps:
+            self.steps.pop(0)()
+            return None
+        self.returncode = 0
+        return self.returncode
+
+
+def test_segments_are_reported_once_after_the_playlist_lists_them(tmp_path, monkeypatch):
+    output = str(tmp_path)
+    converter = MediaConverter('input.mp4', output, ladder=LADDER, poll_interval=0)
+    monkeypatch.setattr(converter, 'probe', lambda: (12.0, True))
+    listed = {name: [] for name, *_ in LADDER}
+
+    def write_segment(name, index):
+        segment = os.path.join(name, f'playlist_{name}_{index:05d}.ts')
+        open(os.path.join(output, segment), 'wb').close()
+        return segment
+
+    def list_segment(name, segment):
+        # FFmpeg rewrites the whole event playlist after every segment
+        listed[name].append(segment)
+        with open(os.path.join(output, f'playlist_{name}.m3u8'), 'w') as playlist:
+            playlist.write('#EXTM3U\n#EXT-X-PLAYLIST-TYPE:EVENT\n')
+            playlist.writelines(f'#EXTINF:6.000000,\n{uri}\n' for uri in listed[name])
+
+    steps = [
+        lambda: write_segment('1280x720', 0),
+        lambda: list_segment('1280x720', '1280x720/playlist_1280x720_00000.ts'),
+        lambda: list_segment('640x360', write_segment('640x360', 0)),
+        lambda: write_segment('1280x720', 1),
+        lambda: None,
+        lambda: list_segment('1280x720', '1280x720/playlist_1280x720_00001.ts'),
+    ]
+    commands = []
+
+    def popen(command):
+        commands.append(command)
+        return FakeFFmpeg(steps)
+    monkeypatch.setattr(app.subprocess, 'Popen', popen)
+
+    reported = []
+    def on_segment(segment):
+        name = os.path.basename(os.path.dirname(segment))
+        assert os.path.relpath(segment, output) in listed[name]
+        reported.append(os.path.relpath(segment, output))
+
+    assert converter.convert_to_hls(on_segment=on_segment)
+    assert commands[0] == converter.build_command(True)
+    assert reported == ['1280x720/playlist_1280x720_00000.ts', '640x360/playlist_640x360_00000.ts',
+                        '1280x720/playlist_1280x720_00001.ts']
+    assert sorted(converter.finalized_segments()) == sorted(os.path.join(output, s) for s in reported)
+
+
+def test_failed_conversion_is_reported(tmp_path, monkeypatch):
+    converter = MediaConverter('input.mp4', str(tmp_path), ladder=LADDER, poll_interval=0)
+    monkeypatch.setattr(converter, 'probe', lambda: (None, False))
+    process = FakeFFmpeg([])
+    process.poll = lambda: setattr(process, 'returncode', 1) or 1
+    monkeypatch.setattr(app.subprocess, 'Popen', lambda command: process)
+
+    assert not converter.convert_to_hls()
+    assert converter.finalized_segments() == []
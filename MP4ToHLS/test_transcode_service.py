@@ -0,0 +1,75 @@
+import concurrent.futures
+import json
+import os
+
+from transcode_service import TranscodeService
+
+
+class RecordingPool:
+    """Stand-in for the process pool, the test completes the jobs itself."""
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, path, digest, *args):
+        future = concurrent.futures.Future()
+        self.jobs.append((path, digest, future))
+        return future
+
+    def finish(self, index, success=True):
+        path, digest, future = self.jobs[index]
+        future.set_result({'input': path, 'sha256': digest, 'job_id': digest[:16], 'success': success,
+                           'failed_uploads': 0, 'media_seconds': 10.0, 'wall_seconds': 2.0,
+                           'realtime_factor': 5.0, 'finished_at': 0})
+
+
+def make_service(tmp_path):
+    (tmp_path / 'input').mkdir(exist_ok=True)
+    return TranscodeService({'input_dir': str(tmp_path / 'input'), 'output_root': str(tmp_path / 'output'),
+                             'bucket_name': None, 'workers': 1,
+                             'report_file': str(tmp_path / 'job_report.jsonl')})
+
+
+def test_files_are_taken_once_their_size_stops_changing(tmp_path):
+    service = make_service(tmp_path)
+    pool = RecordingPool()
+    upload = tmp_path / 'input' / 'upload.mp4'
+    upload.write_bytes(b'a' * 100)
+    (tmp_path / 'input' / 'notes.txt').write_text('not a video')
+    # first sighting, the upload may still be running
+    service.schedule_ready(pool)
+    assert pool.jobs == []
+    with open(upload, 'ab') as partial:
+        partial.write(b'b' * 100)
+    service.schedule_ready(pool)
+    assert pool.jobs == []
+    # unchanged since the last poll, the upload finished
+    service.schedule_ready(pool)
+    assert [path for path, _, _ in pool.jobs] == [str(upload)]
+    service.schedule_ready(pool)
+    assert len(pool.jobs) == 1
+
+
+def test_identical_content_is_transcoded_once(tmp_path):
+    service = make_service(tmp_path)
+    pool = RecordingPool()
+    content = os.urandom(256)
+    (tmp_path / 'input' / 'first.mp4').write_bytes(content)
+    (tmp_path / 'input' / 'same_while_running.mp4').write_bytes(content)
+    service.schedule_ready(pool)
+    service.schedule_ready(pool)
+    # the copy is skipped while the first job is in flight
+    assert len(pool.jobs) == 1
+    pool.finish(0)
+    assert service.in_flight == set()
+
+    (tmp_path / 'input' / 'uploaded_again.mp4').write_bytes(content)
+    service.schedule_ready(pool)
+    service.schedule_ready(pool)
+    assert len(pool.jobs) == 1
+
+    # the report rebuilds the done set on restart
+    with open(tmp_path / 'job_report.jsonl') as report:
+        assert [json.loads(line)['success'] for line in report] == [True]
+    restarted = make_service(tmp_path)
+    assert restarted.done_hashes == service.done_hashes
+
@@ -0,0 +1,63 @@
+import os
+import threading
+
+from uploader import S3Uploader
+
+
+class LocalS3:
+    """Stand-in for the boto3 S3 client, keeps the objects in memory."""
+    def __init__(self, fail_keys=()):
+        self.objects = {}
+        self.calls = []
+        self.fail_keys = set(fail_keys)
+        self.lock = threading.Lock()
+
+    def upload_file(self, Filename, Bucket, Key, Config=None):
+        with self.lock:
+            self.calls.append(Key)
+            if Key in self.fail_keys:
+                self.fail_keys.discard(Key)
+                raise ConnectionError("simulated network failure")
+        with open(Filename, 'rb') as source:
+            self.objects[(Bucket, Key)] = source.read()
+
+
+def make_output(tmp_path):
+    output = tmp_path / 'output'
+    (output / '1920x1080').mkdir(parents=True)
+    (output / 'playlist.m3u8').write_text('#EXTM3U\n')
+    (output / 'playlist_1920x1080.m3u8').write_text('#EXTM3U\n')
+    for i in range(5):
+        (output / '1920x1080' / f'playlist_1920x1080_{i:05d}.ts').write_bytes(os.urandom(64))
+    (output / 'notes.txt').write_text('not uploaded')
+    return output
+
+
+def test_upload_keeps_rendition_keys(tmp_path):
+    output = make_output(tmp_path)
+    s3 = LocalS3()
+    uploader = S3Uploader('bucket', str(output), max_workers=4, s3_client=s3)
+    assert uploader.upload_files() == []
+    uploader.shutdown()
+
+    keys = {key for _, key in s3.objects}
+    assert 'playlist.m3u8' in keys
+    assert '1920x1080/playlist_1920x1080_00003.ts' in keys
+    assert len(keys) == 7
+
+
+def test_rerun_only_uploads_what_failed(tmp_path):
+    output = make_output(tmp_path)
+    failing_key = '1920x1080/playlist_1920x1080_00002.ts'
+    s3 = LocalS3(fail_keys=[failing_key])
+
+    uploader = S3Uploader('bucket', str(output), max_workers=4, s3_client=s3)
+    failed = uploader.upload_files()
+    uploader.shutdown()
+    assert failed == [str(output / failing_key)]
+
+    s3.calls.clear()
+    uploader = S3Uploader('bucket', str(output), max_workers=4, s3_client=s3)
+    assert uploader.upload_files() == []
+    uploader.shutdown()
+    assert s3.calls == [failing_key]
@@ -0,0 +1,175 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from app import MediaConverter
+from uploader import S3Uploader
+
+'''
+    Long running transcoding service
+
+    Watches `input_dir` for *.mp4 uploads and schedules every new file on a
+    process pool sized to the CPU cores, so there is no process start up per
+    file. A file is taken only once its size stopped changing between two
+    polls (the upload finished). Files are identified by the sha256 of their
+    content, already transcoded content is skipped even if it is uploaded
+    again under another name. Every job reports its realtime factor (media
+    seconds transcoded per wall clock second) into `report_file` for capacity
+    planning.
+'''
+
+
+def load_config(config_path='config.json'):
+    try:
+        with open(config_path) as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        logging.error(f"Config file not found: {config_path}")
+        raise
+    except json.JSONDecodeError:
+        logging.error(f"Error decoding JSON from config file: {config_path}")
+        raise
+
+
+def content_hash(file_path, chunk_size=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_job(input_path, digest, output_root, bucket_name, threads):
+    '''Runs in a pool process: transcode the ladder, upload it and report the timings'''
+    job_id = digest[:16]
+    output_dir = os.path.join(output_root, job_id)
+    started = time.monotonic()
+
+    converter = MediaConverter(input_path, output_dir, threads=threads)
+    uploader = S3Uploader(bucket_name, output_dir, key_prefix=f"{job_id}/") if bucket_name else None
+    try:
+        converted = converter.convert_to_hls(on_segment=uploader.submit if uploader else None)
+        failed = []
+        if uploader:
+            failed = uploader.wait()
+            if converted:
+                failed += uploader.upload_files(extensions=('.m3u8',))
+    finally:
+        if uploader:
+            uploader.shutdown()
+
+    wall_seconds = time.monotonic() - started
+    media_seconds = converter.duration
+    return {
+        'input': input_path,
+        'sha256': digest,
+        'job_id': job_id,
+        'success': converted and not failed,
+        'failed_uploads': len(failed),
+        'media_seconds': media_seconds,
+        'wall_seconds': round(wall_seconds, 3),
+        'realtime_factor': round(media_seconds / wall_seconds, 3) if media_seconds and wall_seconds else None,
+        'finished_at': time.time(),
+    }
+
+
+class TranscodeService:
+    def __init__(self, config):
+        self.input_dir = config['input_dir']
+        self.output_root = config['output_root']
+        self.bucket_name = config.get('bucket_name')
+        self.poll_interval = config.get('poll_interval_seconds', 5)
+        self.workers = config.get('workers') or os.cpu_count() or 1
+        # FFmpeg threads per job, so the pool does not oversubscribe the cores
+        self.threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.report_file = config.get('report_file', 'job_report.jsonl')
+
+        # sha256 of every content already transcoded successfully, rebuilt from the report
+        self.done_hashes = set()
+        if os.path.exists(self.report_file):
+            with open(self.report_file) as report:
+                for line in report:
+                    try:
+                        job = json.loads(line)
+                    except ValueError:
+                        continue
+                    if job.get('success'):
+                        self.done_hashes.add(job['sha256'])
+
+        self.in_flight = set()
+        # path -> (size, mtime_ns) of the last poll, a file is ready when it stops changing
+        self.last_seen = {}
+        # paths already hashed, with the (size, mtime_ns) they had
+        self.known = {}
+        self.lock = threading.Lock()
+
+    def ready_files(self):
+        ready = []
+        current = {}
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith('.mp4'):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                current[entry.path] = signature
+                if self.last_seen.get(entry.path) == signature and self.known.get(entry.path) != signature:
+                    ready.append((entry.path, signature))
+        self.last_seen = current
+        return ready
+
+    def record(self, future, digest):
+        with self.lock:
+            self.in_flight.discard(digest)
+        try:
+            job = future.result()
+        except Exception as e:
+            logging.error("Transcode job %s crashed. Error: %s", digest[:16], e)
+            return
+        if job['success']:
+            with self.lock:
+                self.done_hashes.add(digest)
+        logging.info("Job %s (%s) finished: success=%s, %.1fs media in %.1fs wall, realtime factor %s",
+                     job['job_id'], job['input'], job['success'], job['media_seconds'] or 0,
+                     job['wall_seconds'], job['realtime_factor'])
+        with self.lock, open(self.report_file, 'a') as report:
+            report.write(json.dumps(job) + '\n')
+
+    def schedule_ready(self, pool):
+        for path, signature in self.ready_files():
+            self.known[path] = signature
+            digest = content_hash(path)
+            with self.lock:
+                if digest in self.done_hashes or digest in self.in_flight:
+                    logging.info("Skipping %s, content already transcoded", path)
+                    continue
+                self.in_flight.add(digest)
+            logging.info("Scheduling %s as job %s", path, digest[:16])
+            future = pool.submit(run_job, path, digest, self.output_root,
+                                 self.bucket_name, self.threads)
+            future.add_done_callback(lambda f, digest=digest: self.record(f, digest))
+
+    def run(self):
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(self.output_root, exist_ok=True)
+        logging.info("Transcode service watching %s with %d workers", self.input_dir, self.workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                try:
+                    self.schedule_ready(pool)
+                except Exception as e:
+                    logging.error("Error while polling %s: %s", self.input_dir, e)
+                time.sleep(self.poll_interval)
+
+
+def main():
+    config = load_config()
+    TranscodeService(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import concurrent.futures
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+
+class UploadManifest:
+    """Local record of the keys already uploaded, so a rerun skips them.
+
+    Stored as JSON lines (one {"key", "size", "mtime_ns", "md5"} per completed
+    upload) in append mode, so a crash loses at most the line being written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as manifest:
+                for line in manifest:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+                    except (ValueError, KeyError):
+                        # a torn last line from an interrupted run
+                        continue
+        self.file = open(path, 'a')
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def record(self, key, size, mtime_ns, md5):
+        entry = {'key': key, 'size': size, 'mtime_ns': mtime_ns, 'md5': md5}
+        with self.lock:
+            self.entries[key] = entry
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def file_md5(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class S3Uploader:
+    """Concurrent, resumable uploader for the HLS output directory.
+
+    One boto3 client (thread safe, connection pool sized to the workers) is
+    shared by a bounded pool of upload workers. Files above the multipart
+    threshold are uploaded in parallel parts by the S3 transfer manager.
+    Every completed upload is written to the UploadManifest with its md5, and
+    unchanged files found there are skipped on the next run.
+    """
+    def __init__(self, bucket_name, source_dir, max_workers=16, manifest_path=None, s3_client=None,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, key_prefix='',
+                 on_replaced=None):
+        self.bucket_name = bucket_name
+        self.source_dir = source_dir
+        self.key_prefix = key_prefix
+        # called with the key of every upload which overwrote an earlier one, e.g. to invalidate the CDN
+        self.on_replaced = on_replaced
+        self.s3 = s3_client or boto3.client('s3', config=Config(
+            max_pool_connections=max_workers * 2,
+            retries={'max_attempts': 10, 'mode': 'adaptive'}))
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=4)
+        manifest_path = manifest_path or os.path.join(source_dir, '.upload_manifest.jsonl')
+        os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+        self.manifest = UploadManifest(manifest_path)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def key_for(self, file_path):
+        """The S3 key keeps the rendition sub directory, the master playlist refers to it."""
+        return self.key_prefix + os.path.relpath(file_path, self.source_dir).replace(os.sep, '/')
+
+    def upload_file(self, file_path):
+        """Uploads a single file unless the manifest has it unchanged. Returns True on success."""
+        key = self.key_for(file_path)
+        try:
+            stat = os.stat(file_path)
+            done = self.manifest.get(key)
+            if done and done['size'] == stat.st_size and done['mtime_ns'] == stat.st_mtime_ns:
+                logging.debug("Skipping %s, already uploaded", key)
+                return True
+            md5 = file_md5(file_path)
+            if done and done['md5'] == md5:
+                logging.debug("Skipping %s, content already uploaded", key)
+                return True
+
+            self.s3.upload_file(file_path, self.bucket_name, key, Config=self.transfer_config)
+            self.manifest.record(key, stat.st_size, stat.st_mtime_ns, md5)
+            if done and self.on_replaced:
+                self.on_replaced('/' + key)
+            logging.info("Uploaded %s to %s/%s", file_path, self.bucket_name, key)
+            return True
+        except Exception as e:
+            logging.error("Failed to upload %s. Error: %s", file_path, e)
+            return False
+
+    def submit(self, file_path):
+        """Queues a file on the worker pool, used to ship segments while the transcode runs."""
+        future = self.executor.submit(self.upload_file, file_path)
+        with self.lock:
+            self.pending[future] = file_path
+        return future
+
+    def wait(self):
+        """Waits for every queued upload and returns the paths which failed."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        failed = []
+        for future in concurrent.futures.as_completed(pending):
+            if not future.result():
+                failed.append(pending[future])
+        if failed:
+            logging.error("%d uploads failed, rerun to retry only those", len(failed))
+        return failed
+
+    def upload_files(self, extensions=('.m3u8', '.ts')):
+        """Uploads files from a directory to an S3 bucket concurrently, returns the failed paths."""
+        for root, _, files in os.walk(self.source_dir):
+            for file in files:
+                if file.endswith(extensions):
+                    self.submit(os.path.join(root, file))
+        return self.wait()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.manifest.close()
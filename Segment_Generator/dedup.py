@@ -0,0 +1,43 @@
+import logging
+from collections import deque
+from threading import Lock
+
+
+class SlidingWindowDedup:
+    """Remembers the last `window_size` media sequence numbers seen per rendition.
+
+    Live media sequence numbers only move forward, so a segment which fell
+    out of the window will never be offered again: the oldest entry is
+    evicted from the deque in O(1) and memory stays bounded on a 24/7 stream.
+    """
+
+    def __init__(self, window_size=256):
+        logging.debug(f"Initializing SlidingWindowDedup with window_size={window_size}")
+        self.window_size = window_size
+        self.windows = {}
+        self.lock = Lock()
+
+    def add(self, rendition, media_sequence):
+        """Returns True if (rendition, media_sequence) is new and records it."""
+        with self.lock:
+            window = self.windows.get(rendition)
+            if window is None:
+                window = self.windows[rendition] = (deque(), set())
+            order, seen = window
+            if media_sequence in seen:
+                return False
+            order.append(media_sequence)
+            seen.add(media_sequence)
+            if len(order) > self.window_size:
+                seen.discard(order.popleft())
+            return True
+
+    def discard(self, rendition, media_sequence):
+        """Forgets a sequence, e.g. after a failed download so it is retried."""
+        with self.lock:
+            window = self.windows.get(rendition)
+            if window and media_sequence in window[1]:
+                # out of the deque too, or a re-add would leave two entries and
+                # evicting the stale one would drop the live sequence from the set
+                window[0].remove(media_sequence)
+                window[1].discard(media_sequence)
@@ -1,6 +1,9 @@
+import re
 import requests
 import logging
 
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
 class HLSFetcher:
     def __init__(self, url):
         self.url = url
@@ -22,21 +25,27 @@ class HLSFetcher:
             raise
 
     def parse_m3u8(self):
+        '''Returns every variant of the master playlist as (resolution, bandwidth kbps, average bandwidth kbps or None)'''
         logging.debug(f"Parsing m3u8 file from URL: {self.url}")
         try:
             response = requests.get(self.url)
             response.raise_for_status()
-            lines = response.text.splitlines()
-            for line in lines:
-                if line.startswith("#EXT-X-STREAM-INF"):
-                    info = line.split(":")[1]
-                    parts = info.split(",")
-                    bandwidth = [p for p in parts if p.startswith("BANDWIDTH")][0].split("=")[1]
-                    resolution = [p for p in parts if p.startswith("RESOLUTION")][0].split("=")[1]
-                    return resolution, int(bandwidth) // 1000  # Convert bitrate to kbps
         except requests.RequestException as e:
             logging.error(f"Error parsing m3u8 file: {e}", exc_info=True)
             raise
 
-        logging.error("Failed to parse resolution and bitrate from m3u8 file")
-        return None, None
+        variants = []
+        for line in response.text.splitlines():
+            if line.startswith("#EXT-X-STREAM-INF"):
+                # CODECS="avc1.64001f,mp4a.40.2" holds a comma, so attributes are not split on ","
+                attributes = dict(ATTRIBUTE_PATTERN.findall(line.split(":", 1)[1]))
+                if "BANDWIDTH" not in attributes or "RESOLUTION" not in attributes:
+                    logging.warning(f"Variant without BANDWIDTH or RESOLUTION skipped: {line}")
+                    continue
+                average = attributes.get("AVERAGE-BANDWIDTH")
+                variants.append((attributes["RESOLUTION"], int(attributes["BANDWIDTH"]) // 1000,  # Convert bitrate to kbps
+                    int(average) // 1000 if average else None))
+
+        if not variants:
+            logging.error("Failed to parse resolution and bitrate from m3u8 file")
+        return variants
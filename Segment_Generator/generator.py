@@ -7,6 +7,8 @@ import time
 import concurrent.futures
 import json
 
+from dedup import SlidingWindowDedup
+
 # Load configuration
 with open('config.json', 'r') as config_file:
     config = json.load(config_file)
@@ -17,8 +19,13 @@ class SegmentGenerator:
         self.input_url = input_url
         self.output_path = output_path
         self.poll_interval = poll_interval
-        self.segments_downloaded = set()
-        self.subtitles_downloaded = set()
+        # Bounded (rendition, media sequence) windows instead of ever growing sets of urls
+        self.segments_downloaded = SlidingWindowDedup(config.get("dedup_window", 256))
+        self.subtitles_downloaded = SlidingWindowDedup(config.get("dedup_window", 256))
+        # Playlists and segments run on separate pools: a playlist task waits for its
+        # segments, so sharing one pool could fill it with waiters and starve the segments
+        self.manifest_workers = config.get("manifest_workers", 10)
+        self.segment_workers = config.get("segment_workers", 10)
 
         # Extract domain name from URL to use as the root directory name
         self.domain_name = urlparse(input_url).netloc
@@ -27,14 +34,16 @@ class SegmentGenerator:
 
     def generate_segments(self):
         logging.info("Starting the generation of segments.")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.manifest_workers) as manifest_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.segment_workers) as segment_executor:
             while True:
                 try:
                     # Download and process master playlist
                     master_playlist_content = self._download_file(self.input_url)
                     master_playlist_path = os.path.join(self.root_dir, "playlist.m3u8")
                     self._save_content_to_file(master_playlist_content, master_playlist_path)
-                    futures = self._process_master_playlist(master_playlist_content, self.root_dir, executor)
+                    futures = self._process_master_playlist(master_playlist_content, self.root_dir,
+                        manifest_executor, segment_executor)
 
                     # Wait for all futures to complete with a timeout
                     concurrent.futures.wait(futures, return_when=concurrent.futures.ALL_COMPLETED, timeout=300)
@@ -64,7 +73,7 @@ class SegmentGenerator:
             logging.error(f"Error saving content to file: {file_path} - {e}", exc_info=True)
             raise
 
-    def _process_master_playlist(self, content, output_dir, executor):
+    def _process_master_playlist(self, content, output_dir, manifest_executor, segment_executor):
         logging.debug("Processing master playlist.")
         lines = content.splitlines()
         futures = []
@@ -79,7 +88,7 @@ class SegmentGenerator:
                             playlist_url = lines[next_line_index]
                             full_playlist_url = urljoin(self.input_url, playlist_url)
                             logging.debug(f"Found playlist URL: {full_playlist_url}")
-                            future = executor.submit(self._download_playlist_and_segments, full_playlist_url, output_dir, resolution, bandwidth, executor)
+                            future = manifest_executor.submit(self._download_playlist_and_segments, full_playlist_url, output_dir, resolution, bandwidth, segment_executor)
                             futures.append(future)
                 elif line.startswith("#EXT-X-MEDIA") and "TYPE=SUBTITLES" in line:
                     subtitle_url = self._extract_attribute(line, "URI")
@@ -87,7 +96,7 @@ class SegmentGenerator:
                     if subtitle_url and language:
                         full_subtitle_url = urljoin(self.input_url, subtitle_url)
                         logging.debug(f"Found subtitle URL: {full_subtitle_url} for language: {language}")
-                        future = executor.submit(self._download_subtitle_playlist, full_subtitle_url, output_dir, language, executor)
+                        future = manifest_executor.submit(self._download_subtitle_playlist, full_subtitle_url, output_dir, language, segment_executor)
                         futures.append(future)
             except Exception as e:
                 logging.error(f"Error processing master playlist line: {line} - {e}", exc_info=True)
@@ -101,27 +110,50 @@ class SegmentGenerator:
         logging.warning(f"Attribute {attribute} not found in line: {line}")
         return None
 
+    def _media_sequence_of(self, lines):
+        for line in lines:
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                return int(line.split(":")[1])
+        # The spec default when the tag is missing
+        return 0
+
+    def _submit_segment(self, executor, dedup, rendition, media_sequence, url, file_path):
+        if not dedup.add(rendition, media_sequence):
+            return None
+        future = executor.submit(self._download_file_to_disk, url, file_path)
+
+        def forget_failed(done):
+            # a failed download is forgotten, so the next poll retries it
+            if done.exception() is not None or not done.result():
+                dedup.discard(rendition, media_sequence)
+        future.add_done_callback(forget_failed)
+        return future
+
     def _download_playlist_and_segments(self, playlist_url, output_dir, resolution, bandwidth, executor):
         try:
             logging.debug(f"Downloading playlist and segments for resolution={resolution}, bandwidth={bandwidth}")
             playlist_content = self._download_file(playlist_url)
             segment_lines = playlist_content.splitlines()
             
-            segment_dir = os.path.join(output_dir, f"{resolution}_{bandwidth}")
+            # renditions may share a resolution, the directory name is the dedup key
+            rendition = f"{resolution}_{bandwidth}"
+            segment_dir = os.path.join(output_dir, rendition)
             os.makedirs(segment_dir, exist_ok=True)
             
             playlist_filename = os.path.join(segment_dir, f"playlist_{resolution}.m3u8")
             self._save_content_to_file(playlist_content, playlist_filename)
             
             futures = []
+            media_sequence = self._media_sequence_of(segment_lines)
             for line in segment_lines:
-                if not line.startswith("#"):
+                if line and not line.startswith("#"):
                     segment_url = urljoin(playlist_url, line)
-                    if segment_url not in self.segments_downloaded:
-                        segment_filename = os.path.join(segment_dir, f"{os.path.basename(line)}")
-                        future = executor.submit(self._download_file_to_disk, segment_url, segment_filename)
+                    segment_filename = os.path.join(segment_dir, f"{os.path.basename(line)}")
+                    future = self._submit_segment(executor, self.segments_downloaded,
+                        rendition, media_sequence, segment_url, segment_filename)
+                    if future:
                         futures.append(future)
-                        self.segments_downloaded.add(segment_url)
+                    media_sequence += 1
             concurrent.futures.wait(futures, return_when=concurrent.futures.ALL_COMPLETED, timeout=300)
         except Exception as e:
             logging.error(f"Error downloading playlist and segments from URL: {playlist_url} - {e}", exc_info=True)
@@ -139,14 +171,16 @@ class SegmentGenerator:
             self._save_content_to_file(subtitle_content, playlist_filename)
 
             futures = []
+            media_sequence = self._media_sequence_of(subtitle_lines)
             for line in subtitle_lines:
-                if not line.startswith("#"):
+                if line and not line.startswith("#"):
                     subtitle_segment_url = urljoin(subtitle_url, line)
-                    if subtitle_segment_url not in self.subtitles_downloaded:
-                        subtitle_segment_filename = os.path.join(subtitle_dir, f"{os.path.basename(line)}")
-                        future = executor.submit(self._download_file_to_disk, subtitle_segment_url, subtitle_segment_filename)
+                    subtitle_segment_filename = os.path.join(subtitle_dir, f"{os.path.basename(line)}")
+                    future = self._submit_segment(executor, self.subtitles_downloaded,
+                        language, media_sequence, subtitle_segment_url, subtitle_segment_filename)
+                    if future:
                         futures.append(future)
-                        self.subtitles_downloaded.add(subtitle_segment_url)
+                    media_sequence += 1
             concurrent.futures.wait(futures, return_when=concurrent.futures.ALL_COMPLETED, timeout=300)
         except Exception as e:
             logging.error(f"Error downloading subtitle playlist from URL: {subtitle_url} - {e}", exc_info=True)
@@ -161,6 +195,8 @@ class SegmentGenerator:
                     if chunk:
                         f.write(chunk)
             logging.info(f"Successfully downloaded segment to {file_path}")
+            return True
         except requests.RequestException as e:
             logging.error(f"Error downloading segment from URL: {url} - {e}", exc_info=True)
             # Do not raise the error, allowing the thread to continue with other tasks.
+            return False
@@ -18,9 +18,11 @@ class MainService:
             fetcher = HLSFetcher(self.hls_url)
             logging.debug("Calling fetch method on HLSFetcher.")
             final_url = fetcher.fetch()
-            resolution, bitrate = fetcher.parse_m3u8()
+            variants = fetcher.parse_m3u8()
 
-            if resolution and bitrate:
+            if variants:
+                for resolution, bitrate, average_bitrate in variants:
+                    logging.info(f"Variant {resolution}: {bitrate} kbps peak, {average_bitrate or '-'} kbps average")
                 generator = SegmentGenerator(final_url, self.output_path)
                 logging.debug("Calling generate_segments method on SegmentGenerator.")
                 generator.generate_segments()
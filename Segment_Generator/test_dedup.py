@@ -0,0 +1,38 @@
+import concurrent.futures
+
+from dedup import SlidingWindowDedup
+from generator import SegmentGenerator
+
+PLAYLIST = "#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:40\n#EXTINF:6.0,\nseg_40.ts\n#EXTINF:6.0,\nseg_41.ts\n"
+
+
+def test_discard_then_re_add_keeps_the_window_consistent():
+    dedup = SlidingWindowDedup(window_size=3)
+    for media_sequence in (1, 2, 3):
+        assert dedup.add("1280x720_3000000", media_sequence)
+    # a failed download is forgotten and retried by the next poll
+    dedup.discard("1280x720_3000000", 2)
+    assert dedup.add("1280x720_3000000", 2)
+    order, seen = dedup.windows["1280x720_3000000"]
+    assert list(order) == [1, 3, 2] and seen == {1, 2, 3}
+    # evicting past the window must not drop the retried sequence
+    assert dedup.add("1280x720_3000000", 4)
+    assert dedup.add("1280x720_3000000", 5)
+    assert not dedup.add("1280x720_3000000", 2)
+    # discarding an unknown sequence is a no-op
+    dedup.discard("1280x720_3000000", 99)
+    dedup.discard("640x360_800000", 1)
+
+
+def test_renditions_sharing_a_resolution_are_deduplicated_apart(tmp_path, monkeypatch):
+    generator = SegmentGenerator("https://example.com/playlist.m3u8", str(tmp_path))
+    downloaded = []
+    monkeypatch.setattr(generator, "_download_file", lambda url, timeout=10: PLAYLIST)
+    monkeypatch.setattr(generator, "_download_file_to_disk",
+                        lambda url, file_path, timeout=10: downloaded.append(file_path) or True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        for bandwidth in ("3000000", "1500000"):
+            generator._download_playlist_and_segments("https://example.com/720p.m3u8", str(tmp_path),
+                                                      "1280x720", bandwidth, executor)
+    assert len(downloaded) == 4
+    assert {path.split("/")[-2] for path in downloaded} == {"1280x720_3000000", "1280x720_1500000"}